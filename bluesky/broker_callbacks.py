@@ -1,39 +1,66 @@
+import threading
 from dataportal import DataBroker as db
 import filestore
-import filestore.api as fsapi
 from metadatastore.commands import find_event_descriptors, find_run_starts
 import matplotlib.pyplot as plt
 from xray_vision.backend.mpl.cross_section_2d import CrossSection
-from .callbacks import CallbackBase
+from .callbacks import CallbackBase, get_retrieval_service
 
 
 class LiveImage(CallbackBase):
     """
     Stream 2D images in a cross-section viewer.
 
+    Images are read in the background as soon as their Events arrive. If
+    images arrive faster than they can be drawn, the viewer skips ahead to
+    the most recent one.
+
     Parameters
     ----------
     field : string
         name of data field in an Event
+    retrieval : RetrievalService, optional
+        used to read the images; by default, the service shared by all
+        callbacks
 
     Note
     ----
     Requires a matplotlib fix that is not released as of this writing. The
     relevant commit is a951b7.
     """
-    def __init__(self, field):
+    def __init__(self, field, retrieval=None):
         super().__init__()
         self.field = field
+        if retrieval is None:
+            retrieval = get_retrieval_service()
+        self.retrieval = retrieval
+        self._latest_uid = None  # most recent frame received
+        self._shown_uid = None  # most recent frame drawn
+        self._draw_lock = threading.Lock()
         fig = plt.figure()
         self.cs = CrossSection(fig)
         self.cs._fig.show()
 
     def event(self, doc):
         uid = doc['data'][self.field]
-        data = fsapi.retrieve(uid)
-        self.cs.update_image(data)
-        self.cs._fig.canvas.draw()
-        self.cs._fig.canvas.flush_events()
+        self._latest_uid = uid
+        self.retrieval.prefetch(uid)
+        while self._shown_uid != self._latest_uid:
+            if not self._draw_lock.acquire(blocking=False):
+                # Another thread is drawing; it will pick up this frame.
+                return
+            try:
+                uid = self._latest_uid
+                data = self.retrieval.retrieve(uid)
+                if uid != self._latest_uid:
+                    # A newer frame arrived while this one was being read.
+                    continue
+                self.cs.update_image(data)
+                self.cs._fig.canvas.draw()
+                self.cs._fig.canvas.flush_events()
+                self._shown_uid = uid
+            finally:
+                self._draw_lock.release()
 
 
 def post_run(callback):
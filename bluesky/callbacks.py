@@ -2,10 +2,14 @@
 Useful callbacks for the Run Engine
 """
 import sys
+import time as ttime
 from itertools import count
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import asyncio
 import warnings
-from prettytable import PrettyTable
+from lmfit.models import GaussianModel, LinearModel
 
 import matplotlib.backends.backend_qt5
 from matplotlib.backends.backend_qt5 import _create_qApp
@@ -23,26 +27,118 @@ qApp = matplotlib.backends.backend_qt5.qApp
 
 from matplotlib._pylab_helpers import Gcf
 
-try:
-    _draw_all = Gcf.draw_all  # mpl version >= 1.5
-except AttributeError:
-    # slower, but backward-compatible
-    def _draw_all():
-        for f_mgr in Gcf.get_all_fig_managers():
+
+def _draw_stale():
+    """
+    Redraw only the figures that have changed since they were last drawn.
+
+    Returns True if any figure was known to need drawing.
+    """
+    drew = False
+    for f_mgr in Gcf.get_all_fig_managers():
+        stale = getattr(f_mgr.canvas.figure, 'stale', None)
+        if stale is None:
+            # mpl version < 1.5 does not track changes; draw it anyway
+            f_mgr.canvas.draw_idle()
+        elif stale:
             f_mgr.canvas.draw_idle()
+            drew = True
+    return drew
 
 
-def _qt_kicker():
-    # The RunEngine Event Loop interferes with the qt event loop. Here we
-    # kick it to keep it going.
-    _draw_all()
+def _service_qt():
+    """
+    Redraw stale figures and process any pending Qt events.
+
+    Returns True if there was something to draw.
+    """
+    busy = _draw_stale()
+    qApp.processEvents()  # returns at once if no events are pending
+    return busy
+
 
-    qApp.processEvents()
-    loop.call_later(0.1, _qt_kicker)
+class QtKicker:
+    """
+    Service Qt from the asyncio event loop, but only while figures change.
+
+    The RunEngine Event Loop interferes with the qt event loop, so Qt has to
+    be serviced from the asyncio loop. Nothing is scheduled while there is
+    nothing to draw: code that changes a figure calls ``wake`` (from any
+    thread), which services Qt at once and then every ``min_interval`` for
+    as long as figures keep changing. Once they stop, the kicker checks back
+    less and less often and, when the interval reaches ``max_interval``, goes
+    back to sleep until the next ``wake``. Window events that arrive while it
+    sleeps (e.g., resizing a figure between updates) are handled at the next
+    ``wake``.
+
+    Parameters
+    ----------
+    loop : asyncio.BaseEventLoop
+    min_interval : float, optional
+        seconds between checks while figures are changing; 0.01 by default
+    max_interval : float, optional
+        the longest wait, in seconds, for a figure to change before going
+        back to sleep; 0.1 by default
+    service : callable, optional
+        Services Qt and returns True if there was something to draw. By
+        default, redraw stale figures and process pending Qt events.
+    """
+    def __init__(self, loop, min_interval=0.01, max_interval=0.1,
+                 service=None):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval.")
+        if service is None:
+            service = _service_qt
+        self._loop = loop
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._service = service
+        self._interval = min_interval
+        self._handle = None
+        self._enabled = False
+
+    @property
+    def sleeping(self):
+        "True if no kick is scheduled"
+        return self._handle is None
+
+    def start(self):
+        "Respond to ``wake``. Nothing is scheduled until the first one."
+        self._enabled = True
+
+    def stop(self):
+        self._enabled = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def wake(self):
+        "Service Qt as soon as possible. This is safe to call from any thread."
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self._enabled:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+        self._interval = self.min_interval
+        self._kick()
+
+    def _kick(self):
+        self._handle = None
+        if self._service():
+            self._interval = self.min_interval
+        elif self._interval >= self.max_interval:
+            # Nothing has changed for a while. Sleep until woken.
+            return
+        else:
+            self._interval = min(2 * self._interval, self.max_interval)
+        self._handle = self._loop.call_later(self._interval, self._kick)
 
 
 loop = asyncio.get_event_loop()
-loop.call_soon(_qt_kicker)
+qt_kicker = QtKicker(loop)
+qt_kicker.start()
 
 
 class CallbackBase(object):
@@ -132,6 +228,28 @@ class LivePlot(CallbackBase):
         passed to Axes.set_xlim
     ylim : tuple
         passed to Axes.set_ylim
+    max_fps : float, optional
+        If given, redraw at most this many times per second. Events that
+        arrive between frames are buffered and drawn together with the next
+        frame; only the line is redrawn (blitted) unless new data falls
+        outside the current axes limits. By default, redraw the whole figure
+        on every Event.
+    max_points : int, optional
+        If given, plot a min/max decimated view of the data with at most
+        this many points, however long the run. The view is updated
+        incrementally as Events arrive. By default, plot every point.
+    keep_full_data : bool, optional
+        Only relevant if ``max_points`` is given. If True, also retain every
+        point in ``x_data`` and ``y_data``. False by default, so that memory
+        use stays bounded during long runs.
+
+    Attributes
+    ----------
+    x_data, y_data : numpy.ndarray
+        the data received during the current run. Either may be assigned
+        (e.g., to clear the plot partway through a run); later Events are
+        appended to the new data, and the decimated view, if any, is
+        rebuilt from it.
     All additional keyword arguments are passed through to ``Axes.plot``.
 
     Returns
@@ -143,8 +261,19 @@ class LivePlot(CallbackBase):
     --------
     >>> my_plotter = LivePlot('det', 'motor', legend_keys=['sample'])
     >>> RE(my_scan, my_plotter)
+
+    Keep up with a fast scan by drawing no more than 10 frames per second.
+
+    >>> RE(my_scan, LivePlot('det', 'motor', max_fps=10))
+
+    Follow a long fly scan with a bounded number of plotted points.
+
+    >>> RE(my_fly_scan, LivePlot('det', 'motor', max_fps=10, max_points=2000))
     """
+    _INITIAL_BUFFER_SIZE = 1024  # points; the buffers double when full
+
     def __init__(self, y, x=None, legend_keys=None, xlim=None, ylim=None,
+                 max_fps=None, max_points=None, keep_full_data=False,
                  **kwargs):
         super().__init__()
         fig, ax = plt.gcf(), plt.gca()
@@ -165,17 +294,70 @@ class LivePlot(CallbackBase):
         if ylim is not None:
             self.ax.set_ylim(*ylim)
         self.ax.margins(.1)
+        if max_fps is not None and max_fps <= 0:
+            raise ValueError("max_fps must be positive")
+        self.max_fps = max_fps
+        self.max_points = max_points
+        self.keep_full_data = keep_full_data or max_points is None
         self.kwargs = kwargs
+        # Events may arrive on several dispatcher threads at once.
+        self._lock = threading.Lock()
         self.lines = []
         self.legend = None
         self.legend_title = " :: ".join([name for name in self.legend_keys])
 
+    @property
+    def x_data(self):
+        return self._x_buffer[:self._num_x]
+
+    @x_data.setter
+    def x_data(self, values):
+        with self._lock:
+            self._x_buffer, self._num_x = self._new_buffer(values)
+            self._reset_decimator()
+
+    @property
+    def y_data(self):
+        return self._y_buffer[:self._num_y]
+
+    @y_data.setter
+    def y_data(self, values):
+        with self._lock:
+            self._y_buffer, self._num_y = self._new_buffer(values)
+            self._reset_decimator()
+
+    def _new_buffer(self, values):
+        "Copy values into a new buffer with room to grow."
+        values = np.asarray(values, dtype=float).ravel()
+        num = len(values)
+        buffer = np.empty(max(self._INITIAL_BUFFER_SIZE, 2 * num))
+        buffer[:num] = values
+        return buffer, num
+
+    def _reset_decimator(self):
+        if self.max_points is None:
+            self._decimator = None
+            return
+        self._decimator = MinMaxDecimator(self.max_points)
+        for x, y in zip(self.x_data, self.y_data):
+            self._decimator.append(x, y)
+
     def start(self, doc):
         # The doc is not used; we just use the singal that a new run began.
-        self.x_data, self.y_data = [], []
+        with self._lock:
+            self._x_buffer, self._num_x = self._new_buffer([])
+            self._y_buffer, self._num_y = self._new_buffer([])
+            self._reset_decimator()
+        self._pending_extent = None
+        self._last_draw_time = 0
+        self._background = None
         label = " :: ".join(
             [str(doc.get(name, ' ')) for name in self.legend_keys])
-        self.current_line, = self.ax.plot([], [], label=label, **self.kwargs)
+        # In throttled mode the line is drawn by blitting, so keep it out of
+        # the cached background.
+        self.current_line, = self.ax.plot([], [], label=label,
+                                          animated=self.max_fps is not None,
+                                          **self.kwargs)
         self.lines.append(self.current_line)
         self.legend = self.ax.legend(loc=0, title=self.legend_title).draggable()
 
@@ -195,13 +377,356 @@ class LivePlot(CallbackBase):
         except KeyError:
             # wrong event stream, skip it
             return
-        self.y_data.append(new_y)
-        self.x_data.append(new_x)
-        self.current_line.set_data(self.x_data, self.y_data)
-        # Rescale and redraw.
-        ax.relim(visible_only=True)
-        ax.autoscale_view(tight=True)
-        ax.figure.canvas.draw()
+        if self.keep_full_data:
+            self._append(new_x, new_y)
+        if self._decimator is not None:
+            self._decimator.append(new_x, new_y)
+        if self.max_fps is None:
+            self.current_line.set_data(*self._plotted_data())
+            # Rescale and redraw.
+            ax.relim(visible_only=True)
+            ax.autoscale_view(tight=True)
+            ax.figure.canvas.draw()
+            qt_kicker.wake()
+            return
+        self._update_pending_extent(new_x, new_y)
+        if ttime.time() - self._last_draw_time < 1 / self.max_fps:
+            # Too soon. This point will be drawn with the next frame.
+            return
+        self._draw_frame()
+
+    def stop(self, doc):
+        if self.max_fps is None:
+            return
+        # Flush any buffered points and hand the line back to normal drawing
+        # so that it survives the next full redraw.
+        self.current_line.set_animated(False)
+        self.current_line.set_data(*self._plotted_data())
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view(tight=True)
+        self.ax.figure.canvas.draw()
+        self._background = None
+        qt_kicker.wake()
+
+    def _plotted_data(self):
+        if self._decimator is not None:
+            return self._decimator.get_data()
+        return self.x_data, self.y_data
+
+    def _append(self, x, y):
+        "Store a point in the preallocated buffers, growing them if full."
+        with self._lock:
+            if self._num_x == len(self._x_buffer):
+                self._x_buffer = np.resize(self._x_buffer, 2 * self._num_x)
+            if self._num_y == len(self._y_buffer):
+                self._y_buffer = np.resize(self._y_buffer, 2 * self._num_y)
+            self._x_buffer[self._num_x] = x
+            self._y_buffer[self._num_y] = y
+            self._num_x += 1
+            self._num_y += 1
+
+    def _update_pending_extent(self, x, y):
+        "Track the bounding box of the points not yet drawn."
+        with self._lock:
+            if self._pending_extent is None:
+                self._pending_extent = [x, x, y, y]
+                return
+            extent = self._pending_extent
+            extent[0] = min(extent[0], x)
+            extent[1] = max(extent[1], x)
+            extent[2] = min(extent[2], y)
+            extent[3] = max(extent[3], y)
+
+    def _draw_frame(self):
+        "Draw all buffered points, rescaling only if they leave the limits."
+        with self._lock:
+            ax = self.ax
+            canvas = ax.figure.canvas
+            self.current_line.set_data(*self._plotted_data())
+            can_blit = getattr(canvas, 'supports_blit', False)
+            if not can_blit:
+                # Fall back to drawing the line along with everything else.
+                self.current_line.set_animated(False)
+            if (not can_blit or self._background is None or
+                    self._outside_limits()):
+                ax.relim(visible_only=True)
+                ax.autoscale_view(tight=True)
+                canvas.draw()
+                if can_blit:
+                    self._background = canvas.copy_from_bbox(ax.bbox)
+            else:
+                canvas.restore_region(self._background)
+            if can_blit:
+                ax.draw_artist(self.current_line)
+                canvas.blit(ax.bbox)
+            self._pending_extent = None
+            self._last_draw_time = ttime.time()
+            qt_kicker.wake()
+
+    def _outside_limits(self):
+        "Check undrawn points against the limits of any autoscaling axis."
+        if self._pending_extent is None:
+            return False
+        ax = self.ax
+        xmin, xmax, ymin, ymax = self._pending_extent
+        axes = [(xmin, xmax, ax.get_autoscalex_on(), ax.get_xlim()),
+                (ymin, ymax, ax.get_autoscaley_on(), ax.get_ylim())]
+        for low, high, autoscale_on, limits in axes:
+            if not autoscale_on:
+                continue
+            if low < min(limits) or high > max(limits):
+                return True
+        return False
+
+
+class MinMaxDecimator:
+    """
+    Incrementally maintain a min/max decimated view of a stream of points.
+
+    The stream is divided into buckets of consecutive points. Each bucket is
+    represented by its minimum and maximum y values, in the order they
+    arrived, so that peaks and dips survive decimation. When there are too
+    many buckets, adjacent pairs are merged and the bucket size doubles.
+    Each append costs O(1) amortized, and the view never has more than
+    ``max_points`` points.
+
+    Parameters
+    ----------
+    max_points : int
+        upper bound on the number of points returned by ``get_data``; at
+        least 4
+
+    Examples
+    --------
+    >>> dec = MinMaxDecimator(100)
+    >>> for i in range(10000):
+    ...     dec.append(i, np.sin(i / 100))
+    >>> x, y = dec.get_data()
+    >>> len(x) <= 100
+    True
+    """
+    def __init__(self, max_points):
+        if max_points < 4:
+            raise ValueError("max_points must be at least 4")
+        self.max_points = max_points
+        # Completed buckets contribute up to two points each and the partial
+        # bucket up to two more; buckets are merged as soon as the capacity
+        # is reached. Keep an even number so that buckets merge in pairs.
+        capacity = max_points // 2
+        self._capacity = capacity - capacity % 2
+        # min x, min y, min index, max x, max y, max index for each bucket
+        self._buckets = np.empty((self._capacity, 6))
+        self._num_buckets = 0
+        self.bucket_size = 1
+        self._count = 0  # total number of points appended
+        self._partial = None  # the bucket being filled
+        self._partial_count = 0
+        # Points may be appended on one thread while another reads the view.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, x, y):
+        "Add one point to the stream."
+        with self._lock:
+            i = self._count
+            self._count += 1
+            partial = self._partial
+            if partial is None:
+                self._partial = [x, y, i, x, y, i]
+            else:
+                if y < partial[1]:
+                    partial[:3] = x, y, i
+                if y > partial[4]:
+                    partial[3:] = x, y, i
+            self._partial_count += 1
+            if self._partial_count == self.bucket_size:
+                self._buckets[self._num_buckets] = self._partial
+                self._num_buckets += 1
+                self._partial = None
+                self._partial_count = 0
+                if self._num_buckets == self._capacity:
+                    self._merge()
+
+    def _merge(self):
+        "Merge adjacent pairs of buckets, doubling the bucket size."
+        pairs = self._buckets.reshape(-1, 2, 6)
+        half = len(pairs)
+        rows = np.arange(half)
+        lo = np.argmin(pairs[:, :, 1], axis=1)
+        hi = np.argmax(pairs[:, :, 4], axis=1)
+        self._buckets[:half, :3] = pairs[rows, lo, :3]
+        self._buckets[:half, 3:] = pairs[rows, hi, 3:]
+        self._num_buckets = half
+        self.bucket_size *= 2
+
+    def get_data(self):
+        """
+        Return the decimated view.
+
+        Returns
+        -------
+        x, y : numpy.ndarray
+            decimated points, in the order they were appended
+        """
+        with self._lock:
+            # Copy, so that later appends do not change what is returned.
+            buckets = self._buckets[:self._num_buckets].copy()
+            if self._partial is not None:
+                buckets = np.vstack([buckets, self._partial])
+        min_first = buckets[:, 2] <= buckets[:, 5]
+        first = np.where(min_first[:, np.newaxis], buckets[:, :2],
+                         buckets[:, 3:5])
+        second = np.where(min_first[:, np.newaxis], buckets[:, 3:5],
+                          buckets[:, :2])
+        points = np.stack([first, second], axis=1).reshape(-1, 2)
+        # Where the min and the max are the same point, show it once.
+        keep = np.ones((len(buckets), 2), dtype=bool)
+        keep[:, 1] = buckets[:, 2] != buckets[:, 5]
+        points = points[keep.ravel()]
+        return points[:, 0], points[:, 1]
+
+
+class RetrievalService(CallbackBase):
+    """
+    Fetch externally-stored (e.g., filestore) data in the background.
+
+    Retrieval starts as soon as a datum uid is seen, on a pool of worker
+    threads, and the results are kept in a least-recently-used cache that is
+    bounded in bytes. Consumers that need the data call ``retrieve``, which
+    returns immediately if the data has already arrived.
+
+    As a callback, it prefetches every external field of every Event. To
+    start prefetching before any lossy subscriptions see the Event, register
+    it as a critical subscription:
+
+    >>> from bluesky.run_engine import DocumentNames
+    >>> service = get_retrieval_service()
+    >>> for name in [DocumentNames.start, DocumentNames.descriptor,
+    ...              DocumentNames.event]:
+    ...     RE._register_scan_callback(name, service)
+
+    Parameters
+    ----------
+    retrieve : callable, optional
+        maps a datum uid to its data; ``filestore.api.retrieve`` by default
+    max_bytes : int, optional
+        upper bound on the size of the cache; 256 MB by default
+    max_workers : int, optional
+        number of threads reading data concurrently; 4 by default
+    """
+    def __init__(self, retrieve=None, max_bytes=2**28, max_workers=4):
+        super().__init__()
+        self._retrieve = retrieve
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # {uid: (data, nbytes)}, oldest first
+        self._nbytes = 0
+        self._pending = dict()  # {uid: Future} for reads in progress
+        self._external_keys = set()
+
+    @property
+    def nbytes(self):
+        "Total size of the cached data"
+        return self._nbytes
+
+    def __contains__(self, uid):
+        return uid in self._cache
+
+    def prefetch(self, uid):
+        """
+        Start reading the data for ``uid`` unless it is cached or underway.
+
+        Returns
+        -------
+        future : concurrent.futures.Future or None
+            None if the data is already cached
+        """
+        with self._lock:
+            if uid in self._cache:
+                return None
+            if uid in self._pending:
+                return self._pending[uid]
+            future = self._executor.submit(self._load, uid)
+            self._pending[uid] = future
+            return future
+
+    def retrieve(self, uid, timeout=None):
+        "Return the data for ``uid``, waiting for it to be read if necessary."
+        with self._lock:
+            if uid in self._cache:
+                self._cache.move_to_end(uid)
+                data, nbytes = self._cache[uid]
+                return data
+        future = self.prefetch(uid)
+        if future is None:
+            # It arrived between the check above and the call to prefetch.
+            return self.retrieve(uid, timeout)
+        return future.result(timeout)
+
+    def clear(self):
+        "Empty the cache."
+        with self._lock:
+            self._cache.clear()
+            self._nbytes = 0
+
+    def _load(self, uid):
+        try:
+            retrieve = self._retrieve
+            if retrieve is None:
+                import filestore.api as fsapi
+                retrieve = fsapi.retrieve
+            data = retrieve(uid)
+            self._store(uid, data)
+            return data
+        finally:
+            with self._lock:
+                self._pending.pop(uid, None)
+
+    def _store(self, uid, data):
+        nbytes = getattr(data, 'nbytes', None)
+        if nbytes is None:
+            nbytes = sys.getsizeof(data)
+        if nbytes > self.max_bytes:
+            # Never cache anything that would evict everything else.
+            return
+        with self._lock:
+            if uid in self._cache:
+                return
+            while self._nbytes + nbytes > self.max_bytes:
+                _, (_, old_nbytes) = self._cache.popitem(last=False)
+                self._nbytes -= old_nbytes
+            self._cache[uid] = (data, nbytes)
+            self._nbytes += nbytes
+
+    ### RunEngine document callbacks
+
+    def start(self, doc):
+        # Which fields are external is declared anew by each run.
+        self._external_keys = set()
+
+    def descriptor(self, doc):
+        for key, data_key in doc['data_keys'].items():
+            if data_key.get('external', '') == 'FILESTORE:':
+                self._external_keys.add(key)
+
+    def event(self, doc):
+        for key in self._external_keys:
+            if key in doc['data']:
+                self.prefetch(doc['data'][key])
+
+
+_retrieval_service = None
+
+
+def get_retrieval_service():
+    "Return the RetrievalService shared by all callbacks, creating it once."
+    global _retrieval_service
+    if _retrieval_service is None:
+        _retrieval_service = RetrievalService()
+    return _retrieval_service
 
 
 def format_num(x, max_len=11, pre=5, post=5):
@@ -222,11 +747,18 @@ class LiveTable(CallbackBase):
     fields : list, optional
         names of data fields to include in addition to 'seq_num'
     rowwise : bool
-        If True, append each row to stdout. If False, reprint the full updated
-        table each time. This is useful if other messsages are interspersed.
+        If True, append each row to stdout. If False, reprint the header and
+        the most recent rows (up to ``print_header_interval`` of them) each
+        time. This is useful if other messsages are interspersed.
     print_header_interval : int
         The number of events to process and print their rows before printing
         the header again
+    retrieval : RetrievalService, optional
+        used to read externally-stored fields; by default, the service shared
+        by all callbacks. The table waits for each read when it prints the
+        row; subscribe the service itself ahead of the table (see
+        ``RetrievalService``) to have the reads start when the Event is
+        emitted.
 
     Examples
     --------
@@ -250,13 +782,14 @@ class LiveTable(CallbackBase):
     """
     base_fields = ['seq_num', 'time']
     base_field_widths = [8, 10]
+    padding_width = 2
     data_field_width = 12
     max_pre_decimal = 5
     max_post_decimal = 2
 
     def __init__(self, fields=None, rowwise=True, print_header_interval=50,
                  max_post_decimal=2, max_pre_decimal=5, data_field_width=12,
-                 logbook=None):
+                 logbook=None, retrieval=None):
         self.data_field_width = data_field_width
         self.max_pre_decimal = max_pre_decimal
         self.max_post_decimal = max_post_decimal
@@ -264,33 +797,54 @@ class LiveTable(CallbackBase):
         self.rowwise = rowwise
         if fields is None:
             fields = []
-        # prettytable does not allow nonunique names
+        # column names must be unique
         self.fields = sorted(set(_get_obj_fields(fields)))
         self.field_column_names = [field for field in self.fields]
         self.num_events_since_last_header = 0
         self.print_header_interval = print_header_interval
         self.logbook = logbook
+        if retrieval is None:
+            retrieval = get_retrieval_service()
+        self.retrieval = retrieval
         self._filestore_keys = set()
         # self.create_table()
 
     def create_table(self):
-        self.table = PrettyTable(field_names=(self.base_fields +
-                                              self.field_column_names))
-        self.table.padding_width = 2
-        self.table.align = 'r'
-        # format the placeholder fields for the base fields so that the
-        # heading prints at the correct width
-        base_fields = [' '*width for width in self.base_field_widths]
-        # format placeholder fields for the data fields so that the heading
-        # prints at the correct width
-        data_fields = [' '*self.data_field_width for _ in self.fields]
-        self.table.add_row(base_fields + data_fields)
+        names = self.base_fields + self.field_column_names
+        # The base fields and the data fields have fixed widths so that rows
+        # can be formatted one at a time as they arrive, but a column is
+        # never narrower than its heading.
+        widths = (self.base_field_widths +
+                  [self.data_field_width for _ in self.fields])
+        widths = [max(width, len(name)) for width, name in zip(widths, names)]
+        pad = ' ' * self.padding_width
+        self._row_template = '|{}|'.format('|'.join(
+            '{pad}{{:>{width}}}{pad}'.format(pad=pad, width=width)
+            for width in widths))
+        self._border = '+{}+'.format('+'.join(
+            '-' * (width + 2 * len(pad)) for width in widths))
+        self._rows = []  # every row, kept only for the logbook
+        self._recent_rows = deque(maxlen=self.print_header_interval)
         if self.rowwise:
             self._print_table_header()
         sys.stdout.flush()
 
+    def _format_row(self, row):
+        return self._row_template.format(*[str(val) for val in row])
+
+    def _table_header(self):
+        header = self._format_row(self.base_fields + self.field_column_names)
+        return [self._border, header, self._border]
+
     def _print_table_header(self):
-        print('\n'.join(str(self.table).split('\n')[:3]))
+        print('\n'.join(self._table_header()))
+
+    def _format_table(self, rows):
+        "Render rows in the same format as the printed table."
+        lines = self._table_header()
+        lines.extend(self._format_row(row) for row in rows)
+        lines.append(self._border)
+        return '\n'.join(lines)
 
     ### RunEngine document callbacks
 
@@ -331,8 +885,7 @@ class LiveTable(CallbackBase):
             val = event_document['data'].get(field, '')
             if field in self._filestore_keys:
                 try:
-                    import filestore.api as fsapi
-                    val = fsapi.retrieve(val)
+                    val = self.retrieval.retrieve(val)
                 except Exception as exc:
                     warnings.warn(UserWarning, "Attempt to read {0} raised {1}"
                                   "".format(field, exc))
@@ -347,20 +900,22 @@ class LiveTable(CallbackBase):
             except Exception:
                 val = str(val)[:self.data_field_width]
             row.append(val)
-        self.table.add_row(row)
+        if self.logbook:
+            self._rows.append(row)
 
         if self.rowwise:
-            # Print the last row of data only.
-            # [-1] is the bottom border
-            print(str(self.table).split('\n')[-2])
+            # Print this row of data only.
+            print(self._format_row(row))
             # only print header intermittently for rowwise table printing
             if self.num_events_since_last_header >= self.print_header_interval:
                 self._print_table_header()
                 self.num_events_since_last_header = 0
             self.num_events_since_last_header += 1
         else:
-            # print the whole table
-            print(self.table)
+            # Reprint the recent rows only, so that the cost of each Event
+            # does not grow with the length of the run.
+            self._recent_rows.append(row)
+            print(self._format_table(self._recent_rows))
 
         sys.stdout.flush()
 
@@ -376,22 +931,340 @@ class LiveTable(CallbackBase):
 
         if self.logbook and self.run_start_uid == stop_document['run_start']:
             header = ["Scan {scan_id} (uid='{run_start_uid}')", '']
-            # drop the padding row
-            self.table.start = 1
-            my_table = '\n'.join(header + [str(self.table), ])
+            my_table = '\n'.join(header + [self._format_table(self._rows)])
             self.logbook(my_table, {
                 'run_start_uid': stop_document['run_start'],
                 'scan_id': self.scan_id})
 
-        self.table.start = 0
-        print(str(self.table).split('\n')[-1])
+        print(self._border)
         sys.stdout.flush()
         # remove all data from the table
-        self.table.clear_rows()
+        self._rows = []
+        self._recent_rows.clear()
         # reset the filestore keys
         self._filestore_keys = set()
 
 
+class PeakStats(CallbackBase):
+    """
+    Compute peak statistics of y vs. x as Events arrive.
+
+    The data is kept in preallocated numpy arrays, and the maximum, minimum
+    and center of mass are updated with each Event, so they are available
+    at any time during the run at constant cost. The center and full width
+    at half maximum are computed (vectorized) on request. All the statistics
+    are collected in the ``results`` dict when the run stops.
+
+    Parameters
+    ----------
+    x : str
+        the name of a data field in an Event, such as a motor position
+    y : str
+        the name of a data field in an Event, such as a detector reading
+    live : bool, optional
+        If True, print a one-line summary of the statistics after each
+        Event. False by default.
+
+    Attributes
+    ----------
+    max : tuple
+        (x, y) at the maximum y
+    min : tuple
+        (x, y) at the minimum y
+    com : float
+        center of mass, the y-weighted mean of x
+    cen : float
+        midpoint of the two half-maximum crossings
+    fwhm : float
+        full width at half maximum
+    results : dict
+        all of the above, computed at the end of the run
+
+    Examples
+    --------
+    Subscribe it as a critical subscription to be sure it sees every Event,
+    and then use the results as soon as the scan is over.
+
+    >>> from bluesky.run_engine import DocumentNames
+    >>> ps = PeakStats('motor', 'det')
+    >>> for name in [DocumentNames.start, DocumentNames.event,
+    ...              DocumentNames.stop]:
+    ...     RE._register_scan_callback(name, ps)
+    >>> RE(AbsScan([det], motor, -5, 5, 41))
+    >>> motor.set(ps.results['cen'])
+    """
+    _INITIAL_BUFFER_SIZE = 1024  # points; the buffers double when full
+
+    def __init__(self, x, y, live=False):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.live = live
+        self.results = {}
+        # Events may arrive on several dispatcher threads at once.
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._x = np.empty(self._INITIAL_BUFFER_SIZE)
+        self._y = np.empty(self._INITIAL_BUFFER_SIZE)
+        self._num_points = 0
+        self._sum_y = 0
+        self._sum_xy = 0
+        self._argmax = None
+        self._argmin = None
+
+    def __len__(self):
+        return self._num_points
+
+    @property
+    def max(self):
+        with self._lock:
+            if self._argmax is None:
+                return None
+            return self._x[self._argmax], self._y[self._argmax]
+
+    @property
+    def min(self):
+        with self._lock:
+            if self._argmin is None:
+                return None
+            return self._x[self._argmin], self._y[self._argmin]
+
+    @property
+    def com(self):
+        with self._lock:
+            if not self._sum_y:
+                return np.nan
+            return self._sum_xy / self._sum_y
+
+    @property
+    def cen(self):
+        left, right = self._half_max_crossings()
+        return (left + right) / 2
+
+    @property
+    def fwhm(self):
+        left, right = self._half_max_crossings()
+        return right - left
+
+    def _half_max_crossings(self):
+        "Interpolate the x positions where y crosses half maximum."
+        with self._lock:
+            if self._num_points < 2:
+                return np.nan, np.nan
+            x = self._x[:self._num_points].copy()
+            y = self._y[:self._num_points].copy()
+        order = np.argsort(x, kind='mergesort')
+        x = x[order]
+        y = y[order]
+        peak = np.argmax(y)
+        half = (y[peak] + y.min()) / 2
+        below = y < half
+        # nearest point below half max on each side of the peak
+        left_below = np.nonzero(below[:peak])[0]
+        right_below = np.nonzero(below[peak:])[0]
+        if not len(left_below) or not len(right_below):
+            # The peak is not bracketed by the data.
+            return np.nan, np.nan
+        i = left_below[-1]
+        j = peak + right_below[0]
+        left = np.interp(half, y[i:i + 2], x[i:i + 2])
+        right = np.interp(half, y[j - 1:j + 1][::-1], x[j - 1:j + 1][::-1])
+        return left, right
+
+    def start(self, doc):
+        with self._lock:
+            self._reset()
+        self.results = {}
+
+    def event(self, doc):
+        try:
+            x = doc['data'][self.x]
+            y = doc['data'][self.y]
+        except KeyError:
+            # wrong event stream, skip it
+            return
+        with self._lock:
+            i = self._num_points
+            if i == len(self._x):
+                self._x = np.resize(self._x, 2 * i)
+                self._y = np.resize(self._y, 2 * i)
+            self._x[i] = x
+            self._y[i] = y
+            self._num_points += 1
+            self._sum_y += y
+            self._sum_xy += x * y
+            if self._argmax is None or y > self._y[self._argmax]:
+                self._argmax = i
+            if self._argmin is None or y < self._y[self._argmin]:
+                self._argmin = i
+        if self.live:
+            x_max, y_max = self.max
+            print('max: ({}, {})  com: {}'.format(
+                format_num(x_max, pre=5, post=2),
+                format_num(y_max, pre=5, post=2),
+                format_num(self.com, pre=5, post=2)))
+            sys.stdout.flush()
+
+    def stop(self, doc):
+        self.results = dict(max=self.max, min=self.min, com=self.com,
+                            cen=self.cen, fwhm=self.fwhm)
+
+
+class LiveFit(CallbackBase):
+    """
+    Fit a model to y vs. x in the background as Events arrive.
+
+    Fits run on a worker thread, so they never hold up the RunEngine or
+    other callbacks. To avoid refitting on every Event, a new fit is started
+    only once ``min_new_points`` points have arrived or ``min_interval``
+    seconds have passed since the last one, and only if no fit is already
+    running. Each fit starts from the parameters of the previous one. A fit
+    that finishes after a newer run has started is discarded. A final fit
+    over all of the data is started when the run stops.
+
+    Parameters
+    ----------
+    x : str
+        the name of a data field in an Event, such as a motor position
+    y : str
+        the name of a data field in an Event, such as a detector reading
+    model : lmfit.Model, optional
+        By default, a Gaussian plus a line, as in ``scans.Center``.
+    guesses : dict, optional
+        initial parameter values for the first fit; required for a custom
+        model, estimated from the data for the default one
+    min_new_points : int, optional
+        refit after this many new points; 5 by default
+    min_interval : float, optional
+        refit after this many seconds if there are any new points; 1 by
+        default
+
+    Attributes
+    ----------
+    result : lmfit.model.ModelResult
+        the most recent fit, or None
+    num_fitted : int
+        the number of points used in the most recent fit
+
+    Examples
+    --------
+    >>> lf = LiveFit('motor', 'det')
+    >>> RE(AbsScan([det], motor, -5, 5, 41), lf)
+    >>> lf.wait()
+    >>> lf.result.values['center']
+    """
+    _INITIAL_BUFFER_SIZE = 1024  # points; the buffers double when full
+
+    def __init__(self, x, y, model=None, guesses=None, min_new_points=5,
+                 min_interval=1):
+        super().__init__()
+        if model is None:
+            model = GaussianModel() + LinearModel()
+        elif guesses is None:
+            raise ValueError("Initial guesses are required for a custom "
+                             "model.")
+        self.x = x
+        self.y = y
+        self.model = model
+        self.guesses = guesses
+        self.min_new_points = min_new_points
+        self.min_interval = min_interval
+        self._executor = ThreadPoolExecutor(1)
+        self._lock = threading.Lock()
+        self._generation = 0  # incremented for each run, to spot stale fits
+        self._future = None
+        self._reset()
+
+    def _reset(self):
+        self._x = np.empty(self._INITIAL_BUFFER_SIZE)
+        self._y = np.empty(self._INITIAL_BUFFER_SIZE)
+        self._num_points = 0
+        self._last_fit_time = ttime.time()
+        self.result = None
+        self.num_fitted = 0
+
+    def wait(self, timeout=None):
+        "Block until the fit in progress, if any, is finished."
+        future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def start(self, doc):
+        with self._lock:
+            self._generation += 1
+            self._reset()
+
+    def event(self, doc):
+        try:
+            x = doc['data'][self.x]
+            y = doc['data'][self.y]
+        except KeyError:
+            # wrong event stream, skip it
+            return
+        with self._lock:
+            i = self._num_points
+            if i == len(self._x):
+                self._x = np.resize(self._x, 2 * i)
+                self._y = np.resize(self._y, 2 * i)
+            self._x[i] = x
+            self._y[i] = y
+            self._num_points += 1
+            new_points = self._num_points - self.num_fitted
+            due = (new_points >= self.min_new_points or
+                   ttime.time() - self._last_fit_time >= self.min_interval)
+        if due:
+            self._submit()
+
+    def stop(self, doc):
+        self._submit(final=True)
+
+    def _submit(self, final=False):
+        with self._lock:
+            if self._future is not None and not self._future.done():
+                if not final:
+                    # Debounce: the next Event after this fit will try again.
+                    return
+            if self._num_points == self.num_fitted:
+                return
+            if self.result is not None:
+                # Warm-start from the last fit.
+                params = self.result.params
+            else:
+                params = self._initial_params()
+            x = self._x[:self._num_points].copy()
+            y = self._y[:self._num_points].copy()
+            self._last_fit_time = ttime.time()
+            self._future = self._executor.submit(self._fit, self._generation,
+                                                 x, y, params)
+
+    def _initial_params(self):
+        if self.guesses is not None:
+            guesses = self.guesses
+        else:
+            x = self._x[:self._num_points]
+            y = self._y[:self._num_points]
+            guesses = {'amplitude': np.max(y),
+                       'center': x[np.argmax(y)],
+                       'sigma': max(np.ptp(x), 1e-12) / 4,
+                       'slope': 0, 'intercept': 0}
+        return self.model.make_params(**guesses)
+
+    def _fit(self, generation, x, y, params):
+        try:
+            result = self.model.fit(y, x=x, params=params)
+        except Exception as exc:
+            logger.warning("LiveFit failed with %d points: %r", len(x), exc)
+            return
+        with self._lock:
+            if generation != self._generation or len(x) < self.num_fitted:
+                # This fit was overtaken; drop it.
+                return
+            self.result = result
+            self.num_fitted = len(x)
+
+
 def _get_obj_fields(fields):
     """
     If fields includes any objects, get their field names using obj.describe()
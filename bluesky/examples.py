@@ -84,10 +84,19 @@ class Mover(Base):
                       for f in self._fields}
         self.ready = True
         self._fake_sleep = sleep_time
+        self._subscriptions = []
 
     def read(self):
         return self._data
 
+    def subscribe(self, func):
+        "Call func (with no arguments) now and each time the value changes."
+        self._subscriptions.append(func)
+        func()
+
+    def clear_sub(self, func):
+        self._subscriptions.remove(func)
+
     def set(self, val, *, trigger=True, block_group=None):
         # If trigger is False, wait for a separate 'trigger' command to move.
         if not trigger:
@@ -103,6 +112,8 @@ class Mover(Base):
             self._data = {f: {'value': val, 'timestamp': ttime.time()}
                           for f in self._fields}
         self.ready = True
+        for func in list(self._subscriptions):
+            func()
         return self
 
     def settle(self):
@@ -162,6 +173,200 @@ class SynGauss(Reader):
         return self._data
 
 
+class _Status:
+    "A minimal status object, finished by calling _finish."
+    def __init__(self, done=False):
+        self.done = done
+        self._cb = None
+
+    @property
+    def finished_cb(self):
+        return self._cb
+
+    @finished_cb.setter
+    def finished_cb(self, cb):
+        if self._cb is not None:
+            raise RuntimeError("Can not change the call back")
+        if self.done:
+            cb()
+        else:
+            self._cb = cb
+
+    def _finish(self):
+        self.done = True
+        if self._cb is not None:
+            self._cb()
+            self._cb = None
+
+
+class ReadoutSynGauss(SynGauss):
+    """
+    A SynGauss with a separate readout phase, during which motion is safe.
+
+    The status returned by trigger is done after the readout; its
+    ``exposure`` attribute is a status that is done when the exposure is.
+
+    Example
+    -------
+    motor = Mover('motor', ['motor'])
+    det = ReadoutSynGauss('det', motor, 'motor', center=0, Imax=1,
+                          readout_time=0.1)
+    """
+    motion_safe_phases = ('readout',)
+
+    def __init__(self, *args, readout_time=0.1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.readout_time = readout_time
+
+    def trigger(self):
+        super().trigger()  # expose
+        status = _Status()
+        status.exposure = _Status(done=True)
+        self.ready = False
+
+        def finish_readout():
+            self.ready = True
+            status._finish()
+
+        loop.call_later(self.readout_time, finish_readout)
+        return status
+
+
+class BufferedDetector:
+    """
+    A detector that acquires a series of frames into a buffer.
+
+    The frames are read back with ``collect``, which may be called
+    repeatedly while acquiring.
+
+    Parameters
+    ----------
+    name : str
+    frame_time : float, optional
+        time per frame, in seconds; default is 0.001
+    """
+    def __init__(self, name, frame_time=0.001):
+        self._name = name
+        self.frame_time = frame_time
+        self._data = deque()
+        self._status = _Status(done=True)
+        self._future = None
+
+    @property
+    def done(self):
+        return self._status.done
+
+    def describe(self):
+        return [{self._name: {'source': self._name, 'dtype': 'number',
+                              'shape': None}}]
+
+    def configure(self, *args, **kwargs):
+        pass
+
+    def deconfigure(self, *args, **kwargs):
+        pass
+
+    def kickoff(self, num):
+        self._status = _Status()
+        self._future = loop.run_in_executor(None, self._acquire, num,
+                                            self._status)
+        return self._status
+
+    def collect(self):
+        while self._data:
+            yield self._data.popleft()
+
+    def stop(self):
+        pass
+
+    def _acquire(self, num, status):
+        for i in range(num):
+            ttime.sleep(self.frame_time)
+            t = ttime.time()
+            self._data.append({'time': t,
+                               'data': {self._name: i},
+                               'timestamps': {self._name: t}})
+        loop.call_soon_threadsafe(status._finish)
+
+
+class ReplaySignal:
+    """
+    Replay a recorded time series, optionally faster than real time.
+
+    Subscribers are called with the keyword argument ``value`` on every
+    update, as suspenders expect. The signal can also be read.
+
+    Parameters
+    ----------
+    name : str
+    times : array
+        times of the recorded values, in seconds, in increasing order
+    values : array
+    speedup : float, optional
+        replay this many times faster than recorded; default is 1
+
+    Example
+    -------
+    beam = ReplaySignal('beam', [0, 60, 90], [400, 0, 400], speedup=100)
+    PVSuspendFloor(RE, beam, 100)
+    beam.start()
+    """
+    def __init__(self, name, times, values, speedup=1):
+        if len(times) != len(values) or not len(times):
+            raise ValueError("times and values must be non-empty and the "
+                             "same length")
+        if np.any(np.diff(times) < 0):
+            raise ValueError("times must be in increasing order")
+        self._name = name
+        self._times = np.asarray(times, dtype=float)
+        self._values = list(values)
+        self.speedup = speedup
+        self.value = self._values[0]
+        self._timestamp = ttime.time()
+        self._callbacks = []
+        self._handles = []
+
+    def describe(self):
+        return {self._name: {'source': self._name, 'dtype': 'number',
+                             'shape': None}}
+
+    def read(self):
+        return {self._name: {'value': self.value,
+                             'timestamp': self._timestamp}}
+
+    def subscribe(self, callback):
+        "Call callback now and each time the value changes."
+        self._callbacks.append(callback)
+        callback(value=self.value)
+
+    def clear_sub(self, callback):
+        self._callbacks.remove(callback)
+
+    def start(self):
+        "Begin replaying from the first recorded value."
+        self.stop()
+        t0 = self._times[0]
+        for t, value in zip(self._times, self._values):
+            self._handles.append(
+                loop.call_later((t - t0) / self.speedup, self._update, value))
+
+    def stop(self):
+        for handle in self._handles:
+            handle.cancel()
+        self._handles.clear()
+
+    @property
+    def duration(self):
+        "The time the replay takes, in seconds"
+        return (self._times[-1] - self._times[0]) / self.speedup
+
+    def _update(self, value):
+        self.value = value
+        self._timestamp = ttime.time()
+        for callback in list(self._callbacks):
+            callback(value=value)
+
+
 class MockFlyer:
     """
     Class for mocking a flyscan API implemented with stepper motors.
@@ -195,11 +400,10 @@ class MockFlyer:
         return self
 
     def collect(self):
-        if not self.ready:
-            raise RuntimeError("No reading until done!")
-
-        yield from self._data
-        self._thread = None
+        # Yield whatever has been read so far; this may be called
+        # repeatedly while flying.
+        while self._data:
+            yield self._data.popleft()
 
     def _scan(self):
         for p in self._steps:
@@ -0,0 +1,306 @@
+"""
+Reorder the points of a scan to reduce the time spent moving between them.
+"""
+from collections import OrderedDict
+import numpy as np
+from .utils import Trajectory
+
+
+class AxisModel:
+    """
+    A simple model of how long an axis takes to move
+
+    Parameters
+    ----------
+    velocity : float
+        maximum speed, in units of position per second
+    acceleration : float, optional
+        acceleration and deceleration, in units of position per second
+        squared. If None (default), the axis reaches full speed instantly.
+    backlash : float, optional
+        If nonzero, the axis always finishes a move traveling in the direction
+        of this sign. A move in the other direction overshoots by
+        ``abs(backlash)`` and comes back. Default is 0.
+    settle_time : float, optional
+        time added to every nonzero move. Default is 0.
+    """
+    def __init__(self, velocity, acceleration=None, backlash=0,
+                 settle_time=0):
+        if velocity <= 0:
+            raise ValueError("velocity must be positive")
+        if acceleration is not None and acceleration <= 0:
+            raise ValueError("acceleration must be positive")
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.backlash = backlash
+        self.settle_time = settle_time
+
+    def _travel_time(self, distance):
+        v = self.velocity
+        a = self.acceleration
+        if a is None:
+            return distance / v
+        # Trapezoidal velocity profile, or triangular for short moves that
+        # never reach full speed.
+        return np.where(distance >= v**2 / a,
+                        distance / v + v / a,
+                        2 * np.sqrt(distance / a))
+
+    def move_time(self, displacement):
+        """
+        Estimate the time to move by the given displacement(s).
+
+        Parameters
+        ----------
+        displacement : float or array
+
+        Returns
+        -------
+        time : float or array
+        """
+        displacement = np.asarray(displacement, dtype=float)
+        distance = np.abs(displacement)
+        t = self._travel_time(distance)
+        if self.backlash:
+            against = np.sign(displacement) == -np.sign(self.backlash)
+            b = abs(self.backlash)
+            t = np.where(against,
+                         self._travel_time(distance + b) +
+                         self._travel_time(b),
+                         t)
+        return np.where(distance > 0, t + self.settle_time, 0.)
+
+    def __repr__(self):
+        return ("AxisModel(velocity={!r}, acceleration={!r}, backlash={!r}, "
+                "settle_time={!r})".format(self.velocity, self.acceleration,
+                                           self.backlash, self.settle_time))
+
+
+def _move_times(models, start, stops):
+    "Time to move from one point to each of several (axes move together)."
+    displacement = np.atleast_2d(stops) - start
+    times = [model.move_time(displacement[:, i])
+             for i, model in enumerate(models)]
+    return np.max(times, axis=0)
+
+
+def path_time(points, models, order=None, start=None):
+    """
+    Estimate the total time spent moving along a path.
+
+    Parameters
+    ----------
+    points : array
+        shape (N, number of axes)
+    models : list
+        one AxisModel per axis
+    order : array, optional
+        the order to visit the points in; by default, the given order
+    start : array, optional
+        position before the first point; if None, the path starts at the
+        first point
+
+    Returns
+    -------
+    time : float
+    """
+    points = np.asarray(points, dtype=float)
+    if order is not None:
+        points = points[np.asarray(order)]
+    if start is not None:
+        points = np.vstack([start, points])
+    if len(points) < 2:
+        return 0.
+    displacement = np.diff(points, axis=0)
+    times = [model.move_time(displacement[:, i])
+             for i, model in enumerate(models)]
+    return float(np.sum(np.max(times, axis=0)))
+
+
+def _snake(points, indices):
+    # Rows are distinct values of the first axis, visited in increasing
+    # order. Within a row, alternate direction along the remaining axes.
+    sub = points[indices]
+    rows = np.unique(np.round(sub[:, 0], 9))
+    order = []
+    for i, row in enumerate(rows):
+        in_row = indices[np.round(sub[:, 0], 9) == row]
+        keys = points[in_row, 1:].T[::-1]
+        in_row = in_row[np.lexsort(keys)] if len(keys) else in_row
+        if i % 2:
+            in_row = in_row[::-1]
+        order.extend(in_row)
+    return order
+
+
+def _nearest_neighbor(points, indices, models, start):
+    remaining = list(indices)
+    order = []
+    position = start
+    if position is None:
+        order.append(remaining.pop(0))
+        position = points[order[-1]]
+    while remaining:
+        times = _move_times(models, position, points[remaining])
+        order.append(remaining.pop(int(np.argmin(times))))
+        position = points[order[-1]]
+    return order
+
+
+def _two_opt(points, order, models, start, max_passes):
+    # Improve a path by reversing segments. Moves need not be symmetric
+    # (see backlash), so the cost of a reversed segment is computed from
+    # the reversed edges.
+    order = np.asarray(order)
+    n = len(order)
+    if n < 3:
+        return list(order)
+    nodes = points[order]
+    if start is not None:
+        nodes = np.vstack([start, nodes])
+    m = len(nodes)
+    cost = np.empty((m, m))
+    for i in range(m):
+        cost[i] = _move_times(models, nodes[i], nodes)
+    # Node 0 is fixed: it is either the start position or the first point.
+    tour = np.arange(m)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, m - 1):
+            forward = np.concatenate(
+                [[0], np.cumsum(cost[tour[:-1], tour[1:]])])
+            backward = np.concatenate(
+                [[0], np.cumsum(cost[tour[1:], tour[:-1]])])
+            # Gain from reversing tour[i:j+1] for every j > i
+            j = np.arange(i + 1, m)
+            old = cost[tour[i - 1], tour[i]] + forward[j] - forward[i]
+            new = cost[tour[i - 1], tour[j]] + backward[j] - backward[i]
+            inner = j + 1 < m
+            old[inner] += cost[tour[j[inner]], tour[j[inner] + 1]]
+            new[inner] += cost[tour[i], tour[j[inner] + 1]]
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-12:
+                k = j[best]
+                tour[i:k + 1] = tour[i:k + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    if start is not None:
+        tour = tour[1:] - 1
+    return list(order[tour])
+
+
+def optimize_path(points, models, method='2-opt', preserve=None, start=None,
+                  max_passes=20):
+    """
+    Reorder points to reduce the estimated time spent moving.
+
+    Parameters
+    ----------
+    points : array
+        shape (N, number of axes)
+    models : list
+        one AxisModel per axis
+    method : {'snake', 'nearest', '2-opt'}, optional
+        'snake' sweeps rows of the first axis back and forth; 'nearest'
+        always moves to the closest remaining point (in time); '2-opt'
+        refines the nearest-neighbor path by reversing segments. Default is
+        '2-opt'.
+    preserve : list, optional
+        indices of axes whose order must be kept: points are grouped by
+        their values on these axes and the groups are visited in the order
+        they first appear in ``points``. Only the order within each group is
+        optimized.
+    start : array, optional
+        current position, used to choose the first point
+    max_passes : int, optional
+        maximum number of improvement passes for '2-opt'. Default is 20.
+        Note that '2-opt' uses memory quadratic in the number of points in
+        each group.
+
+    Returns
+    -------
+    order : array
+        indices into ``points``
+    """
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != len(models):
+        raise ValueError("points must have shape (N, {})".format(len(models)))
+    if method not in ('snake', 'nearest', '2-opt'):
+        raise ValueError("method must be 'snake', 'nearest', or '2-opt'")
+    if start is not None:
+        start = np.asarray(start, dtype=float)
+    preserve = list(preserve or [])
+    free = [i for i in range(points.shape[1]) if i not in preserve]
+    groups = OrderedDict()
+    for i, point in enumerate(points):
+        groups.setdefault(tuple(point[preserve]), []).append(i)
+    order = []
+    position = start
+    for indices in groups.values():
+        indices = np.asarray(indices)
+        if method == 'snake':
+            # Snake over the axes that are free to move.
+            reduced = np.zeros_like(points)
+            reduced[:, :len(free)] = points[:, free]
+            group_order = _snake(reduced, indices)
+        else:
+            group_order = _nearest_neighbor(points, indices, models, position)
+            if method == '2-opt':
+                group_order = _two_opt(points, group_order, models, position,
+                                       max_passes)
+        order.extend(group_order)
+        position = points[order[-1]]
+    return np.asarray(order, dtype=int)
+
+
+def optimized_trajectory(points, models, **kwargs):
+    """
+    Reorder the points of a scan to reduce the time spent moving.
+
+    The result can be passed to ``ScanND``.
+
+    Parameters
+    ----------
+    points : iterable
+        a dictionary mapping each motor to an array of positions (all the
+        same length) or an iterable of dictionaries mapping motors to
+        positions, such as a ``cycler.Cycler``
+    models : dict
+        mapping each motor to an AxisModel
+    **kwargs
+        passed to ``optimize_path``; ``start`` and ``preserve`` may refer to
+        motors, e.g. ``preserve=[motor1]`` and ``start={motor1: 0, motor2:
+        0}``
+
+    Returns
+    -------
+    trajectory : bluesky.utils.Trajectory
+
+    Examples
+    --------
+    >>> models = {motor1: AxisModel(1, 10), motor2: AxisModel(5, 10)}
+    >>> traj = optimized_trajectory({motor1: x, motor2: y}, models)
+    >>> RE(ScanND([det], traj))
+    """
+    if hasattr(points, 'items'):
+        keys = list(points.keys())
+        columns = [np.asarray(points[k]) for k in keys]
+    else:
+        points = list(points)
+        if not points:
+            raise ValueError("no points to optimize")
+        keys = list(points[0].keys())
+        columns = [np.array([p[k] for p in points]) for k in keys]
+    missing = [k for k in keys if k not in models]
+    if missing:
+        raise ValueError("no AxisModel given for {!r}".format(missing))
+    if 'preserve' in kwargs and kwargs['preserve'] is not None:
+        kwargs['preserve'] = [keys.index(k) for k in kwargs['preserve']]
+    if kwargs.get('start') is not None:
+        kwargs['start'] = [kwargs['start'][k] for k in keys]
+    order = optimize_path(np.column_stack(columns),
+                          [models[k] for k in keys], **kwargs)
+    return Trajectory([OrderedDict((k, c[order])
+                                   for k, c in zip(keys, columns))])
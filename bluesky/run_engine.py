@@ -1,13 +1,19 @@
 import asyncio
+import inspect
 import itertools
 import types
 import time as ttime
 import sys
 import logging
-from itertools import count, tee
+import math
+import os
+from itertools import count
 from collections import namedtuple, deque, defaultdict, Iterable
 import uuid
 import signal
+import pickle
+import tempfile
+import warnings
 from enum import Enum
 
 
@@ -19,8 +25,8 @@ from super_state_machine.errors import TransitionError
 import numpy as np
 from pkg_resources import resource_filename as rs_fn
 
-from .utils import (CallbackRegistry, SignalHandler, ExtendedList,
-                    normalize_subs_input)
+from .utils import (CallbackRegistry, LoopSignalHandler, ExtendedList,
+                    Trajectory, normalize_subs_input)
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +84,15 @@ class Msg(namedtuple('Msg_base', ['command', 'obj', 'args', 'kwargs'])):
             self.command, self.obj, self.args, self.kwargs)
 
 
+_REPLAY_STATS = ['max_length', 'max_memory_bytes', 'max_disk_bytes',
+                 'spilled', 'unresumable', 'rewinds', 'replayed']
+
+
+# Per-run state saved at each checkpoint
+_RunState = namedtuple('_RunState', ['descriptor_uids', 'sequence_counters',
+                                     'restored_descriptors', 'block_groups'])
+
+
 class RunEngineStateMachine(StateMachine):
     """
 
@@ -172,6 +187,25 @@ class RunEngine:
             callable accepting a message and an optional dict
         ignore_callback_exceptions
             boolean, True by default
+        replay_memory_budget
+            approximate number of bytes of Messages to keep in memory for
+            replay after a pause; beyond this, they are written to a
+            temporary file. None means no limit. 100 MiB by default.
+        replay_disk_budget
+            maximum size, in bytes, of that temporary file. If it is
+            exceeded, the run cannot be paused or suspended until it reaches
+            its next checkpoint. None (the default) means no limit.
+        replay_stats
+            statistics on the Messages kept for replay (read-only)
+        profile_latency
+            If True, time everything the RunEngine does during a run and
+            attach the histograms to the RunStop, as 'latency_profile'.
+            False by default.
+        latency_profile
+            the LatencyProfile of the most recent run, or None (read-only)
+        state_path
+            If not None, a file where the RunEngine saves what it needs to
+            reopen the current run at each checkpoint. See ``recover``.
 
         Methods
         -------
@@ -179,6 +213,8 @@ class RunEngine:
             Pause the Run Engine at the next checkpoint.
         resume
             Start from the last checkpoint after a pause.
+        recover
+            Reopen a run saved to ``state_path`` and continue it.
         abort
             Move from 'paused' to 'idle', stopping the run permanently.
         panic
@@ -204,21 +240,31 @@ class RunEngine:
         self._run_is_open = False  # if we have emitted a RunStart, no RunStop
         self._deferred_pause_requested = False  # pause at next 'checkpoint'
         self._sigint_handler = None  # intercepts Ctrl+C
+        self._sigint_timer = None  # pending pause after a first Ctrl+C
         self._exception = None  # stored and then raised in the _run loop
         self._objs_read = deque()  # objects read in one Event
         self._read_cache = deque()  # cache of obj.read() in one Event
         self._configured = list()  # objects configured, not yet deconfigured
         self._movable_objs_touched = set()  # objects we moved at any point
         self._uncollected = set()  # objects after kickoff(), before collect()
+        self._monitor_params = dict()  # cache of {obj: (cb, stream key)}
         self._run_start_uids = list()  # run start uids generated by __call__
         self._describe_cache = dict()  # cache of all obj.describe() output
         self._descriptor_uids = dict()  # cache of all Descriptor uids
-        self._sequence_counters = dict()  # a seq_num counter per Descriptor
-        self._teed_sequence_counters = dict()  # for if we redo datapoints
+        self._sequence_counters = dict()  # last seq_num per Descriptor
+        self._checkpoint_state = None  # per-run state at the last checkpoint
         self._pause_requests = dict()  # holding {<name>: callable}
-        self._block_groups = defaultdict(set)  # sets of objs to wait for
+        self._suspensions = list()  # [(future, callback)] from request_suspend
+        self._block_groups = defaultdict(set)  # sets of Events to wait for
         self._temp_callback_ids = set()  # ids from CallbackRegistry
-        self._msg_cache = None  # may be used to hold recently processed msgs
+        self._msg_cache = None  # ReplayLog of msgs since the last checkpoint
+        self._replay_stats = dict.fromkeys(_REPLAY_STATS, 0)
+        self._plan_identity = None  # identifies the plan in the state file
+        self._recovered_state = None  # loaded by recover(), used by open_run
+        self._restored_descriptors = dict()  # {names: (uid, seq_num)}
+        self._primary_names = None  # names of the first 'save' Descriptor
+        self._profile = None  # LatencyProfile being recorded, if profiling
+        self._latency_profile = None  # LatencyProfile of the last run
         self._genstack = deque()  # stack of generators to work off of
         self._new_gen = True  # flag if we need to prime the generator
         self._exit_status = 'success'  # optimistic default
@@ -244,12 +290,18 @@ class RunEngine:
             'open_run': self._open_run,
             'close_run': self._close_run,
             'wait_for': self._wait_for,
+            'monitor': self._monitor,
+            'unmonitor': self._unmonitor,
         }
 
         # public dispatcher for callbacks processed on the main thread
         self.dispatcher = Dispatcher()
         self.ignore_callback_exceptions = True
         self.event_timeout = 0.1
+        self.replay_memory_budget = 100 * 2**20
+        self.replay_disk_budget = None
+        self.state_path = None
+        self.profile_latency = False
         self.subscribe = self.dispatcher.subscribe
         self.unsubscribe = self.dispatcher.unsubscribe
 
@@ -258,20 +310,20 @@ class RunEngine:
 
         self.verbose = False
 
-        loop.call_soon(self._check_for_trouble)
-        loop.call_soon(self._check_for_signals)
-
     def _clear_run_cache(self):
         self._metadata_per_run.clear()
         self._bundling = False
         self._run_is_open = False
+        self._tally_replay_log()
         self._msg_cache = None  # checkpoints can't rewind into a closed run
         self._objs_read.clear()
         self._read_cache.clear()
         self._describe_cache.clear()
         self._descriptor_uids.clear()
         self._sequence_counters.clear()
-        self._teed_sequence_counters.clear()
+        self._checkpoint_state = None
+        self._restored_descriptors.clear()
+        self._primary_names = None
         self._block_groups.clear()
 
     def _clear_call_cache(self):
@@ -286,6 +338,7 @@ class RunEngine:
         self._exit_status = 'success'
         self._reason = ''
         self._task = None
+        self._replay_stats = dict.fromkeys(_REPLAY_STATS, 0)
 
         # Unsubscribe for per-run callbacks.
         for cid in self._temp_callback_ids:
@@ -293,14 +346,81 @@ class RunEngine:
         self._temp_callback_ids.clear()
 
     def reset(self):
+        self._recovered_state = None
         self._clear_run_cache()
         self._clear_call_cache()
         self.dispatcher.unsubscribe_all()
 
+    @property
+    def latency_profile(self):
+        return self._latency_profile
+
     @property
     def resumable(self):
         return self._msg_cache is not None
 
+    @property
+    def replay_stats(self):
+        """
+        Statistics on the Messages kept for replay after a pause
+
+        Returns
+        -------
+        stats : dict
+            length, memory_bytes, disk_bytes
+                the current log (since the last checkpoint)
+            max_length, max_memory_bytes, max_disk_bytes
+                the largest values reached since this plan began
+            spilled
+                number of Messages written to a temporary file
+            unresumable
+                number of times the log exceeded its budget, leaving the run
+                unable to pause until its next checkpoint
+            rewinds, replayed
+                number of times the RunEngine rewound to a checkpoint (on
+                resume or suspend) and the number of Messages replayed
+        """
+        stats = dict(self._replay_stats)
+        log = self._msg_cache
+        if log is None:
+            current = (0, 0, 0)
+        else:
+            current = (len(log), log.memory_bytes, log.disk_bytes)
+            stats['spilled'] += log.spilled
+        for key, value in zip(['length', 'memory_bytes', 'disk_bytes'],
+                              current):
+            stats[key] = value
+            stats['max_' + key] = max(stats['max_' + key], value)
+        return stats
+
+    def _new_replay_log(self):
+        self._tally_replay_log()
+        self._msg_cache = ReplayLog(self.replay_memory_budget,
+                                    self.replay_disk_budget)
+
+    def _tally_replay_log(self):
+        # Fold the current log into the statistics before it is replaced.
+        log = self._msg_cache
+        if log is None:
+            return
+        stats = self._replay_stats
+        stats['max_length'] = max(stats['max_length'], len(log))
+        stats['max_memory_bytes'] = max(stats['max_memory_bytes'],
+                                        log.memory_bytes)
+        stats['max_disk_bytes'] = max(stats['max_disk_bytes'],
+                                      log.disk_bytes)
+        stats['spilled'] += log.spilled
+
+    def _rewind(self):
+        # Return a generator replaying the messages since the last
+        # checkpoint, and start recording them again.
+        replay = self._msg_cache
+        self._replay_stats['rewinds'] += 1
+        self._replay_stats['replayed'] += len(replay)
+        self._new_replay_log()
+        self._restore_run_state()
+        return (msg for msg in replay)
+
     @property
     def ignore_callback_exceptions(self):
         return not self.dispatcher.halt_on_exception
@@ -340,9 +460,12 @@ class RunEngine:
 
         If the RunEngine is currently paused, it will stay in the 'paused'
         state, and it will disallow resume() until all_is_well() is called.
+
+        This may be called from any thread.
         """
         self._panic = True
-        self._task.cancel()
+        # Wake the loop, even if it is blocked waiting on something else.
+        loop.call_soon_threadsafe(self._on_panic)
 
     def all_is_well(self):
         """
@@ -351,9 +474,6 @@ class RunEngine:
         If the panic occurred during a pause, the run can be resumed.
         """
         self._panic = False
-        # The cycle where _check_for_trouble schedules a future call to itself
-        # is broken when it raises a PanicError.
-        loop.call_later(0.1, self._check_for_trouble)
 
     def request_pause(self, defer=False, name=None, callback=None):
         """
@@ -390,12 +510,14 @@ class RunEngine:
             if self.state.can_pause:
                 print("Pausing...")
                 self.state = 'paused'
+                # We may be on another thread, so wake the loop rather than
+                # waiting for it to notice on its next iteration.
                 if self.resumable:
-                    loop.stop()
+                    loop.call_soon_threadsafe(loop.stop)
                 else:
                     print("No checkpoint; cannot pause. Aborting...")
                     self._exception = FailedPause()
-                    self._task.cancel()
+                    loop.call_soon_threadsafe(self._task.cancel)
             else:
                 print("Cannot pause from {0} state. "
                       "Ignoring request.".format(self.state))
@@ -496,6 +618,17 @@ class RunEngine:
             metadata['scan_args'] = scan_args
 
         self._metadata_per_call = metadata
+        # Only needed to save the state for recover().
+        self._plan_identity = None
+        if self.state_path is not None:
+            self._plan_identity = _plan_identity(plan)
+            if self._plan_identity is None:
+                msg = ("The plan {!r} cannot be told apart from other plans "
+                       "in another session, so its run cannot be "
+                       "recovered.".format(plan))
+                logger.warning(msg)
+                warnings.warn(msg)
+        self._profile = LatencyProfile() if self.profile_latency else None
 
         self.state = 'running'
         gen = iter(plan)  # no-op on generators; needed for classes
@@ -504,13 +637,16 @@ class RunEngine:
             gen = (msg for msg in gen)
         self._genstack.append(gen)
         self._new_gen = True
-        with SignalHandler(signal.SIGINT) as self._sigint_handler:  # ^C
-            self._task = loop.create_task(self._run())
-            loop.run_forever()
-            if self._task.done() and not self._task.cancelled():
-                exc = self._task.exception()
-                if exc is not None:
-                    raise exc
+        try:
+            with self._handle_sigint() as self._sigint_handler:  # ^C
+                self._task = loop.create_task(self._run())
+                loop.run_forever()
+        finally:
+            self._release_sigint()
+        if self._task.done() and not self._task.cancelled():
+            exc = self._task.exception()
+            if exc is not None:
+                raise exc
 
         return self._run_start_uids
 
@@ -544,45 +680,162 @@ class RunEngine:
         if outstanding_requests:
             return outstanding_requests
 
-        self._genstack.append((msg for msg in list(self._msg_cache)))
+        self._genstack.append(self._rewind())
         self._new_gen = True
-        self._msg_cache = deque()
-        self._sequence_counters.clear()
-        self._sequence_counters.update(self._teed_sequence_counters)
         self._resume_event_loop()
         return self._run_start_uids
 
     def _resume_event_loop(self):
         # may be called by 'resume' or 'abort'
         self.state = 'running'
-        with SignalHandler(signal.SIGINT) as self._sigint_handler:  # ^C
-            if self._task.done():
-                return
-            loop.run_forever()
-            if self._task.done() and not self._task.cancelled():
-                exc = self._task.exception()
-                if exc is not None:
-                    raise exc
+        if self._task.done():
+            return
+        try:
+            with self._handle_sigint() as self._sigint_handler:  # ^C
+                loop.run_forever()
+        finally:
+            self._release_sigint()
+        if self._task.done() and not self._task.cancelled():
+            exc = self._task.exception()
+            if exc is not None:
+                raise exc
+
+    def recover(self, plan, subs=None, path=None):
+        """
+        Reopen a run saved in a state file and continue it.
+
+        If a session crashes during a run, the run can be taken up again by a
+        new session, provided that ``state_path`` was set. The RunEngine does
+        not emit a new RunStart. Events continue the original run's Event
+        streams, with the same Descriptors and continuing seq_nums.
+
+        Parameters
+        ----------
+        plan : iterable
+            The same plan, made again. The built-in scans are skipped ahead
+            to the last checkpoint (see ``ScanBase.restarted``). Any other
+            plan must pick up where the original left off by itself,
+            beginning with an 'open_run' Message, which reopens the run.
+            It must be recognizably the same plan: a built-in scan with
+            the same parameters, a list of the same Messages, or a fresh
+            generator made by the same function with the same arguments.
+            Devices are compared by name, and arguments that can only be
+            told apart by their address in memory are refused.
+        subs : callable, list, or dict, optional
+            temporary subscriptions, as in ``__call__``
+        path : str, optional
+            the state file; ``state_path`` by default
+
+        Returns
+        -------
+        uids : list
+            list of Header uids (a.k.a RunStart uids) of run(s)
+
+        Examples
+        --------
+        In the first session:
+
+        >>> RE.state_path = 'run_engine_state.json'
+        >>> RE(my_scan)  # crashes
+
+        In a new session:
 
-    def request_suspend(self, fut):
+        >>> RE.state_path = 'run_engine_state.json'
+        >>> my_scan = ...  # as before
+        >>> RE.recover(my_scan)
+        """
+        if path is None:
+            path = self.state_path
+        if path is None:
+            raise ValueError("No state file was given and state_path is "
+                             "not set.")
+        with open(path) as f:
+            state = json.load(f)
+        identity = _plan_identity(plan)
+        if identity is None or state['plan'] is None:
+            raise ValueError("The plan cannot be identified, so it cannot "
+                             "be matched with the state file {!r}."
+                             "".format(path))
+        if state['plan'] != identity:
+            raise ValueError("The state file {!r} was saved by a different "
+                             "plan: {!r}".format(path, state['plan']))
+        if hasattr(plan, 'restarted'):
+            plan = plan.restarted(state['run_start'], state['points'])
+        self._recovered_state = state
+        try:
+            return self(plan, subs)
+        finally:
+            # Even if the plan never ran, do not reopen the run later.
+            self._recovered_state = None
+
+    def _save_state(self):
+        # Called at each checkpoint. Write a new file and then move it into
+        # place, so that a crash never leaves a partial file.
+        descriptors = [dict(names=names, uid=uid, seq_num=seq_num)
+                       for names, (uid, seq_num)
+                       in self._restored_descriptors.items()]
+        for key, uid in self._descriptor_uids.items():
+            descriptors.append(dict(names=_descriptor_names(key), uid=uid,
+                                    seq_num=self._sequence_counters[key]))
+        run_start = dict(self._metadata_per_run, uid=self._run_start_uid)
+        # The points taken are the Events in the primary stream.
+        points = next((d['seq_num'] for d in descriptors
+                       if d['names'] == self._primary_names), 0)
+        state = dict(plan=self._plan_identity, run_start=run_start,
+                     descriptors=descriptors, primary=self._primary_names,
+                     points=points, time=ttime.time())
+        path = os.path.abspath(self.state_path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix='.tmp-bluesky-state-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f, default=_jsonable)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _remove_state(self):
+        if self.state_path is not None and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def _adopt_descriptor(self, key):
+        # When recovering a run, reuse a Descriptor from the original run
+        # instead of emitting a new one.
+        restored = self._restored_descriptors.pop(_descriptor_names(key),
+                                                  None)
+        if restored is None:
+            return False
+        uid, seq_num = restored
+        self._descriptor_uids[key] = uid
+        self._sequence_counters[key] = seq_num
+        return True
+
+    def request_suspend(self, fut, callback=None):
         """
         Request that the run suspend itself until the future is finished.
 
         Parameters
         ----------
         fut : asyncio.Future
+        callback : callable, optional
+            Called with no arguments if the run ends, or is aborted, before
+            ``fut`` is done. It is called when the run ends, before the
+            RunEngine returns.
         """
+        if callback is not None:
+            self._suspensions.append((fut, callback))
         if not self.resumable:
             print("No checkpoint; cannot suspend. Aborting...")
             self._exception = FailedPause()
         else:
             print("Suspending....To get prompt hit Ctrl-C to pause the scan")
             wait_msg = Msg('wait_for', [fut, ])
-            new_msg_lst = [wait_msg, ] + list(self._msg_cache)
-            self._sequence_counters.clear()
-            self._sequence_counters.update(self._teed_sequence_counters)
-            self._msg_cache = deque()
-            self._genstack.append((msg for msg in new_msg_lst))
+            replay = self._rewind()
+            self._genstack.append(
+                (msg for msg in itertools.chain([wait_msg], replay)))
             self._new_gen = True
 
     def abort(self, reason=''):
@@ -610,6 +863,7 @@ class RunEngine:
     def _run(self):
         response = None
         self._reason = ''
+        self._check_for_trouble()  # in case we panicked before we started
         try:
             while True:
                 if self._exception is not None:
@@ -629,12 +883,17 @@ class RunEngine:
                         msg.command not in self._UNCACHEABLE_COMMANDS):
                     # We have a checkpoint.
                     self._msg_cache.append(msg)
+                    if self._msg_cache.overflow is not None:
+                        self._drop_replay_log()
                 self._new_gen = False
                 coro = self._command_registry[msg.command]
                 logger.debug("Processing message %r", msg)
                 self.debug("About to process: {0}, {1}".format(coro, msg))
                 yield from asyncio.sleep(0.001)  # TODO Do we need this?
-                response = yield from coro(msg)
+                if self._profile is None:
+                    response = yield from coro(msg)
+                else:
+                    response = yield from self._profiled(coro, msg)
                 self.debug('RE.state: ' + self.state)
                 self.debug('msg: {}\n   response: {}'.format(msg, response))
         except (StopIteration, RequestStop):
@@ -655,6 +914,7 @@ class RunEngine:
             raise err
         finally:
             self.state = 'idle'
+            self._recovered_state = None
             # in case we were interrupted between 'configure' and 'deconfigure'
             for obj in self._configured:
                 try:
@@ -681,45 +941,88 @@ class RunEngine:
                 yield from self._close_run(Msg('close_run'))
                 self._run_is_open = False
 
+            # Let whoever requested a suspension know that it is over.
+            suspensions, self._suspensions = self._suspensions, list()
+            for fut, callback in suspensions:
+                if not fut.done():
+                    try:
+                        callback()
+                    except Exception:
+                        logger.error("Failed to end a suspension: %r",
+                                     callback)
+
             for task in asyncio.Task.all_tasks(loop):
                 task.cancel()
             loop.stop()
 
-    def _check_for_trouble(self):
-        if self.state.is_running:
-            # Check for panic.
-            if self._panic:
-                self._exit_status = 'fail'
-                exc = PanicError("Something told the Run Engine to "
-                                 "panic after the run began. "
-                                 "Records were created, but the run "
-                                 "was marked with "
-                                 "exit_status='fail'.")
-                self._exception = exc  # will stop _run coroutine
+    @asyncio.coroutine
+    def _profiled(self, coro, msg):
+        # Process msg, timing it by command and by object.
+        profile = self._profile
+        start = ttime.perf_counter()
+        try:
+            return (yield from coro(msg))
+        finally:
+            elapsed = ttime.perf_counter() - start
+            profile.record('commands', msg.command, elapsed)
+            if msg.obj is not None:
+                profile.record('objects', _obj_name(msg.obj), elapsed)
+
+    def _drop_replay_log(self):
+        reason = self._msg_cache.overflow
+        self._replay_stats['unresumable'] += 1
+        self._tally_replay_log()
+        self._msg_cache = None
+        msg = ("The run cannot be paused or suspended until it reaches "
+               "another checkpoint: {}. (See RunEngine.replay_memory_budget "
+               "and replay_disk_budget.)".format(reason))
+        logger.warning(msg)
+        warnings.warn(msg)
 
-        loop.call_later(0.1, self._check_for_trouble)
+    def _check_for_trouble(self):
+        if self.state.is_running and self._panic:
+            self._exit_status = 'fail'
+            exc = PanicError("Something told the Run Engine to "
+                             "panic after the run began. "
+                             "Records were created, but the run "
+                             "was marked with "
+                             "exit_status='fail'.")
+            self._exception = exc  # will stop _run coroutine
+            return True
+        return False
+
+    def _on_panic(self):
+        if self._check_for_trouble():
+            self._task.cancel()  # in case _run is blocked, waiting
+
+    def _on_sigint(self):
+        # Pause on Ctrl+C. If a second Ctrl+C arrives within 0.5 seconds,
+        # abort instead.
+        if not self.state.is_running:
+            return
+        if self._sigint_timer is None:
+            self.debug("RunEngine detected a SIGINT (Ctrl+C)")
+            self._sigint_timer = loop.call_later(0.5, self._sigint_pause)
+        else:
+            self.debug("RunEngine detected a second SIGINT")
+            self._sigint_timer.cancel()
+            self._sigint_timer = None
+            self.abort("SIGINT (Ctrl+C)")
 
-    def _check_for_signals(self):
-        # Check for pause requests from keyboard.
+    def _sigint_pause(self):
+        self._sigint_timer = None
         if self.state.is_running:
-            if self._sigint_handler.interrupted:
-                self._sigint_handler.interrupted = False
-                with SignalHandler(signal.SIGINT) as second_sigint_handler:
-                    self.debug("RunEngine detected a SIGINT (Ctrl+C)")
-                    # We know we will either pause or abort, so we can
-                    # hold up the scan now. Wait until 0.5 seconds pass or
-                    # we catch a second SIGINT, whichever happens first.
-                    for i in range(10):
-                        ttime.sleep(0.05)
-                        if second_sigint_handler.interrupted:
-                            self.debug("RunEngine detected as second SIGINT")
-                            loop.call_soon(self.abort, "SIGINT (Ctrl+C)")
-                            break
-                    else:
-                        loop.call_soon(self.request_pause, False, 'SIGINT')
-                        print(PAUSE_MSG)
+            self.request_pause(False, 'SIGINT')
+            print(PAUSE_MSG)
+
+    def _handle_sigint(self):
+        return LoopSignalHandler(signal.SIGINT, self._on_sigint, loop)
 
-        loop.call_later(0.1, self._check_for_signals)
+    def _release_sigint(self):
+        self._sigint_handler = None
+        if self._sigint_timer is not None:
+            self._sigint_timer.cancel()
+            self._sigint_timer = None
 
     def increment_scan_id(self):
         scan_id = self.md.get('scan_id', 0) + 1
@@ -739,6 +1042,9 @@ class RunEngine:
                                          "received before the 'open_run' "
                                          "message")
         self._clear_run_cache()
+        if self._recovered_state is not None:
+            self._reopen_run()
+            return
         self._run_start_uid = new_uid()
         self._run_start_uids.append(self._run_start_uid)
         # Metadata can come from history, __call__, or the open_run Msg.
@@ -770,15 +1076,40 @@ class RunEngine:
         self.debug("*** Emitted RunStart:\n%s" % doc)
         logger.debug("Starting new run:  %s", self._run_start_uid)
 
+    def _reopen_run(self):
+        # Take up the run in the state file loaded by recover().
+        state = self._recovered_state
+        self._recovered_state = None
+        run_start = dict(state['run_start'])
+        self._run_start_uid = run_start.pop('uid')
+        self._run_start_uids.append(self._run_start_uid)
+        self._metadata_per_run = run_start
+        for d in state['descriptors']:
+            self._restored_descriptors[tuple(d['names'])] = (d['uid'],
+                                                             d['seq_num'])
+        if state['primary'] is not None:
+            self._primary_names = tuple(state['primary'])
+        self._run_is_open = True
+        logger.debug("Reopening run %s", self._run_start_uid)
+
     @asyncio.coroutine
     def _close_run(self, msg):
+        # Stop monitoring before the RunStop so no Events follow it.
+        for obj in list(self._monitor_params):
+            yield from self._unmonitor(Msg('unmonitor', obj))
         doc = dict(run_start=self._run_start_uid,
                    time=ttime.time(), uid=new_uid(),
                    exit_status=self._exit_status,
                    reason=self._reason)
+        if self._profile is not None:
+            # Everything up to the RunStop itself; the next run starts afresh.
+            doc['latency_profile'] = self._profile.summary()
+            self._latency_profile = self._profile
+            self._profile = LatencyProfile()
         yield from self.emit(DocumentNames.stop, doc)
         self.debug("*** Emitted RunStop:\n%s" % doc)
         self._run_is_open = False
+        self._remove_state()  # There is nothing left to recover.
         logger.debug("Stopping run %s with run_stop %s",
                      self._run_start_uid, doc['uid'])
 
@@ -814,7 +1145,8 @@ class RunEngine:
         objs_read = frozenset(self._objs_read)
 
         # Event Descriptor
-        if objs_read not in self._descriptor_uids:
+        if (objs_read not in self._descriptor_uids and
+                not self._adopt_descriptor(objs_read)):
             # We don't not have an Event Descriptor for this set.
             data_keys = {}
             [data_keys.update(self._describe_cache[obj]) for obj in objs_read]
@@ -825,13 +1157,16 @@ class RunEngine:
             yield from self.emit(DocumentNames.descriptor, doc)
             self.debug("*** Emitted Event Descriptor:\n%s" % doc)
             self._descriptor_uids[objs_read] = descriptor_uid
-            self._sequence_counters[objs_read] = count(1)
+            self._sequence_counters[objs_read] = 0
+            if self._primary_names is None:
+                self._primary_names = _descriptor_names(objs_read)
         else:
             descriptor_uid = self._descriptor_uids[objs_read]
         self._bundling = False
 
         # Events
-        seq_num = next(self._sequence_counters[objs_read])
+        seq_num = self._sequence_counters[objs_read] + 1
+        self._sequence_counters[objs_read] = seq_num
         event_uid = new_uid()
         # Merge list of readings into single dict.
         readings = {k: v for d in self._read_cache for k, v in d.items()}
@@ -844,13 +1179,101 @@ class RunEngine:
         yield from self.emit(DocumentNames.event, doc)
         self.debug("*** Emitted Event:\n%s" % doc)
 
+    @asyncio.coroutine
+    def _monitor(self, msg):
+        """
+        Emit an Event, in a separate Event stream, each time obj updates.
+
+        Expected message object is:
+
+            Msg('monitor', obj)
+
+        where obj has the methods subscribe(callback) and clear_sub(callback).
+        The callback may be called from any thread; it only schedules the
+        Event, and obj is read on the event loop, between other messages,
+        without blocking the scan.
+        """
+        obj = msg.obj
+        if not self._run_is_open:
+            raise IllegalMessageSequence("A 'monitor' message must come "
+                                         "after 'open_run'.")
+        if obj in self._monitor_params:
+            # Already monitoring, e.g., because this message was replayed.
+            return
+        data_keys = obj.describe()
+        _fill_missing_fields(data_keys)
+        # Like a flyer's streams, a monitor's stream is keyed by data keys.
+        key = frozenset(data_keys)
+        if (key not in self._descriptor_uids and
+                not self._adopt_descriptor(key)):
+            descriptor_uid = new_uid()
+            doc = dict(run_start=self._run_start_uid, time=ttime.time(),
+                       data_keys=data_keys, uid=descriptor_uid)
+            yield from self.emit(DocumentNames.descriptor, doc)
+            self.debug("*** Emitted Event Descriptor:\n%s" % doc)
+            self._descriptor_uids[key] = descriptor_uid
+            self._sequence_counters[key] = 0
+
+        def emit_event(*args, **kwargs):
+            # Do nothing else on the device's thread.
+            loop.call_soon_threadsafe(self._emit_monitor_event, obj,
+                                      emit_event)
+
+        self._monitor_params[obj] = (emit_event, key)
+        obj.subscribe(emit_event)
+
+    def _emit_monitor_event(self, obj, cb):
+        # This runs as a bare callback on the loop, outside the _run task, so
+        # hand any error to _run to raise, as it would for any other Event.
+        params = self._monitor_params.get(obj)
+        if params is None or params[0] is not cb:
+            # The monitor was removed after this update was scheduled.
+            return
+        _, key = params
+        try:
+            readings = {k: {'value': _sanitize_np(v['value']),
+                            'timestamp': v['timestamp']}
+                        for k, v in obj.read().items()}
+            data, timestamps = _rearrange_into_parallel_dicts(readings)
+            seq_num = self._sequence_counters[key] + 1
+            self._sequence_counters[key] = seq_num
+            doc = dict(descriptor=self._descriptor_uids[key],
+                       time=ttime.time(), data=data, timestamps=timestamps,
+                       seq_num=seq_num, uid=new_uid())
+            self._emit(DocumentNames.event, doc)
+        except Exception as err:
+            logger.error("Failed to emit an Event from the monitor on %r",
+                         obj)
+            if self._exception is None:
+                self._exception = err
+            return
+        self.debug("*** Emitted Event:\n%s" % doc)
+
+    @asyncio.coroutine
+    def _unmonitor(self, msg):
+        """
+        Stop monitoring obj.
+
+        Expected message object is:
+
+            Msg('unmonitor', obj)
+        """
+        obj = msg.obj
+        params = self._monitor_params.pop(obj, None)
+        if params is None:
+            return
+        cb, _ = params
+        obj.clear_sub(cb)
+
     @asyncio.coroutine
     def _kickoff(self, msg):
         obj = msg.obj
         self._uncollected.add(obj)
-        block_group = msg.kwargs.pop('block_group', None)
+        # Copy the kwargs: the message may be replayed after a pause.
+        kwargs = dict(msg.kwargs)
+        block_group = kwargs.pop('block_group', None)
         self._movable_objs_touched.add(obj)
-        ret = obj.kickoff(*msg.args, **msg.kwargs)
+        ret = obj.kickoff(*msg.args, **kwargs)
 
         if block_group:
             p_event = asyncio.Event()
@@ -859,7 +1282,7 @@ class RunEngine:
                 loop.call_soon_threadsafe(p_event.set)
 
             ret.finished_cb = done_callback
-            self._block_groups[block_group].add(p_event.wait())
+            self._block_groups[block_group].add(p_event)
 
         return ret
 
@@ -869,7 +1292,8 @@ class RunEngine:
         data_keys_list = obj.describe()
         for data_keys in data_keys_list:
             objs_read = frozenset(data_keys)
-            if objs_read not in self._descriptor_uids:
+            if (objs_read not in self._descriptor_uids and
+                    not self._adopt_descriptor(objs_read)):
                 # We don't not have an Event Descriptor for this set.
                 descriptor_uid = new_uid()
                 doc = dict(run_start=self._run_start_uid, time=ttime.time(),
@@ -877,11 +1301,12 @@ class RunEngine:
                 yield from self.emit(DocumentNames.descriptor, doc)
                 self.debug("Emitted Event Descriptor:\n%s" % doc)
                 self._descriptor_uids[objs_read] = descriptor_uid
-                self._sequence_counters[objs_read] = count(1)
+                self._sequence_counters[objs_read] = 0
 
         for ev in obj.collect():
             objs_read = frozenset(ev['data'])
-            seq_num = next(self._sequence_counters[objs_read])
+            seq_num = self._sequence_counters[objs_read] + 1
+            self._sequence_counters[objs_read] = seq_num
             descriptor_uid = self._descriptor_uids[objs_read]
             event_uid = new_uid()
 
@@ -895,7 +1320,11 @@ class RunEngine:
             yield from self.emit(DocumentNames.event, ev)
             self.debug("Emitted Event:\n%s" % ev)
 
-        self._uncollected.remove(msg.obj)
+        # Flyers may be collected repeatedly while they are flying. Keep
+        # track of them until they are done so that any remaining data is
+        # collected at the end of the run.
+        if getattr(msg.obj, 'done', True):
+            self._uncollected.discard(msg.obj)
 
     @asyncio.coroutine
     def _null(self, msg):
@@ -903,44 +1332,76 @@ class RunEngine:
 
     @asyncio.coroutine
     def _set(self, msg):
-        block_group = msg.kwargs.pop('block_group', None)
+        kwargs = dict(msg.kwargs)
+        block_group = kwargs.pop('block_group', None)
         self._movable_objs_touched.add(msg.obj)
-        ret = msg.obj.set(*msg.args, **msg.kwargs)
+        ret = msg.obj.set(*msg.args, **kwargs)
         if block_group:
             p_event = asyncio.Event()
-
-            def done_callback():
-                loop.call_soon_threadsafe(p_event.set)
-
-            ret.finished_cb = done_callback
-            self._block_groups[block_group].add(p_event.wait())
+            ret.finished_cb = self._status_callback(p_event, msg.obj)
+            self._block_groups[block_group].add(p_event)
 
         return ret
 
     @asyncio.coroutine
     def _trigger(self, msg):
-        block_group = msg.kwargs.pop('block_group', None)
-        ret = msg.obj.trigger(*msg.args, **msg.kwargs)
-
-        if block_group:
+        kwargs = dict(msg.kwargs)
+        block_group = kwargs.pop('block_group', None)
+        # Optionally, a second group that is done once the exposure is over.
+        # Only devices that declare their readout safe to overlap with motion
+        # (and provide a status for the exposure alone) finish early;
+        # otherwise it is done when the whole trigger is done.
+        exposure_group = kwargs.pop('exposure_group', None)
+        ret = msg.obj.trigger(*msg.args, **kwargs)
+
+        if block_group or exposure_group:
             p_event = asyncio.Event()
+            ret.finished_cb = self._status_callback(p_event, msg.obj)
+            if block_group:
+                self._block_groups[block_group].add(p_event)
+            if exposure_group:
+                exposure = getattr(ret, 'exposure', None)
+                safe = getattr(msg.obj, 'motion_safe_phases', ())
+                if exposure is not None and 'readout' in safe:
+                    e_event = asyncio.Event()
+                    exposure.finished_cb = self._status_callback(e_event)
+                    self._block_groups[exposure_group].add(e_event)
+                else:
+                    self._block_groups[exposure_group].add(p_event)
 
+        return ret
+
+    def _status_callback(self, event, obj=None):
+        # Make a finished_cb, which may be called from any thread, that sets
+        # event. When profiling, also time how long obj took to finish.
+        if self._profile is None or obj is None:
             def done_callback():
-                loop.call_soon_threadsafe(p_event.set)
+                loop.call_soon_threadsafe(event.set)
+            return done_callback
 
-            ret.finished_cb = done_callback
-            self._block_groups[block_group].add(p_event.wait())
+        profile = self._profile
+        key = _obj_name(obj)
+        start = ttime.perf_counter()
 
-        return ret
+        def done_callback():
+            elapsed = ttime.perf_counter() - start
+            loop.call_soon_threadsafe(profile.record, 'completion', key,
+                                      elapsed)
+            loop.call_soon_threadsafe(event.set)
+        return done_callback
 
     @asyncio.coroutine
     def _wait(self, msg):
         # Block progress until every object that was trigged
         # triggered with the keyword argument `block=group` is done.
         group = msg.kwargs.get('group', msg.args[0])
-        objs = list(self._block_groups.pop(group, []))
+        objs = [event.wait() for event in self._block_groups.pop(group, [])]
         if objs:
-            yield from self._wait_for(Msg('wait_for', objs))
+            if self._profile is None:
+                yield from self._wait_for(Msg('wait_for', objs))
+            else:
+                with self._profile.timer('groups', _obj_name(group)):
+                    yield from self._wait_for(Msg('wait_for', objs))
 
     @asyncio.coroutine
     def _sleep(self, msg):
@@ -955,19 +1416,57 @@ class RunEngine:
         if self._bundling:
             raise IllegalMessageSequence("Cannot 'checkpoint' after 'create' "
                                          "and before 'save'. Aborting!")
-        self._msg_cache = deque()
+        self._new_replay_log()
 
-        # Keep a safe separate copy of the sequence counters to use if we
-        # rewind and retake some data points.
-        for key, counter in list(self._sequence_counters.items()):
-            counter_copy1, counter_copy2 = tee(counter)
-            self._sequence_counters[key] = counter_copy1
-            self._teed_sequence_counters[key] = counter_copy2
+        # Keep a copy of the per-run state to use if we rewind and retake
+        # some data points.
+        self._snapshot_run_state()
+        if self.state_path is not None and self._run_is_open:
+            self._save_state()
 
         if self._deferred_pause_requested:
             self.state = 'paused'
             loop.stop()
 
+    def _snapshot_run_state(self):
+        # The cost depends on the number of Event streams and pending block
+        # groups, not on the number of checkpoints that came before.
+        # (There is no bundling state to keep: we cannot checkpoint while
+        # bundling.)
+        # Monitor streams are snapshotted too, but see _restore_run_state.
+        self._checkpoint_state = _RunState(
+            dict(self._descriptor_uids),
+            dict(self._sequence_counters),
+            dict(self._restored_descriptors),
+            {group: set(events)
+             for group, events in self._block_groups.items()})
+
+    def _restore_run_state(self):
+        # Copy, so that we can rewind to the same checkpoint again.
+        state = self._checkpoint_state
+        # Monitor Events are not retaken when we rewind, so their streams
+        # keep counting from where they are. Any other stream that began
+        # after the checkpoint is forgotten, and gets a new Descriptor when
+        # its data is retaken.
+        monitored = [(key, self._descriptor_uids[key],
+                      self._sequence_counters[key])
+                     for _, key in self._monitor_params.values()]
+        self._descriptor_uids.clear()
+        self._descriptor_uids.update(state.descriptor_uids)
+        self._sequence_counters.clear()
+        self._sequence_counters.update(state.sequence_counters)
+        for key, uid, seq_num in monitored:
+            self._descriptor_uids[key] = uid
+            self._sequence_counters[key] = seq_num
+        self._restored_descriptors.clear()
+        self._restored_descriptors.update(state.restored_descriptors)
+        self._block_groups.clear()
+        for group, events in state.block_groups.items():
+            self._block_groups[group] = set(events)
+        self._bundling = False
+        self._objs_read.clear()
+        self._read_cache.clear()
+
     @asyncio.coroutine
     def _logbook(self, msg):
         if self.logbook:
@@ -1030,8 +1529,28 @@ class RunEngine:
     @asyncio.coroutine
     def emit(self, name, doc):
         "Process blocking callbacks and schedule non-blocking callbacks."
+        self._emit(name, doc)
+
+    def _emit(self, name, doc):
+        if self._profile is not None:
+            self._profiled_emit(name, doc)
+            return
         jsonschema.validate(doc, schemas[name])
         self._scan_cb_registry.process(name, name.name, doc)
+        self._dispatch(name, doc)
+
+    def _profiled_emit(self, name, doc):
+        # The same as _emit, with each step timed.
+        profile = self._profile
+        with profile.timer('emit', 'validation'):
+            jsonschema.validate(doc, schemas[name])
+        with profile.timer('emit', 'scan_callbacks'):
+            self._scan_cb_registry.process(name, name.name, doc)
+        # Events are dispatched in another thread; this times scheduling.
+        with profile.timer('emit', 'dispatch'):
+            self._dispatch(name, doc)
+
+    def _dispatch(self, name, doc):
         if name != DocumentNames.event:
             self.dispatcher.process(name, doc)
             logger.info("Emitting %s document: %r", name.name, doc)
@@ -1111,6 +1630,317 @@ class Dispatcher:
             self.unsubscribe(public_token)
 
 
+class ReplayLog:
+    """
+    The Messages processed since the last checkpoint, kept for replay.
+
+    Messages are held in memory up to a budget. After that, they are
+    serialized to a temporary file. Only plain data (numbers, strings, numpy
+    arrays, and containers of these) is serialized; the log keeps references
+    to everything else, such as devices.
+
+    Parameters
+    ----------
+    memory_budget : int or None
+        approximate number of bytes of message data to hold in memory; if
+        None, there is no limit
+    disk_budget : int or None
+        maximum size of the temporary file, in bytes; if None, there is no
+        limit
+
+    Attributes
+    ----------
+    memory_bytes : int
+        estimated size of the messages held in memory
+    disk_bytes : int
+        size of the temporary file
+    spilled : int
+        number of messages in the temporary file
+    overflow : str or None
+        If messages were lost (because a budget was exceeded or a message
+        could not be serialized), the reason. The log cannot be replayed.
+    """
+    def __init__(self, memory_budget=None, disk_budget=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.spilled = 0
+        self.overflow = None
+        self._memory = deque()
+        self._file = None
+        self._refs = []  # objects referred to, not serialized
+
+    def __len__(self):
+        return len(self._memory) + self.spilled
+
+    def append(self, msg):
+        if self.overflow is not None:
+            return
+        if self._file is None:
+            size = _nbytes(msg)
+            if (self.memory_budget is None or
+                    self.memory_bytes + size <= self.memory_budget):
+                self._memory.append(msg)
+                self.memory_bytes += size
+                return
+            # From now on, everything goes to disk, to keep the order.
+            self._file = tempfile.TemporaryFile()
+        try:
+            _RefPickler(self._file, self._refs).dump(tuple(msg))
+        except Exception as err:
+            self._overflow("could not serialize {!r}: {}".format(msg, err))
+            return
+        self.spilled += 1
+        self.disk_bytes = self._file.tell()
+        if self.disk_budget is not None and self.disk_bytes > self.disk_budget:
+            self._overflow("the replay log exceeded its disk budget of {} "
+                           "bytes".format(self.disk_budget))
+
+    def _overflow(self, reason):
+        self.overflow = reason
+        self._memory.clear()
+        self._refs.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __iter__(self):
+        if self.overflow is not None:
+            raise RuntimeError("Messages have been lost: " + self.overflow)
+        yield from self._memory
+        if self._file is None:
+            return
+        self._file.seek(0)
+        unpickler = _RefUnpickler(self._file, self._refs)
+        for _ in range(self.spilled):
+            command, obj, args, kwargs = unpickler.load()
+            yield Msg(command, obj, *args, **kwargs)
+
+
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes, tuple,
+                list, dict, set, frozenset, np.ndarray, np.generic)
+
+
+class _RefPickler(pickle.Pickler):
+    # Serialize plain data; refer to anything else by its index in refs.
+    def __init__(self, file, refs):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._refs = refs
+
+    def persistent_id(self, obj):
+        if isinstance(obj, _PLAIN_TYPES):
+            return None
+        self._refs.append(obj)
+        return len(self._refs) - 1
+
+
+class _RefUnpickler(pickle.Unpickler):
+    def __init__(self, file, refs):
+        super().__init__(file)
+        self._refs = refs
+
+    def persistent_load(self, pid):
+        return self._refs[pid]
+
+
+def _nbytes(obj):
+    "Estimate the size of the plain data in obj, counting others as pointers"
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_nbytes(k) + _nbytes(v)
+                                        for k, v in obj.items())
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        return sys.getsizeof(obj) + sum(_nbytes(item) for item in obj)
+    if isinstance(obj, _PLAIN_TYPES):
+        return sys.getsizeof(obj)
+    return 8
+
+
+class Histogram:
+    """
+    Durations, counted in bins whose edges are powers of two seconds.
+
+    Attributes
+    ----------
+    count : int
+        number of durations recorded
+    total : float
+        their sum, in seconds
+    min, max : float or None
+        the shortest and longest, in seconds
+    bins : dict
+        maps the upper edge of each bin (e.g., 2**-10 s, about 1 ms) to the
+        number of durations in it
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+        self.bins = defaultdict(int)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        if seconds > 0:
+            self.bins[math.ldexp(1, math.frexp(seconds)[1])] += 1
+        else:
+            self.bins[0.] += 1
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def summary(self):
+        "Return the statistics as a dict of plain data, for a document."
+        return dict(count=self.count, total=self.total, mean=self.mean,
+                    min=self.min, max=self.max,
+                    bins=[[edge, self.bins[edge]]
+                          for edge in sorted(self.bins)])
+
+    def __repr__(self):
+        return ("<Histogram count={} total={:.6f}s>"
+                "".format(self.count, self.total))
+
+
+class LatencyProfile:
+    """
+    Where the RunEngine spent its time, as Histograms of wall time.
+
+    The RunEngine records one when ``RunEngine.profile_latency`` is True.
+
+    Attributes
+    ----------
+    commands : dict
+        maps each Msg command to the time taken to process it
+    objects : dict
+        maps each object (by name) to the time taken to process Msgs on it
+    completion : dict
+        maps each object (by name) to the time from 'set' or 'trigger' until
+        its status finished (only if the Msg had a ``block_group``)
+    groups : dict
+        maps each block group to the time spent in 'wait' for it
+    emit : dict
+        time spent emitting documents, split into 'validation',
+        'scan_callbacks' and 'dispatch'
+    """
+    _CATEGORIES = ['commands', 'objects', 'completion', 'groups', 'emit']
+
+    def __init__(self):
+        for category in self._CATEGORIES:
+            setattr(self, category, defaultdict(Histogram))
+
+    def record(self, category, key, seconds):
+        getattr(self, category)[key].record(seconds)
+
+    def timer(self, category, key):
+        "Context manager that records the time spent inside it."
+        return _Timer(self, category, key)
+
+    def summary(self):
+        "Return all the Histograms as dicts of plain data, for a document."
+        return {category: {key: hist.summary() for key, hist
+                           in getattr(self, category).items()}
+                for category in self._CATEGORIES}
+
+
+class _Timer:
+    def __init__(self, profile, category, key):
+        self._profile = profile
+        self._category = category
+        self._key = key
+
+    def __enter__(self):
+        self._start = ttime.perf_counter()
+
+    def __exit__(self, *exc):
+        self._profile.record(self._category, self._key,
+                             ttime.perf_counter() - self._start)
+
+
+def _plan_identity(plan):
+    # Enough to recognize the same plan in another session, with devices
+    # identified by name: the built-in scans' parameters, a generator's
+    # function and arguments, or a list's Messages. None if the plan cannot
+    # be told apart from others.
+    identity = {'scan_type': type(plan).__name__,
+                'name': getattr(plan, '__name__', None)}
+    if hasattr(plan, '_fields'):
+        identity['scan_args'] = {field: getattr(plan, field)
+                                 for field in plan._fields}
+    elif isinstance(plan, types.GeneratorType):
+        if inspect.getgeneratorstate(plan) != inspect.GEN_CREATED:
+            # Its arguments may have been reassigned since.
+            return None
+        identity['name'] = _qualified_name(
+            plan, plan.gi_frame.f_globals.get('__name__'))
+        # Before it starts, the generator's locals are its arguments.
+        identity['args'] = dict(plan.gi_frame.f_locals)
+    elif isinstance(plan, (list, tuple)):
+        identity['msgs'] = list(plan)
+    else:
+        return None
+    try:
+        return json.loads(json.dumps(identity, default=_identifying))
+    except ValueError:
+        return None
+
+
+def _qualified_name(obj, module=None):
+    if module is None:
+        module = obj.__module__
+    return '{}.{}'.format(module, getattr(obj, '__qualname__', obj.__name__))
+
+
+def _identifying(obj):
+    "Like _jsonable, but refuse what only this session can tell apart"
+    if isinstance(getattr(obj, 'name', None), str):
+        return obj.name
+    if isinstance(obj, (types.FunctionType, types.BuiltinFunctionType,
+                        type)):
+        return _qualified_name(obj)
+    ret = _jsonable(obj)
+    if isinstance(ret, str) and '{:x}'.format(id(obj)) in ret.lower():
+        # Its only description includes its address in memory.
+        raise ValueError("{!r} cannot be identified".format(obj))
+    return ret
+
+
+def _jsonable(obj):
+    "Convert what json cannot; for use as json.dump(..., default=_jsonable)"
+    if hasattr(obj, 'tolist'):  # numpy arrays and scalars
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=_obj_name)
+    if isinstance(obj, Trajectory):
+        return obj.to_dict(_obj_name)
+    if hasattr(obj, 'by_key'):  # a cycler
+        return {_obj_name(k): v for k, v in obj.by_key().items()}
+    return _obj_name(obj)
+
+
+def _descriptor_names(key):
+    # Descriptors are keyed on a set of objects (or of data keys, for
+    # flyers). Identify them by name instead, which outlasts the session.
+    return tuple(sorted(_obj_name(obj) for obj in key))
+
+
+def _obj_name(obj):
+    # A name for obj that can go in a document or a file.
+    name = getattr(obj, 'name', None)
+    if isinstance(name, str):
+        return name
+    return str(obj)
+
+
 def new_uid():
     return str(uuid.uuid4())
 
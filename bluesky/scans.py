@@ -1,11 +1,102 @@
-from collections import deque, defaultdict
+from collections import defaultdict, OrderedDict
+import copy
+import heapq
 import itertools
+import threading
+import time as ttime
 from boltons.iterutils import chunked
-from cycler import cycler
 from lmfit.models import GaussianModel, LinearModel
 import numpy as np
 from .run_engine import Msg
-from .utils import Struct, snake_cyclers
+from .utils import Struct, Trajectory
+
+
+class CheckpointPolicy:
+    """
+    Decide where a scan takes checkpoints.
+
+    A paused scan resumes from its last checkpoint, repeating every point
+    taken since. Fewer checkpoints cost less time but repeat more on resume.
+    A scan always takes a checkpoint before its first point. After that, it
+    asks its policy before each point.
+    """
+    def due(self, points, elapsed, new_row):
+        """
+        Whether to take a checkpoint before the next point
+
+        Parameters
+        ----------
+        points : int
+            number of points taken since the last checkpoint
+        elapsed : float
+            seconds since the last checkpoint
+        new_row : bool
+            whether the next point begins a new row of a mesh (i.e., the
+            fastest axis starts over)
+
+        Returns
+        -------
+        due : bool
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+
+class EveryPoint(CheckpointPolicy):
+    "Take a checkpoint before every point."
+    def due(self, points, elapsed, new_row):
+        return True
+
+
+class EveryNPoints(CheckpointPolicy):
+    """
+    Take a checkpoint before every Nth point.
+
+    Parameters
+    ----------
+    num : int
+    """
+    def __init__(self, num):
+        if num < 1:
+            raise ValueError("num must be at least 1")
+        self.num = num
+
+    def due(self, points, elapsed, new_row):
+        return points >= self.num
+
+    def __repr__(self):
+        return 'EveryNPoints({!r})'.format(self.num)
+
+
+class EverySeconds(CheckpointPolicy):
+    """
+    Take a checkpoint before the first point at least T seconds after the
+    last checkpoint.
+
+    Parameters
+    ----------
+    seconds : float
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def due(self, points, elapsed, new_row):
+        return elapsed >= self.seconds
+
+    def __repr__(self):
+        return 'EverySeconds({!r})'.format(self.seconds)
+
+
+class EveryRow(CheckpointPolicy):
+    """
+    Take a checkpoint at the start of each row of a mesh.
+
+    Scans without rows take only the checkpoint before their first point.
+    """
+    def due(self, points, elapsed, new_row):
+        return new_row
 
 
 class ScanBase(Struct):
@@ -27,19 +118,127 @@ class ScanBase(Struct):
     you should provide an instance level ``_fields`` so that the logbook
     related messages will work.
     """
+    # Objects whose updates are recorded, in their own Event streams, for
+    # the duration of the run instead of being read at every point. Set per
+    # scan with ``scan.set(monitors=[...])``.
+    monitors = ()
+    # Where to take checkpoints; see CheckpointPolicy. Set per scan with,
+    # e.g., ``scan.set(checkpoint_policy=EveryNPoints(10))``.
+    checkpoint_policy = EveryPoint()
+    # Whether the scan can be restarted partway through (see restarted).
+    # It cannot if its points depend on the data.
+    _restartable = False
+    _restart = None  # set on copies made by restarted()
+
     def __iter__(self):
-        yield Msg('open_run')
+        self._last_checkpoint = None
+        self._points_since_checkpoint = 0
+        self._recorded_positions = {}
+        yield from self._pre_run()
+        yield Msg('open_run', **self._run_metadata())
+        for obj in self.monitors:
+            yield Msg('monitor', obj)
         yield from self._pre_scan()
         yield from self._gen()
         yield from self._post_scan()
+        for obj in self.monitors:
+            yield Msg('unmonitor', obj)
         yield Msg('close_run')
 
+    def _pre_run(self):
+        yield from []
+
     def _pre_scan(self):
         yield Msg('logbook', None, self.logmsg(), **self.logdict())
 
     def _post_scan(self):
         yield from []
 
+    def _run_metadata(self):
+        md = {}
+        if self._recorded_positions:
+            md['initial_positions'] = dict(self._recorded_positions)
+        if self._restart is not None:
+            md['restart_of'] = self._restart['uid']
+            md['restart_index'] = self._restart['index']
+        return md
+
+    def _initial_positions(self, motors):
+        """
+        Read the positions that a relative scan moves relative to.
+
+        When restarting, they are taken from the original run instead. Either
+        way, they are recorded in the RunStart as 'initial_positions', keyed
+        by each motor's data key.
+        """
+        recorded = (self._restart or {}).get('initial_positions') or {}
+        positions = {}
+        for motor in motors:
+            ret = yield Msg('read', motor)
+            if len(ret.keys()) > 1:
+                raise NotImplementedError("Can't DScan this motor")
+            key, = ret.keys()
+            positions[motor] = recorded.get(key, ret[key]['value'])
+            self._recorded_positions[key] = positions[motor]
+        return positions
+
+    @property
+    def _start_index(self):
+        "index of the first point to take (nonzero when restarting)"
+        return 0 if self._restart is None else self._restart['index']
+
+    def restarted(self, run_start, seq_num):
+        """
+        Make a copy of this scan that takes up an interrupted run where it
+        left off.
+
+        The copy skips the points already taken and opens a new run. Its
+        RunStart links back to the original with 'restart_of' (the original
+        uid) and 'restart_index' (the number of points skipped). A relative
+        scan moves relative to the positions recorded in the original
+        RunStart, not to wherever the motors are now.
+
+        Parameters
+        ----------
+        run_start : dict
+            RunStart document of the interrupted run, which may itself have
+            been a restart
+        seq_num : int
+            seq_num of the last Event in that run (i.e., the number of points
+            it completed)
+
+        Returns
+        -------
+        scan : ScanBase
+
+        Examples
+        --------
+        >>> RE(scan.restarted(header, header['events'][-1]['seq_num']))
+        """
+        if not self._restartable:
+            raise NotImplementedError("{} cannot be restarted partway "
+                                      "through.".format(type(self).__name__))
+        if seq_num < 0:
+            raise ValueError("seq_num must not be negative")
+        scan = copy.copy(self)
+        scan._restart = dict(
+            uid=run_start['uid'],
+            index=run_start.get('restart_index', 0) + int(seq_num),
+            initial_positions=run_start.get('initial_positions'))
+        return scan
+
+    def _checkpoint(self, new_row=False):
+        "Yield a checkpoint before the next point if the policy calls for one"
+        now = ttime.time()
+        if (self._last_checkpoint is None or
+                self.checkpoint_policy.due(self._points_since_checkpoint,
+                                           now - self._last_checkpoint,
+                                           new_row)):
+            self._last_checkpoint = now
+            self._points_since_checkpoint = 0
+            yield Msg('checkpoint')
+        self._points_since_checkpoint += 1
+
     def _call_str(self):
         args = []
         for k in self._fields:
@@ -101,6 +300,7 @@ class Count(ScanBase):
     """
     # We define _fields not for Struct, but for ScanBase.log* methods.
     _fields = ['detectors', 'num', 'delay']
+    _restartable = True
 
     def __init__(self, detectors, num=1, delay=0):
         self.detectors = detectors
@@ -112,8 +312,8 @@ class Count(ScanBase):
         delay = self.delay
         for d in dets:
             yield Msg('configure', d)
-        for i in range(self.num):
-            yield Msg('checkpoint')
+        for i in range(self._start_index, self.num):
+            yield from self._checkpoint()
             yield Msg('create')
             for det in dets:
                 yield Msg('trigger', det, block_group='A')
@@ -129,13 +329,24 @@ class Count(ScanBase):
 
 class Scan1D(ScanBase):
     _fields = ['detectors', 'motor', 'steps']
+    # If True, start moving to the next point as soon as the detectors have
+    # finished exposing, while they read out. Only detectors whose
+    # motion_safe_phases include 'readout' allow this; others are waited on
+    # in full as usual. Enable per scan with ``scan.set(pipelined=True)``.
+    pipelined = False
+    _restartable = True
 
     def _gen(self):
         dets = self.detectors
         for d in dets:
             yield Msg('configure', d)
-        for step in self._steps:
-            yield Msg('checkpoint')
+        if self.pipelined:
+            yield from self._pipelined_steps()
+            for d in dets:
+                yield Msg('deconfigure', d)
+            return
+        for step in self._steps[self._start_index:]:
+            yield from self._checkpoint()
             yield Msg('set', self.motor, step, block_group='A')
             yield Msg('wait', None, 'A')
             yield Msg('create')
@@ -150,6 +361,34 @@ class Scan1D(ScanBase):
         for d in dets:
             yield Msg('deconfigure', d)
 
+    def _pipelined_steps(self):
+        dets = self.detectors
+        steps = list(self._steps)[self._start_index:]
+        for i, step in enumerate(steps):
+            yield from self._checkpoint()
+            if i > 0:
+                # The motor was sent here during the last readout. Let that
+                # move finish before setting it again, so that a move in
+                # progress is never retargeted.
+                yield Msg('wait', None, 'A')
+            # Setting it again costs nothing if it has arrived and puts it
+            # back on track after a resume.
+            yield Msg('set', self.motor, step, block_group='A')
+            yield Msg('wait', None, 'A')
+            yield Msg('create')
+            yield Msg('read', self.motor)
+            for det in dets:
+                yield Msg('trigger', det, block_group='B',
+                          exposure_group='E')
+            yield Msg('wait', None, 'E')
+            if i + 1 < len(steps):
+                # Move on while the detectors read out.
+                yield Msg('set', self.motor, steps[i + 1], block_group='A')
+            yield Msg('wait', None, 'B')
+            for det in dets:
+                yield Msg('read', det)
+            yield Msg('save')
+
 
 class AbsListScan(Scan1D):
     """
@@ -182,13 +421,10 @@ class DeltaListScan(Scan1D):
     steps : list
         list of positions relative to current position
     """
-    def _pre_scan(self):
-        ret = yield Msg('read', self.motor)
-        if len(ret.keys()) > 1:
-            raise NotImplementedError("Can't DScan this motor")
-        key, = ret.keys()
-        self._init_pos = ret[key]['value']
-        yield from super()._pre_scan()
+    def _pre_run(self):
+        yield from super()._pre_run()
+        positions = yield from self._initial_positions([self.motor])
+        self._init_pos = positions[self.motor]
 
     def logdict(self):
         logdict = super().logdict()
@@ -365,6 +601,7 @@ class _AdaptiveScanBase(Scan1D):
     _fields = ['detectors', 'target_field', 'motor', 'start', 'stop',
                'min_step', 'max_step', 'target_delta', 'backstep']
     THRESHOLD = 0.8  # threshold for going backward and rescanning a region.
+    _restartable = False
 
     def _gen(self):
         start = self.start + self._offset
@@ -381,7 +618,7 @@ class _AdaptiveScanBase(Scan1D):
         for d in dets:
             yield Msg('configure', d)
         while next_pos < stop:
-            yield Msg('checkpoint')
+            yield from self._checkpoint()
             yield Msg('set', motor, next_pos)
             yield Msg('wait', None, 'A')
             yield Msg('create')
@@ -495,13 +732,16 @@ class Center(ScanBase):
     RANGE = 2  # in sigma, first sample this range around the guess
     RANGE_LIMIT = 6  # in sigma, never sample more than this far from the guess
     NUM_SAMPLES = 10
-    NUM_SAMPLES = 10 
+    NUM_CANDIDATES = 201  # positions considered when choosing the next point
+    FIT_WINDOW = 50  # most recent adaptive points included in each fit
     # We define _fields not for Struct, but for ScanBase.log* methods.
     _fields = ['detectors', 'target_field', 'motor', 'initial_center',
-               'initial_width', 'tolerance', 'output_mutable']
+               'initial_width', 'tolerance', 'output_mutable', 'overlap']
+    _model = None  # built once, on first use, and shared by all instances
 
     def __init__(self, detectors, target_field, motor, initial_center,
-                 initial_width, tolerance=0.1, output_mutable=None):
+                 initial_width, tolerance=0.1, output_mutable=None,
+                 overlap=False):
         """
         Attempts to find the center of a peak by moving a motor.
 
@@ -515,8 +755,10 @@ class Center(ScanBase):
         - fitting to Gaussian + line
         - moving to the center of the Gaussian
         - while |old center - new center| > tolerance
-        - taking a measurement
-        - re-run fit
+        - taking a measurement where it is expected to tell the most about
+          the center
+        - re-run fit, starting from the previous result, on the initial
+          samples and the latest 50 points
         - move to new center
 
         Parameters
@@ -534,6 +776,11 @@ class Center(ScanBase):
         output_mutable : dict-like, optional
             Must have 'update' method.  Mutable object to provide a side-band to
             return fitting parameters + data points
+        overlap : bool, optional
+            If True, start moving to the next point before fitting the latest
+            one, so that the fit runs while the motor moves. The next point
+            is then chosen using the fit from one point earlier. False by
+            default.
         """
         self.detectors = detectors
         self.target_field = target_field
@@ -542,6 +789,7 @@ class Center(ScanBase):
         self.initial_width = initial_width
         self.output_mutable = output_mutable
         self.tolerance = tolerance
+        self.overlap = overlap
 
     @property
     def min_cen(self):
@@ -551,9 +799,86 @@ class Center(ScanBase):
     def max_cen(self):
         return self.initial_center + self.RANGE_LIMIT * self.initial_width
 
+    @classmethod
+    def get_model(cls):
+        "Return the Gaussian + line model, building it on first use."
+        if cls._model is None:
+            cls._model = GaussianModel() + LinearModel()
+        return cls._model
+
+    def _measure(self, x, seen_x, seen_y):
+        "Move to x, take a reading, and record the position and target."
+        yield Msg('set', self.motor, x, block_group='A')
+        yield Msg('wait', None, 'A')
+        yield from self._read(seen_x, seen_y)
+
+    def _read(self, seen_x, seen_y):
+        dets = self.detectors
+        yield Msg('create')
+        ret_mot = yield Msg('read', self.motor)
+        key, = ret_mot.keys()
+        seen_x.append(ret_mot[key]['value'])
+        for det in dets:
+            yield Msg('trigger', det, block_group='B')
+        for det in dets:
+            yield Msg('wait', None, 'B')
+        for det in dets:
+            ret_det = yield Msg('read', det)
+            if self.target_field in ret_det:
+                seen_y.append(ret_det[self.target_field]['value'])
+        yield Msg('save')
+
+    def _fit_data(self, seen_x, seen_y):
+        """
+        Return the points to fit: the initial samples, which span the peak,
+        and the latest FIT_WINDOW points, so that a fit never grows slower.
+        """
+        n = self.NUM_SAMPLES
+        x = seen_x[:n] + seen_x[n:][-self.FIT_WINDOW:]
+        y = seen_y[:n] + seen_y[n:][-self.FIT_WINDOW:]
+        return np.asarray(x), np.asarray(y)
+
+    def _next_position(self, res, min_cen, max_cen):
+        """
+        Choose where a measurement would most reduce the variance of the
+        fitted center.
+
+        For a candidate position x with model gradient g (with respect to
+        all the parameters), parameter covariance C, and measurement noise
+        variance s2, one more measurement reduces the variance of the
+        center by (C g)_center ** 2 / (s2 + g.T C g).
+        """
+        params = res.params
+        center = params['center'].value
+        sigma = abs(params['sigma'].value)
+        low = max(min_cen, center - 3 * sigma)
+        high = min(max_cen, center + 3 * sigma)
+        if not low < high:
+            return np.clip(center, min_cen, max_cen)
+        candidates = np.linspace(low, high, self.NUM_CANDIDATES)
+        names = res.var_names
+        covar = res.covar
+        if covar is None:
+            # The fit could not estimate uncertainties. Fall back to the
+            # points where the model is most sensitive to the center.
+            return np.clip(center + sigma * np.random.choice([-1, 1]),
+                           min_cen, max_cen)
+        # Finite-difference gradient of the model at every candidate.
+        model = self.get_model()
+        base = model.eval(params, x=candidates)
+        grad = np.empty((len(names), len(candidates)))
+        for i, name in enumerate(names):
+            step = 1e-6 * max(abs(params[name].value), 1e-3)
+            shifted = params.copy()
+            shifted[name].set(value=params[name].value + step)
+            grad[i] = (model.eval(shifted, x=candidates) - base) / step
+        s2 = max(np.mean(res.residual ** 2), np.finfo(float).tiny)
+        cg = covar.dot(grad)
+        gain = cg[names.index('center')] ** 2 / (s2 + np.sum(grad * cg, 0))
+        return candidates[np.argmax(gain)]
+
     def _gen(self):
         # For thread safety (paranoia) make copies of stuff
-        dets = self.detectors
         target_field = self.target_field
         motor = self.motor
         initial_center = self.initial_center
@@ -561,68 +886,64 @@ class Center(ScanBase):
         tol = self.tolerance
         min_cen = self.min_cen
         max_cen = self.max_cen
-        seen_x = deque()
-        seen_y = deque()
+        seen_x = []
+        seen_y = []
         for x in np.linspace(initial_center - self.RANGE * initial_width,
                              initial_center + self.RANGE * initial_width,
                              self.NUM_SAMPLES, endpoint=True):
-            yield Msg('set', motor, x)
-            yield Msg('create')
-            ret_mot = yield Msg('read', motor)
-            key, = ret_mot.keys()
-            seen_x.append(ret_mot[key]['value'])
-            for det in dets:
-                yield Msg('trigger', det, block_group='B')
-            for det in dets:
-                yield Msg('wait', None, 'B')
-            for det in dets:
-                ret_det = yield Msg('read', det)
-                if target_field in ret_det:
-                    seen_y.append(ret_det[target_field]['value'])
-            yield Msg('save')
-
-        model = GaussianModel() + LinearModel()
-        guesses = {'amplitude': np.max(seen_y),
-                'center': initial_center,
-                'sigma': initial_width,
-                'slope': 0, 'intercept': 0}
+            yield from self._measure(x, seen_x, seen_y)
+
+        model = self.get_model()
+        params = model.make_params(amplitude=np.max(seen_y),
+                                   center=initial_center,
+                                   sigma=initial_width,
+                                   slope=0, intercept=0)
+        res = None
         while True:
-            x = np.asarray(seen_x)
-            y = np.asarray(seen_y)
-            res = model.fit(y, x=x, **guesses)
-            old_guess = guesses
-            guesses = res.values
-            if np.abs(old_guess['center'] - guesses['center']) < tol:
+            moving = self.overlap and res is not None
+            if moving:
+                # Head for the next point while fitting the latest one.
+                next_cen = self._next_position(res, min_cen, max_cen)
+                yield Msg('set', motor, next_cen, block_group='A')
+            old_center = params['center'].value
+            fit_x, fit_y = self._fit_data(seen_x, seen_y)
+            res = model.fit(fit_y, x=fit_x, params=params)
+            params = res.params  # warm-start the next fit
+            if np.abs(old_center - params['center'].value) < tol:
+                if moving:
+                    yield Msg('wait', None, 'A')
                 break
-            next_cen = np.clip(guesses['center'] +
-                            np.random.randn(1) * guesses['sigma'],
-                            min_cen, max_cen)
-            yield Msg('set', motor, next_cen)
-            yield Msg('create')
-            ret_mot = yield Msg('read', motor)
-            key, = ret_mot.keys()
-            seen_x.append(ret_mot[key]['value'])
-            for det in dets:
-                yield Msg('trigger', det, block_group='B')
-            for det in dets:
-                yield Msg('wait', None, 'B')
-            for det in dets:
-                ret_det = yield Msg('read', det)
-                if target_field in ret_det:
-                    seen_y.append(ret_det[target_field]['value'])
-            yield Msg('save')
+            if moving:
+                yield Msg('wait', None, 'A')
+                yield from self._read(seen_x, seen_y)
+            else:
+                next_cen = self._next_position(res, min_cen, max_cen)
+                yield from self._measure(next_cen, seen_x, seen_y)
 
-        yield Msg('set', motor, np.clip(guesses['center'], min_cen, max_cen))
+        yield Msg('set', motor, np.clip(params['center'].value,
+                                        min_cen, max_cen))
 
         if self.output_mutable is not None:
-            self.output_mutable.update(guesses)
+            self.output_mutable.update(res.values)
             self.output_mutable['x'] = np.array(seen_x)
             self.output_mutable['y'] = np.array(seen_y)
             self.output_mutable['model'] = res
 
 
 class ScanND(ScanBase):
+    """
+    Scan over an arbitrary N-dimensional trajectory
+
+    Parameters
+    ----------
+    detectors : list
+        list of 'readable' objects
+    cycler : cycler.Cycler or bluesky.utils.Trajectory
+        any iterable of dictionaries mapping motors to positions that also
+        provides the set of motors as ``keys``
+    """
     _fields = ['detectors', 'cycler']
+    _restartable = True
 
     def _gen(self):
         self.motors = self.cycler.keys
@@ -630,16 +951,27 @@ class ScanND(ScanBase):
         dets = self.detectors
         for d in dets:
             yield Msg('configure', d)
-        for step in list(self.cycler):
-            yield Msg('checkpoint')
+        points = self.cycler
+        if self._start_index:
+            if hasattr(points, '__getitem__'):
+                points = points[self._start_index:]
+            else:
+                points = itertools.islice(points, self._start_index, None)
+        for i, step in enumerate(points):
+            yield from self._checkpoint(new_row=self._is_row_start(points, i))
+            # Command every motor that moves at this step, then wait for
+            # all of them together.
+            moved = False
             for motor, pos in step.items():
                 if pos == self._last_set_point[motor]:
                     # This step does not move this motor.
                     continue
                 yield Msg('set', motor, pos, block_group='A')
-                yield Msg('wait', None, 'A')
                 self._last_set_point[motor] = pos
-                yield Msg('create')
+                moved = True
+            if moved:
+                yield Msg('wait', None, 'A')
+            yield Msg('create')
             for motor in self.motors:
                 yield Msg('read', motor)
             for det in dets:
@@ -652,6 +984,13 @@ class ScanND(ScanBase):
         for d in dets:
             yield Msg('deconfigure', d)
 
+    def _is_row_start(self, points, i):
+        # A row is a sweep of the fastest axis of a grid-shaped Trajectory.
+        shape = getattr(points, 'shape', ())
+        if len(shape) < 2:
+            return False
+        return points.indices[i] % shape[-1] == 0
+
 
 class _OuterProductScanBase(ScanND):
     # We define _fields not for Struct, but for ScanBase.log* methods.
@@ -671,16 +1010,15 @@ class _OuterProductScanBase(ScanND):
             self.motors.append(motor)
 
     def _pre_scan(self):
-        # Build a Cycler for ScanND.
-        cyclers = []
+        # Build a Trajectory for ScanND.
+        dimensions = []
         snake_booleans = []
         for motor, start, stop, num, snake in chunked(self.args, 5):
             offset = self._offsets[motor]
             steps = offset + np.linspace(start, stop, num=num, endpoint=True)
-            c = cycler(motor, steps)
-            cyclers.append(c)
+            dimensions.append({motor: steps})
             snake_booleans.append(snake)
-        self.cycler = snake_cyclers(cyclers, snake_booleans)
+        self.cycler = Trajectory(dimensions, snake_booleans)
         yield from super()._pre_scan()
 
     @property
@@ -709,19 +1047,15 @@ class _InnerProductScanBase(ScanND):
         return self._args
 
     def _pre_scan(self):
-        # Build a Cycler for ScanND.
+        # Build a Trajectory for ScanND. All motors move together, so they
+        # share a single dimension.
         num = self.num
-        self.cycler = None
+        dimension = OrderedDict()
         for motor, start, stop, in chunked(self.args, 3):
             offset = self._offsets[motor]
             steps = offset + np.linspace(start, stop, num=num, endpoint=True)
-            c = cycler(motor, steps)
-            # Special case first pass because their is no
-            # mutliplicative identity for cyclers.
-            if self.cycler is None:
-                self.cycler = c
-            else:
-                self.cycler += c
+            dimension[motor] = steps
+        self.cycler = Trajectory([dimension])
         yield from super()._pre_scan()
 
 
@@ -756,16 +1090,10 @@ class InnerProductDeltaScan(_InnerProductScanBase):
     motor1, start1, stop1, ..., motorN, startN, stopN : list
         motors can be any 'setable' object (motor, temp controller, etc.)
     """
-    def _pre_scan(self):
-        self._offsets = {}
-        for motor, start, stop, in chunked(self.args, 3):
-            ret = yield Msg('read', motor)
-            if len(ret.keys()) > 1:
-                raise NotImplementedError("Can't DScan this motor")
-            key, = ret.keys()
-            current_value = ret[key]['value']
-            self._offsets[motor] = current_value
-        yield from super()._pre_scan()
+    def _pre_run(self):
+        yield from super()._pre_run()
+        motors = [motor for motor, start, stop in chunked(self.args, 3)]
+        self._offsets = yield from self._initial_positions(motors)
 
     def _post_scan(self):
         # Return the motor to its original position.
@@ -814,16 +1142,11 @@ class OuterProductDeltaScan(_OuterProductScanBase):
         is a boolean indicating whether to following snake-like, winding
         trajectory or a simple left-to-right trajectory.
     """
-    def _pre_scan(self):
-        self._offsets = {}
-        for motor, start, stop, num, snake in chunked(self.args, 5):
-            ret = yield Msg('read', motor)
-            if len(ret.keys()) > 1:
-                raise NotImplementedError("Can't DScan this motor")
-            key, = ret.keys()
-            current_value = ret[key]['value']
-            self._offsets[motor] = current_value
-        yield from super()._pre_scan()
+    def _pre_run(self):
+        yield from super()._pre_run()
+        motors = [motor for motor, start, stop, num, snake
+                  in chunked(self.args, 5)]
+        self._offsets = yield from self._initial_positions(motors)
 
     def _post_scan(self):
         # Return the motor to its original position.
@@ -877,3 +1200,346 @@ class Tweak(ScanBase):
             # stackoverflow.com/a/12586667/380231
             print('\x1b[1A\x1b[2K\x1b[1A')
         yield Msg('deconfigure', d)
+
+
+class _AggregateStatus:
+    "Status of several kickoffs, finished when all of them are finished."
+    def __init__(self, statuses):
+        self._statuses = list(statuses)
+        self._remaining = len(self._statuses)
+        self._lock = threading.Lock()
+        self._cb = None
+        self.done = not self._remaining
+        for status in self._statuses:
+            status.finished_cb = self._finish_one
+
+    @property
+    def success(self):
+        return all(getattr(status, 'success', True)
+                   for status in self._statuses)
+
+    @property
+    def finished_cb(self):
+        return self._cb
+
+    @finished_cb.setter
+    def finished_cb(self, cb):
+        with self._lock:
+            if self._cb is not None:
+                raise RuntimeError("Can not change the call back")
+            if not self.done:
+                self._cb = cb
+                return
+        cb()
+
+    def _finish_one(self):
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining:
+                return
+            self.done = True
+            cb, self._cb = self._cb, None
+        if cb is not None:
+            cb()
+
+
+class _MergedFlyers:
+    """
+    Present several flyers as one, merging their Events in time order.
+
+    Each flyer is expected to return its Events in time order; the merge is
+    done lazily, one Event at a time, as the RunEngine consumes them.
+    """
+    def __init__(self, flyers):
+        self.flyers = list(flyers)
+        self._status = None
+
+    @property
+    def done(self):
+        return self._status is None or self._status.done
+
+    def describe(self):
+        data_keys_list = []
+        for flyer in self.flyers:
+            data_keys_list.extend(flyer.describe())
+        return data_keys_list
+
+    def kickoff(self, segment):
+        # A segment is either the arguments for every flyer or a dict
+        # mapping each flyer to its own arguments.
+        statuses = []
+        for flyer in self.flyers:
+            args = segment[flyer] if isinstance(segment, dict) else segment
+            statuses.append(flyer.kickoff(*args))
+        self._status = _AggregateStatus(statuses)
+        return self._status
+
+    def collect(self):
+        def keyed(i, events):
+            for j, ev in enumerate(events):
+                # (i, j) breaks ties without comparing the dicts.
+                yield ev['time'], i, j, ev
+        streams = [keyed(i, flyer.collect())
+                   for i, flyer in enumerate(self.flyers)]
+        for _, _, _, ev in heapq.merge(*streams):
+            yield ev
+
+    def stop(self):
+        for flyer in self.flyers:
+            stop = getattr(flyer, 'stop', None)
+            if stop is not None:
+                stop()
+
+
+class FlyScan(ScanBase):
+    """
+    Fly one or more flyers through a sequence of segments
+
+    Each segment counts as one point for the ``checkpoint_policy``, so by
+    default each segment is begun with a checkpoint. If a flyer reports that
+    a segment failed (its kickoff status has ``success`` False) the scan
+    pauses; resuming repeats every segment since the last checkpoint.
+
+    Parameters
+    ----------
+    flyers : list
+        list of 'flyable' objects (kickoff, collect, describe)
+    segments : list
+        arguments passed to ``kickoff`` for each segment: a tuple used for
+        every flyer or a dict mapping each flyer to its own tuple
+    collect_period : float, optional
+        While flying, collect whatever data is available every
+        ``collect_period`` seconds. By default, collect once per segment,
+        after the flyers finish.
+
+    Examples
+    --------
+    Fly two flyers together over two segments, collecting every second.
+
+    >>> s = FlyScan([flyer1, flyer2], [(-1, 1, 100), (1, 3, 100)], 1)
+    >>> RE(s)
+    """
+    _fields = ['flyers', 'segments', 'collect_period']
+
+    def __init__(self, flyers, segments, collect_period=None):
+        self.flyers = flyers
+        self.segments = segments
+        self.collect_period = collect_period
+
+    def _flyer(self):
+        if len(self.flyers) == 1:
+            return self.flyers[0]
+        return _MergedFlyers(self.flyers)
+
+    def _fly_segment(self, flyer, segment):
+        if isinstance(flyer, _MergedFlyers):
+            args = (segment,)
+        elif isinstance(segment, dict):
+            args = tuple(segment[flyer])
+        else:
+            args = tuple(segment)
+        status = yield Msg('kickoff', flyer, *args, block_group='fly')
+        if self.collect_period is not None:
+            while not getattr(status, 'done', True):
+                yield Msg('sleep', None, self.collect_period)
+                yield Msg('collect', flyer)
+        yield Msg('wait', None, 'fly')
+        yield Msg('collect', flyer)
+        if not getattr(status, 'success', True):
+            # Resuming rewinds to the checkpoint before this segment.
+            yield Msg('pause')
+
+    def _gen(self):
+        flyer = self._flyer()
+        for segment in self.segments:
+            yield from self._checkpoint()
+            yield from self._fly_segment(flyer, segment)
+
+
+class Fly1DScan(FlyScan):
+    """
+    Fly one or more flyers once from start to stop
+
+    The flyers must accept ``kickoff(start, stop, num)``.
+
+    Parameters
+    ----------
+    flyers : list
+        list of 'flyable' objects
+    start : float
+    stop : float
+    num : integer
+        number of points
+    collect_period : float, optional
+        seconds between collections while flying; see FlyScan
+    """
+    _fields = ['flyers', 'start', 'stop', 'num', 'collect_period']
+
+    def __init__(self, flyers, start, stop, num, collect_period=None):
+        self.flyers = flyers
+        self.start = start
+        self.stop = stop
+        self.num = num
+        self.collect_period = collect_period
+
+    @property
+    def segments(self):
+        return [(self.start, self.stop, self.num)]
+
+
+class FlyRasterScan(FlyScan):
+    """
+    Step a motor through rows, flying one or more flyers along each row
+
+    The flyers must accept ``kickoff(start, stop, num)``. By default, each
+    row is begun with a checkpoint, so an interrupted scan resumes at the
+    last incomplete row.
+
+    Parameters
+    ----------
+    flyers : list
+        list of 'flyable' objects
+    motor : object
+        any 'setable' object, stepped between rows
+    start : float
+        first row position
+    stop : float
+        last row position
+    num : integer
+        number of rows
+    fly_start : float
+        start of each row
+    fly_stop : float
+        end of each row
+    fly_num : integer
+        number of points per row
+    snake : bool, optional
+        If True, fly alternate rows in the opposite direction. False by
+        default.
+    collect_period : float, optional
+        seconds between collections while flying; see FlyScan
+    """
+    _fields = ['flyers', 'motor', 'start', 'stop', 'num', 'fly_start',
+               'fly_stop', 'fly_num', 'snake', 'collect_period']
+
+    def __init__(self, flyers, motor, start, stop, num, fly_start, fly_stop,
+                 fly_num, snake=False, collect_period=None):
+        self.flyers = flyers
+        self.motor = motor
+        self.start = start
+        self.stop = stop
+        self.num = num
+        self.fly_start = fly_start
+        self.fly_stop = fly_stop
+        self.fly_num = fly_num
+        self.snake = snake
+        self.collect_period = collect_period
+
+    @property
+    def segments(self):
+        segments = []
+        for i in range(self.num):
+            if self.snake and i % 2:
+                segments.append((self.fly_stop, self.fly_start, self.fly_num))
+            else:
+                segments.append((self.fly_start, self.fly_stop, self.fly_num))
+        return segments
+
+    def _gen(self):
+        flyer = self._flyer()
+        rows = np.linspace(self.start, self.stop, self.num)
+        for pos, segment in zip(rows, self.segments):
+            yield from self._checkpoint(new_row=True)
+            yield Msg('set', self.motor, pos, block_group='A')
+            yield Msg('wait', None, 'A')
+            yield from self._fly_segment(flyer, segment)
+
+
+class BufferedCount(FlyScan):
+    """
+    Count detectors that acquire into a buffer, arming many frames at once
+
+    Each batch of frames is armed with a single ``kickoff``. Readings are
+    streamed back with ``collect`` while the detectors acquire, so there is
+    no per-frame round trip.
+
+    Parameters
+    ----------
+    detectors : list
+        list of buffered detectors: ``kickoff(num)`` arms and starts
+        ``num`` frames, and ``collect()`` yields the readings acquired so
+        far as Events
+    num : integer
+        total number of frames
+    batch_size : integer, optional
+        number of frames armed at once; default is 100
+    checkpoint_every : integer, optional
+        number of batches between checkpoints; default is 1. Resuming
+        repeats every batch since the last checkpoint. This is shorthand for
+        setting ``checkpoint_policy`` to ``EveryNPoints(checkpoint_every)``;
+        it is None if some other policy has been set.
+    collect_period : float, optional
+        seconds between collections while acquiring; default is 0.1. If
+        None, collect once per batch.
+
+    Examples
+    --------
+    Take 10000 frames, 500 at a time, with a checkpoint every 2000 frames.
+
+    >>> c = BufferedCount([det], 10000, 500, 4)
+    >>> RE(c)
+    """
+    _fields = ['detectors', 'num', 'batch_size', 'checkpoint_every',
+               'collect_period']
+
+    def __init__(self, detectors, num, batch_size=100, checkpoint_every=1,
+                 collect_period=0.1):
+        self.detectors = detectors
+        self.num = num
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.collect_period = collect_period
+
+    # Validated when set, so that a bad scan is refused before it runs.
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, value):
+        if value < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._batch_size = value
+
+    @property
+    def checkpoint_every(self):
+        policy = self.checkpoint_policy
+        if isinstance(policy, EveryNPoints):
+            return policy.num
+        return None
+
+    @checkpoint_every.setter
+    def checkpoint_every(self, value):
+        if value < 1:
+            raise ValueError("checkpoint_every must be at least 1")
+        self.checkpoint_policy = EveryNPoints(value)
+
+    @property
+    def flyers(self):
+        return self.detectors
+
+    @property
+    def segments(self):
+        full, remainder = divmod(self.num, self.batch_size)
+        segments = [(self.batch_size,)] * full
+        if remainder:
+            segments.append((remainder,))
+        return segments
+
+    def _gen(self):
+        dets = self.detectors
+        for d in dets:
+            yield Msg('configure', d)
+        yield from super()._gen()
+        for d in dets:
+            yield Msg('deconfigure', d)
@@ -1,13 +1,218 @@
-import epics
 import asyncio
 from abc import ABCMeta, abstractmethod, abstractproperty
 import operator
-from threading import Lock
+from weakref import WeakKeyDictionary
+
+
+class SuspenderManager:
+    """
+    Combine many suspenders into a single suspend/resume of a RunEngine.
+
+    Every suspender reports new values through one dispatch path: they are
+    handed to the event loop and evaluated there, in order, so no locks are
+    needed. The RunEngine is suspended once when the first suspender trips
+    and resumed once, after the longest ``sleep`` of the suspenders that
+    tripped, when all of them have cleared. If another suspender trips while
+    waiting to resume, the resume is called off.
+
+    A suspender trips only after its suspend condition has held for its
+    ``debounce`` time, and clears no sooner than its ``min_dwell`` time
+    after tripping.
+
+    A suspension ends with the run. If a suspender is still tripped, its
+    next update suspends the next run.
+
+    Suspenders use the manager of their RunEngine unless given one.
+
+    Parameters
+    ----------
+    RE : RunEngine
+        The run engine instance this should work on
+
+    loop : BaseEventLoop, optional
+        The event loop to work on
+    """
+    def __init__(self, RE, *, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self.RE = RE
+        self._tripped = dict()  # {suspender: loop time it tripped}
+        self._pending_trips = dict()  # {suspender: handle} while debouncing
+        self._pending_clears = dict()  # {suspender: handle} while dwelling
+        self._sleep = 0  # longest sleep among suspenders in this suspension
+        self._ev = None
+        self._wait_task = None  # what the RunEngine waits on while suspended
+        self._resume_handle = None
+        self._suspended_at = None
+        self.suspensions = 0
+        self._time_lost = 0
+        self.trips = dict()  # {suspender: number of times tripped}
+        self._time_tripped = dict()  # {suspender: total time tripped}
+
+    @property
+    def tripped(self):
+        "The suspenders whose suspend condition currently holds"
+        return list(self._tripped)
+
+    @property
+    def suspended(self):
+        "Whether a suspension requested by this manager is outstanding"
+        return self._ev is not None
+
+    @property
+    def time_lost(self):
+        "Total time, in seconds, spent suspended, including any ongoing"
+        if self._suspended_at is None:
+            return self._time_lost
+        return self._time_lost + self._loop.time() - self._suspended_at
+
+    def time_tripped(self, suspender):
+        "Total time, in seconds, that a suspender has spent tripped"
+        total = self._time_tripped.get(suspender, 0)
+        if suspender in self._tripped:
+            total += self._loop.time() - self._tripped[suspender]
+        return total
+
+    def update(self, suspender, value):
+        """
+        Report a new value for a suspender. This may be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._process, suspender, value)
+
+    def remove(self, suspender):
+        """
+        Stop tracking a suspender, treating it as cleared if it is tripped.
+
+        The suspender also stops listening to its signal.
+        """
+        unsubscribe = getattr(suspender, '_unsubscribe', None)
+        if unsubscribe is not None:
+            unsubscribe()
+        self._loop.call_soon_threadsafe(self._clear, suspender)
+
+    def _process(self, suspender, value):
+        if suspender in self._tripped:
+            if not suspender._should_resume(value):
+                self._cancel(self._pending_clears, suspender)
+                if self._ev is None:
+                    # Still tripped after the last run ended; suspend this one.
+                    self._suspend()
+                return
+            if suspender in self._pending_clears:
+                return
+            dwell = getattr(suspender, '_min_dwell', 0)
+            remaining = self._tripped[suspender] + dwell - self._loop.time()
+            if remaining > 0:
+                self._pending_clears[suspender] = self._loop.call_later(
+                    remaining, self._clear, suspender)
+            else:
+                self._clear(suspender)
+        else:
+            if not suspender._should_suspend(value):
+                self._cancel(self._pending_trips, suspender)
+                return
+            if suspender in self._pending_trips:
+                return
+            debounce = getattr(suspender, '_debounce', 0)
+            if debounce > 0:
+                self._pending_trips[suspender] = self._loop.call_later(
+                    debounce, self._trip, suspender)
+            else:
+                self._trip(suspender)
+
+    @staticmethod
+    def _cancel(pending, suspender):
+        handle = pending.pop(suspender, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _trip(self, suspender):
+        self._pending_trips.pop(suspender, None)
+        self._tripped[suspender] = self._loop.time()
+        self.trips[suspender] = self.trips.get(suspender, 0) + 1
+        self._sleep = max(self._sleep, suspender._sleep)
+        if self._resume_handle is not None:
+            # Still suspended; just call off the pending resume.
+            self._resume_handle.cancel()
+            self._resume_handle = None
+        elif self._ev is None:
+            self._suspend()
+
+    def _suspend(self):
+        state = getattr(self.RE, 'state', None)
+        if state is not None and state.is_idle:
+            # There is no run to suspend.
+            return
+        self._ev = asyncio.Event(loop=self._loop)
+        self._suspended_at = self._loop.time()
+        self.suspensions += 1
+        task = self._wait_task = asyncio.ensure_future(self._ev.wait(),
+                                                       loop=self._loop)
+        # The RunEngine calls back if the run ends while suspended.
+        self.RE.request_suspend(task, lambda: self._run_ended(task))
+
+    def _run_ended(self, task):
+        if task is self._wait_task:
+            self._end_suspension()
+
+    def _clear(self, suspender):
+        self._cancel(self._pending_trips, suspender)
+        self._cancel(self._pending_clears, suspender)
+        if suspender not in self._tripped:
+            return
+        tripped_at = self._tripped.pop(suspender)
+        self._time_tripped[suspender] = (self._time_tripped.get(suspender, 0) +
+                                         self._loop.time() - tripped_at)
+        if not self._tripped and self._ev is not None:
+            self._resume_handle = self._loop.call_later(self._sleep,
+                                                        self._resume)
+
+    def _resume(self):
+        ev = self._ev
+        self._end_suspension()
+        ev.set()
+
+    def _end_suspension(self):
+        # Reset the per-suspension state. Tripped suspenders stay tripped.
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+            self._resume_handle = None
+        self._ev = None
+        self._wait_task = None
+        self._sleep = 0
+        self._time_lost += self._loop.time() - self._suspended_at
+        self._suspended_at = None
+
+
+_managers = WeakKeyDictionary()
+
+
+def get_suspender_manager(RE, *, loop=None):
+    """
+    Return the SuspenderManager shared by all suspenders on a RunEngine.
+
+    Parameters
+    ----------
+    RE : RunEngine
+
+    loop : BaseEventLoop, optional
+        The event loop to work on, used if the manager does not exist yet
+    """
+    try:
+        return _managers[RE]
+    except KeyError:
+        manager = _managers[RE] = SuspenderManager(RE, loop=loop)
+        return manager
 
 
 class PVSuspenderBase(metaclass=ABCMeta):
     """An ABC to manage the callbacks between asyincio and pyepics.
 
+    Any signal source can be used in place of a PV name: an object with a
+    ``subscribe(callback)`` method (or pyepics' ``add_callback``) that calls
+    ``callback(value=<new value>)`` on every update. See
+    ``bluesky.examples.ReplaySignal`` for a simulated one.
 
     Parameters
     ----------
@@ -15,9 +220,9 @@ class PVSuspenderBase(metaclass=ABCMeta):
     RE : RunEngine
         The run engine instance this should work on
 
-    pv_name : str
+    pv_name : str or object
         The PV to watch for changes to determine if the
-        scan should be suspended
+        scan should be suspended, or a signal object as above
 
     sleep : float, optional
         How long to wait in seconds after the resume condition is met
@@ -26,20 +231,47 @@ class PVSuspenderBase(metaclass=ABCMeta):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    manager : SuspenderManager, optional
+        Combines this with other suspenders. By default, the manager shared
+        by all suspenders on `RE`.
+
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
     """
-    def __init__(self, RE, pv_name, *, sleep=0, loop=None):
+    def __init__(self, RE, pv_name, *, sleep=0, loop=None, manager=None,
+                 debounce=0, min_dwell=0):
         """
         """
-        if loop is None:
-            loop = asyncio.get_event_loop()
-        self._loop = loop
+        if manager is None:
+            manager = get_suspender_manager(RE, loop=loop)
+        self._manager = manager
         self.RE = RE
-        self._ev = None
         self._sleep = sleep
-        self._lock = Lock()
-
-        self._pv = epics.PV(pv_name, auto_monitor=True)
-        self._pv.add_callback(self)
+        self._debounce = debounce
+        self._min_dwell = min_dwell
+
+        if isinstance(pv_name, str):
+            import epics
+            self._pv = epics.PV(pv_name, auto_monitor=True)
+        else:
+            self._pv = pv_name
+        if hasattr(self._pv, 'subscribe'):
+            self._pv.subscribe(self)
+        else:
+            self._cb_index = self._pv.add_callback(self)
+
+    def _unsubscribe(self):
+        "Stop listening to the signal."
+        if hasattr(self._pv, 'clear_sub'):
+            self._pv.clear_sub(self)
+        else:
+            self._pv.remove_callback(self._cb_index)
 
     @abstractmethod
     def _should_suspend(self, value):
@@ -86,28 +318,17 @@ class PVSuspenderBase(metaclass=ABCMeta):
 
         This expects the massive blob that comes from pyepics
         """
-        value = kwargs['value']
-
-        with self._lock:
-            if self._ev is None:
-                # in the case where either have never been
-                # called or have already fully cycled once
-                if self._should_suspend(value):
-                    self._ev = asyncio.Event(loop=self._loop)
-
-                    self._loop.call_soon_threadsafe(
-                        self.RE.request_suspend,
-                        self._ev.wait())
-            else:
-                if self._should_resume(value):
-                    ev = self._ev.set
-                    sleep = self._sleep
+        self._manager.update(self, kwargs['value'])
 
-                    def local():
-                        self._loop.call_later(sleep, ev)
-                    self._loop.call_soon_threadsafe(local)
-                    # clear that we have an event
-                    self._ev = None
+    @property
+    def trips(self):
+        "The number of times this suspender has tripped"
+        return self._manager.trips.get(self, 0)
+
+    @property
+    def time_tripped(self):
+        "The total time, in seconds, this suspender has spent tripped"
+        return self._manager.time_tripped(self)
 
 
 class PVSuspendBoolHigh(PVSuspenderBase):
@@ -132,6 +353,14 @@ class PVSuspendBoolHigh(PVSuspenderBase):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
     """
     def _should_suspend(self, value):
         return bool(value)
@@ -162,6 +391,14 @@ class PVSuspendBoolLow(PVSuspenderBase):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
     """
     def _should_suspend(self, value):
         return not bool(value)
@@ -230,6 +467,14 @@ class PVSuspendFloor(_PVThreshold):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
 
     """
     def _validate(self):
@@ -275,6 +520,14 @@ class PVSuspendCeil(_PVThreshold):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
 
     """
     def _validate(self):
@@ -295,7 +548,8 @@ class _PVSuspendBandBase(PVSuspenderBase):
     Private base-class for suspenders based on keeping a scalar inside
     or outside of a band
     """
-    def __init__(self, RE, pv, band_bottom, band_top, **kwargs):
+    def __init__(self, RE, pv, band_bottom, band_top, *, hysteresis=0,
+                 **kwargs):
         super().__init__(RE, pv, **kwargs)
         if not band_bottom < band_top:
             raise ValueError("The bottom of the band must be strictly "
@@ -303,8 +557,11 @@ class _PVSuspendBandBase(PVSuspenderBase):
                              "bottom: {}\ttop: {}".format(
                                  band_bottom, band_top)
                              )
+        if hysteresis < 0:
+            raise ValueError("hysteresis must be non-negative")
         self._bot = band_bottom
         self._top = band_top
+        self._hysteresis = hysteresis
 
 
 class PVSuspendInBand(_PVSuspendBandBase):
@@ -326,6 +583,10 @@ class PVSuspendInBand(_PVSuspendBandBase):
         The top and bottom of the band.  `band_top` must be
         strictly greater than `band_bottom`.
 
+    hysteresis : float, optional
+        How far back past the edge of the band the value must go before
+        resuming.  Defaults to 0
+
     sleep : float, optional
         How long to wait in seconds after the resume condition is met
         before marking the event as done.  Defaults to 0
@@ -333,9 +594,24 @@ class PVSuspendInBand(_PVSuspendBandBase):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 2 * self._hysteresis >= self._top - self._bot:
+            raise ValueError("hysteresis must be less than half the width "
+                             "of the band")
+
     def _should_resume(self, value):
-        return self._bot < value < self._top
+        h = self._hysteresis
+        return self._bot + h < value < self._top - h
 
     def _should_suspend(self, value):
         return not (self._bot < value < self._top)
@@ -362,6 +638,10 @@ class PVSuspendOutBand(_PVSuspendBandBase):
         The top and bottom of the band.  `band_top` must be
         strictly greater than `band_bottom`.
 
+    hysteresis : float, optional
+        How far back past the edge of the band the value must go before
+        resuming.  Defaults to 0
+
     sleep : float, optional
         How long to wait in seconds after the resume condition is met
         before marking the event as done.  Defaults to 0
@@ -369,9 +649,18 @@ class PVSuspendOutBand(_PVSuspendBandBase):
     loop : BaseEventLoop, optional
         The event loop to work on
 
+    debounce : float, optional
+        How long in seconds the suspend condition must hold before the
+        scan is suspended. Defaults to 0
+
+    min_dwell : float, optional
+        The minimum time in seconds to stay tripped once tripped, however
+        soon the resume condition is met. Defaults to 0
+
     """
     def _should_resume(self, value):
-        return not (self._bot < value < self._top)
+        h = self._hysteresis
+        return not (self._bot - h < value < self._top + h)
 
     def _should_suspend(self, value):
         return (self._bot < value < self._top)
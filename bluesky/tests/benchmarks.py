@@ -0,0 +1,112 @@
+"""
+Benchmarks, which are too slow for the regular test suite.
+
+They are not collected by nose. Run them all with
+
+    python -m bluesky.tests.benchmarks
+"""
+import asyncio
+import gc
+import threading
+import time as ttime
+import tracemalloc
+
+from bluesky import Msg
+from bluesky.examples import motor, det, loop
+from bluesky.tests.utils import setup_test_run_engine
+
+
+def _checkpointed_points(num, block, timings, memory):
+    # Checkpoints, with a data point in each of a few Event streams at the
+    # start of each block, so that there is per-run state to snapshot. Note
+    # the time and the memory in use at the start of each block.
+    yield Msg('open_run')
+    for i in range(num):
+        if i % block == 0:
+            timings.append(ttime.time())
+            gc.collect()
+            memory.append(tracemalloc.get_traced_memory()[0])
+            yield Msg('trigger', det)
+            for obj in (motor, det):
+                yield Msg('create')
+                yield Msg('read', obj)
+                yield Msg('save')
+        yield Msg('checkpoint')
+    timings.append(ttime.time())
+    yield Msg('close_run')
+
+
+def bench_checkpoint_cost_is_constant(num=100000, block=10000):
+    """
+    Neither the time per checkpoint nor the memory used should grow with the
+    number of checkpoints already taken.
+
+    Parameters
+    ----------
+    num : integer, optional
+        number of checkpoints; default is 100000, which takes a few minutes
+    block : integer, optional
+        number of checkpoints per timed block; default is 10000
+    """
+    RE = setup_test_run_engine()
+    timings = []
+    memory = []
+    tracemalloc.start()
+    try:
+        RE(_checkpointed_points(num, block, timings, memory))
+    finally:
+        tracemalloc.stop()
+    blocks = [b - a for a, b in zip(timings[:-1], timings[1:])]
+    print("time per {} checkpoints: first {:.3f} s, last {:.3f} s".format(
+        block, blocks[0], blocks[-1]))
+    print("memory growth after the first block: {} bytes".format(
+        memory[-1] - memory[1]))
+    assert blocks[-1] < 2 * blocks[0]
+    assert memory[-1] - memory[1] < 100000  # bytes
+
+
+def _pause_latency(RE, request):
+    # Time from request_pause() to RE returning in the 'paused' state, while
+    # the RunEngine is blocked waiting on something that never finishes.
+    ev = asyncio.Event()
+    requested = []
+
+    def local_pause():
+        requested.append(ttime.time())
+        RE.request_pause()
+
+    request(local_pause)
+    RE([Msg('checkpoint'), Msg('wait_for', [ev.wait(), ])])
+    latency = ttime.time() - requested[0]
+    assert RE.state == 'paused'
+    RE.abort()
+    return latency
+
+
+def bench_pause_latency(num=20, limit=0.05):
+    """
+    A pause requested while the RunEngine is waiting should take effect
+    within milliseconds, whether it is requested from a callback on the
+    event loop or from another thread.
+
+    Parameters
+    ----------
+    num : integer, optional
+        number of pauses to time from each source; default is 20
+    limit : float, optional
+        longest acceptable latency, in seconds; default is 0.05
+    """
+    RE = setup_test_run_engine()
+    sources = [('event loop', lambda f: loop.call_later(0.1, f)),
+               ('other thread', lambda f: threading.Timer(0.1, f).start())]
+    for source, request in sources:
+        latencies = [_pause_latency(RE, request) for _ in range(num)]
+        print("request_pause ({}) -> paused: mean {:.1f} ms, max {:.1f} ms"
+              "".format(source, 1000 * sum(latencies) / num,
+                        1000 * max(latencies)))
+        assert max(latencies) < limit
+
+
+if __name__ == '__main__':
+    bench_pause_latency()
+    bench_checkpoint_cost_is_constant()
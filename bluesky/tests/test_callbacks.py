@@ -1,13 +1,17 @@
 from nose.tools import assert_equal, assert_raises
-from bluesky.run_engine import Msg
+from bluesky.run_engine import Msg, DocumentNames
 from bluesky.examples import (motor, det, stepscan)
-from bluesky.scans import AdaptiveAbsScan
-from bluesky.callbacks import (CallbackCounter, LiveTable)
+from bluesky.scans import AdaptiveAbsScan, AbsScan
+from bluesky.callbacks import (CallbackCounter, LiveTable, MinMaxDecimator,
+                               RetrievalService, PeakStats, LiveFit, QtKicker)
 from bluesky.tests.utils import setup_test_run_engine
 from nose.tools import raises
 import contextlib
 import sys
 import tempfile
+import threading
+import numpy as np
+from lmfit.models import LinearModel
 
 RE = setup_test_run_engine()
 
@@ -69,6 +73,219 @@ def test_unknown_cb_raises():
     assert_raises(ValueError, RE._register_scan_callback, 'not a thing', f)
 
 
+def test_decimator_bounded():
+    dec = MinMaxDecimator(100)
+    y = np.random.randn(100000)
+    y[12345] = 50
+    y[54321] = -50
+    for i, val in enumerate(y):
+        dec.append(i, val)
+    assert_equal(len(dec), 100000)
+    x_dec, y_dec = dec.get_data()
+    assert len(x_dec) <= 100
+    # Decimated points stay in order and extremes survive.
+    assert np.all(np.diff(x_dec) > 0)
+    assert 50 in y_dec
+    assert -50 in y_dec
+
+
+def test_decimator_short_stream():
+    dec = MinMaxDecimator(10)
+    for i in range(3):
+        dec.append(i, 2 * i)
+    x_dec, y_dec = dec.get_data()
+    assert_equal(list(x_dec), [0, 1, 2])
+    assert_equal(list(y_dec), [0, 2, 4])
+
+
+def test_decimator_appends_from_threads():
+    dec = MinMaxDecimator(100)
+    views = []
+
+    def append():
+        for i in range(10000):
+            dec.append(i, np.sin(i))
+
+    def read():
+        for i in range(100):
+            views.append(dec.get_data())
+
+    threads = [threading.Thread(target=append) for _ in range(4)]
+    threads.append(threading.Thread(target=read))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_equal(len(dec), 40000)
+    for x_dec, y_dec in views + [dec.get_data()]:
+        assert len(x_dec) <= 100
+        assert_equal(len(x_dec), len(y_dec))
+
+
+class _FakeLoop:
+    "Record what QtKicker schedules instead of running it."
+    class Handle:
+        def __init__(self, delay, func):
+            self.delay = delay
+            self.func = func
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self.handles = []
+
+    def call_later(self, delay, func):
+        self.handles.append(self.Handle(delay, func))
+        return self.handles[-1]
+
+    def call_soon(self, func):
+        return self.call_later(0, func)
+
+    def run_next(self):
+        self.handles[-1].func()
+        return self.handles[-1].delay
+
+
+def test_qt_kicker_intervals():
+    busy = []
+    loop = _FakeLoop()
+    kicker = QtKicker(loop, min_interval=0.01, max_interval=0.1,
+                      service=lambda: busy.pop() if busy else False)
+    kicker.start()
+    # Nothing is scheduled until something asks for Qt to be serviced.
+    assert_equal(loop.handles, [])
+    assert kicker.sleeping
+    kicker._wake()
+    # While nothing changes, back off, then go back to sleep at max_interval.
+    while not kicker.sleeping:
+        loop.run_next()
+    assert_equal([h.delay for h in loop.handles], [0.02, 0.04, 0.08, 0.1])
+    num_handles = len(loop.handles)
+    # Something to draw keeps it checking back quickly.
+    busy.extend([True, True])
+    kicker._wake()
+    assert_equal(loop.handles[-1].delay, 0.01)
+    assert_equal(loop.run_next(), 0.01)
+    # wake() while awake services at once and resets the interval.
+    loop.run_next()
+    kicker._wake()
+    assert_equal(loop.handles[-2].cancelled, True)
+    assert_equal(loop.handles[-1].delay, 0.02)
+    assert_equal(len(loop.handles), num_handles + 4)
+    kicker.stop()
+    assert_equal(loop.handles[-1].cancelled, True)
+    assert kicker.sleeping
+    # Once stopped, wake() does nothing.
+    kicker._wake()
+    assert_equal(len(loop.handles), num_handles + 4)
+    assert_raises(ValueError, QtKicker, loop, 0.5, 0.1)
+
+
+def test_retrieval_cache_bounded_in_bytes():
+    reads = []
+
+    def retrieve(uid):
+        reads.append(uid)
+        return np.ones(100)  # 800 bytes
+
+    service = RetrievalService(retrieve, max_bytes=2000)
+    for uid in ['a', 'b', 'c']:
+        service.retrieve(uid)
+    # Only two arrays fit; the least recently used one was evicted.
+    assert_equal(service.nbytes, 1600)
+    assert 'a' not in service
+    assert 'c' in service
+    service.retrieve('b')
+    service.retrieve('a')  # read again, evicting 'c'
+    assert_equal(reads, ['a', 'b', 'c', 'a'])
+    assert 'b' in service
+    assert 'c' not in service
+
+
+def test_retrieval_prefetch_from_documents():
+    service = RetrievalService(lambda uid: uid.upper())
+    service('descriptor', {'data_keys': {'img': {'external': 'FILESTORE:'},
+                                         'motor': {}}})
+    service('event', {'data': {'img': 'abc', 'motor': 1}})
+    service.retrieve('abc')
+    assert 'abc' in service
+    assert_equal(service.retrieve('abc'), 'ABC')
+    # A new run declares its own external fields.
+    service('start', {})
+    service('event', {'data': {'img': 'def'}})
+    assert 'def' not in service
+    assert_equal(service._pending, {})
+
+
+def test_peak_stats():
+    ps = PeakStats('motor', 'det')
+    ps('start', {})
+    for x in np.linspace(-5, 5, 41):
+        y = np.exp(-(x - 0.5)**2 / 2)
+        ps('event', {'data': {'motor': x, 'det': y}})
+    ps('event', {'data': {'some_other_stream': 1}})  # ignored
+    assert_equal(len(ps), 41)
+    assert_equal(ps.max, (0.5, 1.0))
+    assert abs(ps.com - 0.5) < 1e-3
+    ps('stop', {})
+    assert_equal(ps.results['cen'], 0.5)
+    # FWHM of a unit Gaussian, up to interpolation error
+    assert abs(ps.results['fwhm'] - 2 * np.sqrt(2 * np.log(2))) < 0.01
+
+
+def test_peak_stats_in_scan():
+    ps = PeakStats('motor', 'det')
+    RE = setup_test_run_engine()
+    for name in [DocumentNames.start, DocumentNames.event,
+                 DocumentNames.stop]:
+        RE._register_scan_callback(name, ps)
+    RE(AbsScan([det], motor, -3, 3, 13))
+    assert_equal(len(ps), 13)
+    assert_equal(ps.results['max'], (0, 1))
+    assert abs(ps.results['cen']) < 1e-9
+
+
+def test_peak_stats_from_threads():
+    ps = PeakStats('motor', 'det')
+    ps('start', {})
+
+    def send(offset):
+        for i in range(2000):
+            ps('event', {'data': {'motor': offset + i, 'det': 1}})
+
+    threads = [threading.Thread(target=send, args=(10000 * j,))
+               for j in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # No point was lost or overwritten while the buffers grew.
+    assert_equal(len(ps), 8000)
+    expected = [10000 * j + i for j in range(4) for i in range(2000)]
+    assert_equal(sorted(ps._x[:len(ps)]), expected)
+    assert_equal(ps.com, np.mean(expected))
+
+
+def test_live_fit():
+    lf = LiveFit('motor', 'det', min_new_points=5)
+    lf('start', {})
+    for x in np.linspace(-5, 5, 41):
+        y = 3 * np.exp(-(x - 0.7)**2 / 2) + 0.1
+        lf('event', {'data': {'motor': x, 'det': y}})
+    lf('stop', {})
+    lf.wait()
+    # The final fit uses all the data.
+    assert_equal(lf.num_fitted, 41)
+    assert abs(lf.result.values['center'] - 0.7) < 1e-3
+    assert abs(lf.result.values['sigma'] - 1) < 1e-3
+
+
+def test_live_fit_custom_model_requires_guesses():
+    assert_raises(ValueError, LiveFit, 'motor', 'det', model=LinearModel())
+
+
 @contextlib.contextmanager
 def _print_redirect():
     old_stdout = sys.stdout
@@ -102,6 +319,54 @@ def test_table():
             assert_equal(ln[26:], kn[26:])
 
 
+def test_table_logbook():
+    logged = []
+
+    def logbook(msg, d):
+        logged.append(msg)
+
+    with _print_redirect() as fout:
+        table = LiveTable(['det', 'motor'], logbook=logbook)
+        RE(stepscan(det, motor), subs={'all': [table]})
+
+    fout.seek(0)
+    printed = [ln.rstrip() for ln in fout]
+    entry, = logged
+    # header line, blank line, then the same table that was printed
+    logged_table = entry.split('\n')[2:]
+    assert_equal(len(logged_table), 3 + 10 + 1)
+    assert_equal(logged_table[:3], printed[:3])
+    assert_equal(logged_table[-1], printed[-1])
+
+
+def test_table_not_rowwise():
+    with _print_redirect() as fout:
+        table = LiveTable(['det', 'motor'], rowwise=False)
+        RE(stepscan(det, motor), subs={'all': [table]})
+
+    fout.seek(0)
+    printed = [ln.rstrip() for ln in fout]
+    # The full table is reprinted after each of the 10 events.
+    num_lines = sum(3 + n + 1 for n in range(1, 11))
+    assert_equal(len(printed), num_lines + 1)
+
+
+def test_table_not_rowwise_reprints_recent_rows():
+    with _print_redirect() as fout:
+        table = LiveTable(['det', 'motor'], rowwise=False,
+                          print_header_interval=3)
+        RE(stepscan(det, motor), subs={'all': [table]})
+
+    fout.seek(0)
+    printed = [ln.rstrip() for ln in fout]
+    # At most the 3 latest rows are reprinted after each of the 10 events.
+    num_lines = sum(3 + min(n, 3) + 1 for n in range(1, 11))
+    assert_equal(len(printed), num_lines + 1)
+    # The last table ends with the last 3 rows.
+    seq_nums = [int(ln.split('|')[1]) for ln in printed[-5:-2]]
+    assert_equal(seq_nums, [8, 9, 10])
+
+
 KNOWN_TABLE = """+------------+--------------+----------------+----------------+
 |   seq_num  |        time  |           det  |         motor  |
 +------------+--------------+----------------+----------------+
@@ -10,12 +10,21 @@ from bluesky.examples import (motor, simple_scan, det, sleepy, wait_one,
                               )
 from bluesky.callbacks import LivePlot
 from bluesky import RunEngine, Msg, PanicError
+from bluesky.run_engine import IllegalMessageSequence, DocumentNames
+from bluesky.scans import AbsScan, ScanND
+from bluesky.utils import Trajectory
+from cycler import cycler
 from bluesky.tests.utils import setup_test_run_engine
 from bluesky.testing.noseclasses import KnownFailureTest
 import os
+import shutil
 import signal
+import tempfile
+import threading
+import warnings
 import asyncio
 import time as ttime
+import numpy as np
 
 try:
     import matplotlib.pyplot as plt
@@ -132,6 +141,48 @@ def test_pause_from_outside():
     assert_equal(RE.state, 'idle')
 
 
+def _check_pause_interrupts_wait(request):
+    # request_pause() must wake the RunEngine while it is blocked waiting on
+    # something. Otherwise, the wait would only end when the fallback below
+    # fires, many seconds later.
+    ev = asyncio.Event()
+    requested = []
+
+    def local_pause():
+        requested.append(True)
+        RE.request_pause()
+
+    request(local_pause)
+    fallback = loop.call_later(10, ev.set)
+    RE([Msg('checkpoint'), Msg('wait_for', [ev.wait(), ])])
+    fallback.cancel()
+    assert_equal(requested, [True])
+    assert_equal(RE.state, 'paused')
+    assert not ev.is_set()
+    RE.abort()
+    assert_equal(RE.state, 'idle')
+
+
+def test_pause_interrupts_wait():
+    _check_pause_interrupts_wait(lambda f: loop.call_later(0.2, f))
+
+
+def test_pause_from_thread_interrupts_wait():
+    _check_pause_interrupts_wait(lambda f: threading.Timer(0.2, f).start())
+
+
+def test_panic_interrupts_wait():
+    ev = asyncio.Event()
+    threading.Timer(0.2, RE.panic).start()
+    fallback = loop.call_later(10, ev.set)
+    assert_raises(PanicError, RE,
+                  [Msg('checkpoint'), Msg('wait_for', [ev.wait(), ])])
+    fallback.cancel()
+    assert not ev.is_set()
+    assert_equal(RE.state, 'idle')
+    RE.all_is_well()
+
+
 def test_panic_during_pause():
     assert_equal(RE.state, 'idle')
     RE(conditional_pause(det, motor, False, True))
@@ -188,6 +239,83 @@ def test_live_plotter():
     assert_equal(RE.state, 'idle')
 
 
+def test_throttled_live_plotter():
+    if skip_mpl:
+        raise nose.SkipTest("matplotlib is not available")
+    my_plotter = LivePlot('det', 'motor', max_fps=1)
+    # Subscribe synchronously: Events from an earlier run may still be on
+    # their way to the ordinary subscribers.
+    cids = [RE._register_scan_callback(name, my_plotter)
+            for name in [DocumentNames.start, DocumentNames.event,
+                         DocumentNames.stop]]
+    try:
+        RE(stepscan(det, motor))
+    finally:
+        for cid in cids:
+            RE._scan_cb_registry.disconnect(cid)
+    assert_equal(RE.state, 'idle')
+    # Points buffered between frames are drawn when the run stops.
+    x, y = my_plotter.current_line.get_data()
+    assert_equal(list(x), list(range(-5, 5)))
+    assert_equal(len(y), 10)
+
+
+def test_live_plotter_data_is_assignable():
+    if skip_mpl:
+        raise nose.SkipTest("matplotlib is not available")
+    my_plotter = LivePlot('det', 'motor', max_points=100,
+                          keep_full_data=True)
+    my_plotter.start({})
+    for i in range(10):
+        my_plotter.event({'data': {'motor': i, 'det': i}})
+    # Start over partway through the run.
+    my_plotter.x_data = []
+    my_plotter.y_data = []
+    assert_equal(my_plotter._plotted_data()[0].tolist(), [])
+    my_plotter.event({'data': {'motor': 20, 'det': 1}})
+    my_plotter.x_data = [0, 1] + list(my_plotter.x_data)
+    my_plotter.y_data = [5, 6] + list(my_plotter.y_data)
+    my_plotter.event({'data': {'motor': 21, 'det': 2}})
+    assert_equal(my_plotter.x_data.tolist(), [0, 1, 20, 21])
+    assert_equal(my_plotter.y_data.tolist(), [5, 6, 1, 2])
+    # The decimated view was rebuilt from the assigned data.
+    x, y = my_plotter._plotted_data()
+    assert_equal(sorted(x), [0, 1, 20, 21])
+
+
+def test_decimating_live_plotter():
+    if skip_mpl:
+        raise nose.SkipTest("matplotlib is not available")
+    my_plotter = LivePlot('det', 'motor', max_points=4)
+    RE(stepscan(det, motor), subs={'all': my_plotter})
+    assert_equal(RE.state, 'idle')
+    x, y = my_plotter.current_line.get_data()
+    assert len(x) <= 4
+    # The full data is not retained unless asked for.
+    assert_equal(len(my_plotter.x_data), 0)
+
+
+def test_live_plotter_appends_from_threads():
+    if skip_mpl:
+        raise nose.SkipTest("matplotlib is not available")
+    my_plotter = LivePlot('det', 'motor')
+    my_plotter.start({})
+
+    def append(offset):
+        for i in range(5000):
+            my_plotter._append(offset + i, i)
+
+    threads = [threading.Thread(target=append, args=(10000 * j,))
+               for j in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # No point was lost or overwritten while the buffers grew.
+    expected = [10000 * j + i for j in range(4) for i in range(5000)]
+    assert_equal(sorted(my_plotter.x_data), expected)
+
+
 def test_md_dict():
     yield _md, {}
 
@@ -258,6 +386,121 @@ def test_simple_fly():
     assert mm._future.done()
 
 
+def test_monitor():
+    docs = {'descriptor': [], 'event': []}
+
+    def collect(name, doc):
+        docs[name].append(doc)
+
+    motor1.set(0)
+    RE([Msg('open_run'), Msg('monitor', motor1),
+        Msg('set', motor1, 1), Msg('set', motor1, 2), Msg('set', motor1, 3),
+        Msg('unmonitor', motor1), Msg('set', motor1, 4),
+        Msg('close_run')],
+       subs={'descriptor': collect, 'event': collect})
+    assert_equal(len(docs['descriptor']), 1)
+    # the value when monitoring began, then one Event per update
+    assert_equal([ev['data']['motor1'] for ev in docs['event']],
+                 [0, 1, 2, 3])
+    assert_equal([ev['seq_num'] for ev in docs['event']], [1, 2, 3, 4])
+
+
+class _ThreadedSignal:
+    "A signal updated from another thread that records where it is read"
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.read_threads = []
+        self._subs = []
+
+    def describe(self):
+        return {self.name: {'source': 'SIM:' + self.name, 'dtype': 'number',
+                            'shape': None}}
+
+    def read(self):
+        self.read_threads.append(threading.current_thread())
+        return {self.name: {'value': self.value, 'timestamp': ttime.time()}}
+
+    def subscribe(self, func):
+        self._subs.append(func)
+
+    def clear_sub(self, func):
+        self._subs.remove(func)
+
+    def put(self, value):
+        self.value = value
+        for func in list(self._subs):
+            func()
+
+
+def test_monitor_reads_on_the_event_loop():
+    sig = _ThreadedSignal('temperature')
+    values = []
+
+    def plan():
+        yield Msg('open_run')
+        yield Msg('monitor', sig)
+        updater = threading.Thread(target=sig.put, args=(1,))
+        updater.start()
+        updater.join()
+        yield Msg('sleep', None, 0.05)
+        yield Msg('close_run')
+
+    RE(plan(), subs={'event': lambda name, doc: values.append(
+        doc['data']['temperature'])})
+    assert_equal(values, [1])
+    # The update was reported from another thread, but read on this one,
+    # where the event loop runs.
+    assert_equal(sig.read_threads, [threading.current_thread()])
+
+
+def test_monitor_error_fails_run():
+    def fail(name, doc):
+        if doc['data'].get('motor1') == 2:
+            raise RuntimeError("callback failed")
+
+    stops = []
+    cid = RE._register_scan_callback(DocumentNames.event, fail)
+    motor1.set(0)
+    try:
+        with assert_raises(RuntimeError):
+            RE([Msg('open_run'), Msg('monitor', motor1),
+                Msg('set', motor1, 1), Msg('set', motor1, 2),
+                Msg('sleep', None, 0.05), Msg('set', motor1, 3),
+                Msg('close_run')],
+               subs={'stop': lambda name, doc: stops.append(doc)})
+    finally:
+        RE._scan_cb_registry.disconnect(cid)
+    assert_equal(stops[-1]['exit_status'], 'fail')
+
+
+def test_monitor_seq_num_survives_rewind():
+    seq_nums = []
+
+    def collect(name, doc):
+        if 'motor1' in doc['data']:
+            seq_nums.append(doc['seq_num'])
+
+    motor1.set(0)
+    cid = RE._register_scan_callback(DocumentNames.event, collect)
+    try:
+        RE([Msg('open_run'), Msg('monitor', motor1), Msg('checkpoint'),
+            Msg('set', motor1, 1), Msg('sleep', None, 0.05), Msg('pause'),
+            Msg('set', motor1, 2), Msg('sleep', None, 0.05),
+            Msg('close_run')])
+        assert_equal(RE.state, 'paused')
+        RE.resume()
+    finally:
+        RE._scan_cb_registry.disconnect(cid)
+    # Rewinding retakes the 'set' (one more update), but the monitor's
+    # Events are not retaken, so its seq_num keeps counting.
+    assert_equal(seq_nums, list(range(1, len(seq_nums) + 1)))
+
+
+def test_monitor_requires_open_run():
+    assert_raises(IllegalMessageSequence, RE, [Msg('monitor', motor1)])
+
+
 def test_list_of_msgs():
     # smoke tests checking that RunEngine accepts a plain list of Messages
     RE([Msg('open_run'), Msg('set', motor, 5), Msg('close_run')])
@@ -420,6 +663,270 @@ def test_seqnum_nonrepeated():
     assert_equal(seq_nums, [1, 2, 2, 3])
 
 
+def test_rewind_past_new_descriptor():
+    # The Event stream begins after the checkpoint, so the rewind forgets it
+    # and the retaken data point gets a new Descriptor.
+    def gen():
+        yield Msg('open_run')
+        yield Msg('checkpoint')
+        yield Msg('create')
+        yield Msg('set', motor, 1)
+        yield Msg('read', motor)
+        yield Msg('save')
+        yield Msg('pause')
+        yield Msg('close_run')
+
+    events = []
+
+    def f(name, doc):
+        events.append(doc)
+
+    RE(gen(), {'event': f})
+    assert_equal(RE.state, 'paused')
+    RE.resume()
+    assert_equal(RE.state, 'idle')
+    assert_equal([ev['seq_num'] for ev in events], [1, 1])
+    assert_equal(len(set(ev['descriptor'] for ev in events)), 2)
+
+
+def _replay_gen(positions):
+    yield Msg('open_run')
+    yield Msg('checkpoint')
+    for pos in positions:
+        yield Msg('create')
+        yield Msg('set', motor, pos)
+        yield Msg('read', motor)
+        yield Msg('save')
+    yield Msg('pause')
+    yield Msg('close_run')
+
+
+def test_replay_log_spills_to_disk():
+    positions = [np.float64(i) for i in range(10)]
+    data = []
+
+    def f(name, doc):
+        data.append((doc['seq_num'], doc['data']['motor']))
+
+    RE.replay_memory_budget = 0  # spill everything
+    try:
+        RE(_replay_gen(positions), {'event': f})
+        assert_equal(RE.state, 'paused')
+        stats = RE.replay_stats
+        # 40 messages for the data points, plus the 'close_run' that was
+        # read before the RunEngine paused. ('pause' itself is not kept.)
+        assert_equal(stats['length'], 41)
+        assert stats['disk_bytes'] > 0
+        RE.resume()
+        assert_equal(RE.state, 'idle')
+    finally:
+        RE.replay_memory_budget = 100 * 2**20
+    expected = list(enumerate(positions, start=1))
+    assert_equal(data, 2 * expected)
+    stats = RE.replay_stats
+    assert_equal(stats['rewinds'], 1)
+    assert_equal(stats['replayed'], 41)
+    assert_equal(stats['spilled'], 41 + 41)
+
+
+def test_replay_log_overflow():
+    RE.replay_disk_budget = 0
+    RE.replay_memory_budget = 0
+    try:
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            RE(_replay_gen(range(3)))
+        # The run could not pause, so it aborted.
+        assert_equal(RE.state, 'idle')
+        assert_true(any('cannot be paused' in str(x.message) for x in w))
+        assert_equal(RE.replay_stats['unresumable'], 1)
+    finally:
+        RE.replay_disk_budget = None
+        RE.replay_memory_budget = 100 * 2**20
+
+
+def _crash_during(scan, state_path, crash_path, subs):
+    # Run scan, keeping the state file as it stood on disk when the third
+    # point was taken, as if the session had died then.
+    def crash_at_third_point(name, doc):
+        if doc['seq_num'] == 3:
+            shutil.copy(state_path, crash_path)
+
+    RE.state_path = state_path
+    cid = RE._register_scan_callback(DocumentNames.event,
+                                     crash_at_third_point)
+    try:
+        RE(scan, subs=subs)
+    finally:
+        RE._scan_cb_registry.disconnect(cid)
+        RE.state_path = None
+    # A completed run leaves nothing to recover.
+    assert not os.path.exists(state_path)
+
+
+def _check_recovery(make_scan, positions):
+    tmp_dir = tempfile.mkdtemp()
+    state_path = os.path.join(tmp_dir, 'state.json')
+    crash_path = os.path.join(tmp_dir, 'crashed.json')
+    docs = []
+
+    def collect(name, doc):
+        docs.append((name, doc))
+
+    _crash_during(make_scan(), state_path, crash_path, collect)
+    start, = [doc for name, doc in docs if name == 'start']
+    descriptor, = [doc for name, doc in docs if name == 'descriptor']
+
+    # A new session, with a new RunEngine, picks up the run.
+    new_RE = setup_test_run_engine()
+    new_RE.state_path = crash_path
+    docs.clear()
+    uids = new_RE.recover(make_scan(), subs=collect)
+    assert_equal(uids, [start['uid']])
+    names = [name for name, doc in docs]
+    assert_not_in('start', names)
+    assert_not_in('descriptor', names)
+    events = [doc for name, doc in docs if name == 'event']
+    assert_equal([ev['seq_num'] for ev in events],
+                 list(range(3, len(positions) + 1)))
+    assert_equal([ev['data']['motor'] for ev in events], positions[2:])
+    assert_true(all(ev['descriptor'] == descriptor['uid'] for ev in events))
+    stop, = [doc for name, doc in docs if name == 'stop']
+    assert_equal(stop['run_start'], start['uid'])
+    assert not os.path.exists(crash_path)
+    shutil.rmtree(tmp_dir)
+
+
+def test_recover_after_crash():
+    _check_recovery(lambda: AbsScan([det], motor, 1, 5, 5), [1, 2, 3, 4, 5])
+
+
+def test_recover_scan_nd():
+    positions = [1, 3, 2, 5, 4]
+    _check_recovery(lambda: ScanND([det], cycler(motor, positions)),
+                    positions)
+
+
+def test_recover_optimized_trajectory():
+    positions = [1, 3, 2, 5, 4]
+    _check_recovery(lambda: ScanND([det], Trajectory([{motor: positions}])),
+                    positions)
+
+
+def test_recover_checks_plan():
+    tmp_dir = tempfile.mkdtemp()
+    state_path = os.path.join(tmp_dir, 'state.json')
+    crash_path = os.path.join(tmp_dir, 'crashed.json')
+    _crash_during(AbsScan([det], motor, 1, 5, 5), state_path, crash_path,
+                  None)
+    new_RE = setup_test_run_engine()
+    new_RE.state_path = crash_path
+    with assert_raises(ValueError):
+        new_RE.recover(AbsScan([det], motor, 1, 5, 6))
+
+    # If the plan cannot start, the run is not reopened by a later call.
+    new_RE.panic()
+    with assert_raises(PanicError):
+        new_RE.recover(AbsScan([det], motor, 1, 5, 5))
+    new_RE.all_is_well()
+    starts = []
+    new_RE(AbsScan([det], motor, 1, 5, 5),
+           subs={'start': lambda name, doc: starts.append(doc)})
+    assert_equal(len(starts), 1)
+    shutil.rmtree(tmp_dir)
+
+
+def _step_through(positions):
+    yield Msg('open_run')
+    for pos in positions:
+        yield Msg('checkpoint')
+        yield Msg('set', motor, pos)
+        yield Msg('create')
+        yield Msg('read', motor)
+        yield Msg('save')
+    yield Msg('close_run')
+
+
+def test_recover_checks_generator_arguments():
+    tmp_dir = tempfile.mkdtemp()
+    state_path = os.path.join(tmp_dir, 'state.json')
+    crash_path = os.path.join(tmp_dir, 'crashed.json')
+    starts = []
+    _crash_during(_step_through([1, 2, 3, 4]), state_path, crash_path,
+                  {'start': lambda name, doc: starts.append(doc)})
+    new_RE = setup_test_run_engine()
+    new_RE.state_path = crash_path
+    # The same function with other arguments is a different plan.
+    assert_raises(ValueError, new_RE.recover, _step_through([1, 2, 3, 5]))
+    # A plan that cannot be told apart from others is refused.
+    assert_raises(ValueError, new_RE.recover,
+                  (msg for msg in _step_through([1, 2, 3, 4])))
+    uids = new_RE.recover(_step_through([1, 2, 3, 4]))
+    assert_equal(uids, [starts[0]['uid']])
+    shutil.rmtree(tmp_dir)
+
+
+def test_unidentifiable_plan_warns_it_cannot_be_recovered():
+    tmp_dir = tempfile.mkdtemp()
+    RE.state_path = os.path.join(tmp_dir, 'state.json')
+    try:
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            RE(_step_through(np.array([1, 2])))  # identified by value
+            assert_equal(w, [])
+            RE(_step_through(iter([1, 2])))
+        assert_true(any('cannot be recovered' in str(x.message) for x in w))
+    finally:
+        RE.state_path = None
+        shutil.rmtree(tmp_dir)
+
+
+def test_latency_profile():
+    def gen():
+        yield Msg('open_run')
+        for i in range(3):
+            yield Msg('create')
+            yield Msg('set', motor, i, block_group='A')
+            yield Msg('trigger', det, block_group='A')
+            yield Msg('wait', None, 'A')
+            yield Msg('read', motor)
+            yield Msg('read', det)
+            yield Msg('save')
+        yield Msg('close_run')
+
+    stops = []
+
+    def f(name, doc):
+        stops.append(doc)
+
+    # Off by default.
+    RE(gen(), {'stop': f})
+    assert_not_in('latency_profile', stops[-1])
+
+    RE.profile_latency = True
+    try:
+        RE(gen(), {'stop': f})
+    finally:
+        RE.profile_latency = False
+    summary = stops[-1]['latency_profile']
+    for command in ['open_run', 'set', 'trigger', 'wait', 'read', 'save']:
+        assert_in(command, summary['commands'])
+    assert_equal(summary['commands']['read']['count'], 6)
+    assert_equal(summary['objects'][str(motor)]['count'], 6)  # set, read
+    assert_in(str(det), summary['completion'])
+    assert_equal(summary['groups']['A']['count'], 3)
+    # RunStart, Descriptor, and three Events, so far
+    assert_equal(summary['emit']['validation']['count'], 5)
+    assert_equal(set(summary['emit']),
+                 {'validation', 'scan_callbacks', 'dispatch'})
+    hist = summary['commands']['wait']
+    assert_equal(sum(n for edge, n in hist['bins']), hist['count'])
+
+    profile = RE.latency_profile
+    assert_equal(profile.commands['save'].count, 3)
+    assert_equal(profile.summary()['groups'], summary['groups'])
+
+
 def test_duplicate_keys():
     # two detectors, same data keys
     det1 = SynGauss('det', motor, 'motor', center=0, Imax=1, sigma=1)
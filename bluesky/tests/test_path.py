@@ -0,0 +1,86 @@
+from nose.tools import assert_equal, assert_less, assert_raises
+import numpy as np
+from bluesky.path import (AxisModel, optimize_path, optimized_trajectory,
+                          path_time)
+from bluesky.scans import ScanND
+from bluesky.examples import det, motor1, motor2
+from bluesky.tests.utils import setup_test_run_engine
+
+RE = setup_test_run_engine()
+
+
+def test_move_time():
+    model = AxisModel(1, 1)
+    # short move never reaches full speed: 2 * sqrt(d / a)
+    assert_equal(model.move_time(0.25), 1)
+    # long move: d / v + v / a
+    assert_equal(model.move_time(4), 5)
+    assert_equal(model.move_time(0), 0)
+    model = AxisModel(1, backlash=1)
+    assert_equal(model.move_time(1), 1)
+    # overshoot by 1 and come back
+    assert_equal(model.move_time(-1), 3)
+
+
+def test_methods_reduce_travel_time():
+    points = np.random.RandomState(0).uniform(0, 10, (100, 2))
+    models = [AxisModel(1, 5), AxisModel(2, 5, backlash=0.1)]
+    original = path_time(points, models)
+    nearest = None
+    for method in ['snake', 'nearest', '2-opt']:
+        order = optimize_path(points, models, method=method)
+        assert_equal(sorted(order), list(range(len(points))))
+        t = path_time(points, models, order)
+        assert_less(t, original)
+        if method == 'nearest':
+            nearest = t
+        if method == '2-opt':
+            assert_less(t, nearest + 1e-9)
+
+
+def test_snake_grid():
+    points = [(y, x) for y in [0, 1, 2] for x in [0, 1, 2]]
+    models = [AxisModel(1), AxisModel(1)]
+    order = optimize_path(points, models, method='snake')
+    assert_equal(list(order), [0, 1, 2, 5, 4, 3, 6, 7, 8])
+
+
+def test_preserve():
+    points = np.random.RandomState(0).randint(0, 5, (50, 2))
+    models = [AxisModel(1), AxisModel(1)]
+    order = optimize_path(points, models, preserve=[0])
+    expected_rows = []
+    for row in points[:, 0]:
+        if row not in expected_rows:
+            expected_rows.append(row)
+    actual_rows = []
+    for row in points[order, 0]:
+        if not actual_rows or actual_rows[-1] != row:
+            actual_rows.append(row)
+    assert_equal(actual_rows, expected_rows)
+
+
+def test_bad_input():
+    models = [AxisModel(1), AxisModel(1)]
+    assert_raises(ValueError, optimize_path, [[1, 2, 3]], models)
+    assert_raises(ValueError, optimize_path, [[1, 2]], models, method='x')
+    assert_raises(ValueError, AxisModel, 0)
+
+
+def test_optimized_trajectory_in_scan():
+    x = np.array([3, 0, 2, 1])
+    y = np.array([0, 0, 1, 1])
+    models = {motor1: AxisModel(1), motor2: AxisModel(1)}
+    traj = optimized_trajectory({motor1: x, motor2: y}, models,
+                                start={motor1: 0, motor2: 0})
+    assert_equal(len(traj), 4)
+    assert_equal(traj[0], {motor1: 0, motor2: 0})
+    events = []
+
+    def collect(name, doc):
+        events.append(doc)
+
+    RE(ScanND([det], traj), subs={'event': collect})
+    assert_equal(len(events), 4)
+    assert_equal([ev['data']['motor1'] for ev in events],
+                 [p[motor1] for p in traj])
@@ -0,0 +1,64 @@
+from nose.tools import assert_equal, assert_greater, assert_less
+import asyncio
+import time as ttime
+
+from bluesky import Msg
+from bluesky.examples import ReplaySignal, loop
+from bluesky.suspenders import SuspenderManager, PVSuspendFloor
+from bluesky.run_engine import PanicError
+from bluesky.tests.utils import setup_test_run_engine
+
+RE = setup_test_run_engine()
+TIMEOUT = 10  # seconds
+
+
+def _run(plan):
+    # A suspender that never releases would leave the run waiting forever.
+    # Panic instead, so that the test fails rather than hangs.
+    watchdog = loop.call_later(TIMEOUT, RE.panic)
+    try:
+        RE(plan)
+    except PanicError:
+        raise AssertionError("The run did not finish within {} seconds."
+                             "".format(TIMEOUT))
+    finally:
+        watchdog.cancel()
+        RE.all_is_well()
+
+
+def _scan(num=10, delay=.05):
+    msgs = []
+    for i in range(num):
+        msgs.append(Msg('checkpoint'))
+        msgs.append(Msg('sleep', None, delay))
+    return msgs
+
+
+def test_replayed_beam_dump():
+    # A 15-second beam dump, replayed 50 times faster.
+    beam = ReplaySignal('beam', [0, 5, 20], [400, 0, 400], speedup=50)
+    manager = SuspenderManager(RE)
+    PVSuspendFloor(RE, beam, 100, manager=manager)
+    beam.start()
+    start = ttime.time()
+    _run(_scan())
+    stop = ttime.time()
+    assert_equal(manager.suspensions, 1)
+    assert_greater(manager.time_lost, .25)
+    assert_less(manager.time_lost, .5)
+    assert_greater(stop - start, .5 + .25)
+
+
+def test_replayed_chatter_is_debounced():
+    # The beam dips below threshold briefly, many times, and recovers.
+    times = [i * .5 for i in range(41)]
+    values = [90 if i % 2 else 400 for i in range(41)]
+    beam = ReplaySignal('beam', times, values, speedup=100)
+    manager = SuspenderManager(RE)
+    sus = PVSuspendFloor(RE, beam, 100, manager=manager, debounce=.05)
+    beam.start()
+    _run(_scan(delay=.03))
+    loop.run_until_complete(asyncio.sleep(beam.duration))
+    assert_equal(manager.suspensions, 0)
+    assert_equal(sus.trips, 0)
+
@@ -1,17 +1,23 @@
 import warnings
 from nose.tools import (assert_equal, assert_greater, assert_in, assert_true,
-                        assert_less, assert_is)
+                        assert_less, assert_is, assert_raises)
 
 from bluesky.callbacks import collector, CallbackCounter
 from bluesky.scans import (AbsListScan, AbsScan, LogAbsScan,
                            DeltaListScan, DeltaScan, LogDeltaScan,
                            AdaptiveAbsScan, AdaptiveDeltaScan, Count, Center,
                            OuterProductAbsScan, InnerProductAbsScan,
-                           OuterProductDeltaScan, InnerProductDeltaScan)
+                           OuterProductDeltaScan, InnerProductDeltaScan,
+                           FlyScan, Fly1DScan, FlyRasterScan,
+                           BufferedCount, EveryPoint, EveryNPoints,
+                           EverySeconds, EveryRow)
 
 from bluesky.standard_config import ascan, dscan, ct
 from bluesky import Msg
-from bluesky.examples import motor, det, SynGauss, motor1, motor2
+from bluesky.run_engine import DocumentNames
+from bluesky.examples import (motor, det, SynGauss, motor1, motor2, det1,
+                               det2, MockFlyer, ReadoutSynGauss,
+                               BufferedDetector, Mover, _Status)
 from bluesky.tests.utils import setup_test_run_engine
 import asyncio
 import time as ttime
@@ -130,6 +136,156 @@ def test_inner_product_dscan():
     yield multi_traj_checker, scan, expected_data
 
 
+def test_inner_product_moves_concurrently():
+    scan = InnerProductAbsScan([det], 3, motor1, 1, 3, motor2, 10, 30)
+    msgs = list(scan)
+    checkpoints = [i for i, msg in enumerate(msgs)
+                   if msg.command == 'checkpoint'] + [len(msgs)]
+    assert_equal(len(checkpoints), 4)
+    for start, stop in zip(checkpoints[:-1], checkpoints[1:]):
+        commands = [msg.command for msg in msgs[start:stop]]
+        # Both motors are set before a single wait, then one event.
+        assert_equal(commands[:5],
+                     ['checkpoint', 'set', 'set', 'wait', 'create'])
+        assert_equal(commands.count('create'), 1)
+
+
+def test_outer_product_create_once_per_point():
+    scan = OuterProductAbsScan([det], motor1, 1, 3, 3, motor2, 10, 20, 2,
+                               False)
+    msgs = list(scan)
+    commands = [msg.command for msg in msgs]
+    assert_equal(commands.count('create'), 6)
+    assert_equal(commands.count('save'), 6)
+
+
+def _checkpointed_points(scan):
+    # indices of the points preceded by a checkpoint
+    points = []
+    num_points = 0
+    for msg in scan:
+        if msg.command == 'checkpoint':
+            points.append(num_points)
+        elif msg.command == 'create':
+            num_points += 1
+    return points
+
+
+def test_checkpoint_every_point():
+    scan = AbsScan([det], motor, 1, 5, 5)
+    assert_equal(_checkpointed_points(scan), [0, 1, 2, 3, 4])
+
+
+def test_checkpoint_every_n_points():
+    scan = Count([det], num=10)
+    scan.set(checkpoint_policy=EveryNPoints(3))
+    assert_equal(_checkpointed_points(scan), [0, 3, 6, 9])
+    # The count starts over each time the scan is run.
+    assert_equal(_checkpointed_points(scan), [0, 3, 6, 9])
+
+
+def test_checkpoint_every_seconds():
+    scan = AbsScan([det], motor, 1, 5, 5)
+    scan.set(checkpoint_policy=EverySeconds(3600))
+    assert_equal(_checkpointed_points(scan), [0])
+    scan.set(checkpoint_policy=EverySeconds(0))
+    assert_equal(_checkpointed_points(scan), [0, 1, 2, 3, 4])
+
+
+def test_checkpoint_every_row():
+    scan = OuterProductAbsScan([det], motor1, 1, 3, 3, motor2, 10, 40, 4,
+                               True)
+    scan.set(checkpoint_policy=EveryRow())
+    assert_equal(_checkpointed_points(scan), [0, 4, 8])
+    # Without rows, there is only the first checkpoint.
+    scan = InnerProductAbsScan([det], 3, motor1, 1, 3, motor2, 10, 30)
+    scan.set(checkpoint_policy=EveryRow())
+    assert_equal(_checkpointed_points(scan), [0])
+
+
+def test_resume_with_sparse_checkpoints():
+    # Resuming rewinds to the last checkpoint, retaking the points since.
+    events = []
+    scan = AbsScan([det], motor, 1, 6, 6)
+    scan.set(checkpoint_policy=EveryNPoints(3))
+
+    def pause_once(name, doc):
+        events.append(doc['data']['motor'])
+        if len(events) == 5:
+            RE.request_pause()
+
+    # A scan callback runs synchronously, so the pause is requested
+    # right after the fifth point.
+    cid = RE._register_scan_callback(DocumentNames.event, pause_once)
+    try:
+        RE(scan)
+        assert_equal(RE.state, 'paused')
+        RE.resume()
+    finally:
+        RE._scan_cb_registry.disconnect(cid)
+    assert_equal(RE.state, 'idle')
+    assert_equal(events, [1, 2, 3, 4, 5, 4, 5, 6])
+
+
+def _run_and_collect(scan):
+    starts = []
+    data = []
+    RE(scan, subs={'start': lambda name, doc: starts.append(doc),
+                   'event': lambda name, doc: data.append(doc['data'])})
+    return starts[0], data
+
+
+def test_restart_count():
+    scan = Count([det], num=5)
+    start, data = _run_and_collect(scan)
+    restart, rest = _run_and_collect(scan.restarted(start, 3))
+    assert_equal(len(rest), 2)
+    assert_equal(restart['restart_of'], start['uid'])
+    assert_equal(restart['restart_index'], 3)
+    # The original scan is unchanged.
+    assert_equal(len(list(m for m in scan if m.command == 'save')), 5)
+
+
+def test_restart_outer_product_dscan():
+    motor1.set(1)
+    motor2.set(10)
+    scan = OuterProductDeltaScan([det], motor1, 0, 2, 3, motor2, 0, 1, 2,
+                                 True)
+    start, data = _run_and_collect(scan)
+    assert_equal(start['initial_positions'], {'motor1': 1, 'motor2': 10})
+    # Restart from point 4 with the motors somewhere else: the offsets are
+    # those of the original run.
+    motor1.set(-5)
+    motor2.set(-5)
+    restart, rest = _run_and_collect(scan.restarted(start, 4))
+    assert_equal(rest, data[4:])
+    assert_equal(restart['initial_positions'], start['initial_positions'])
+    # The motors are returned to the original initial positions.
+    assert_equal(motor1.read()['motor1']['value'], 1)
+    assert_equal(motor2.read()['motor2']['value'], 10)
+
+    # A restart of a restart counts from the original run.
+    again, last = _run_and_collect(scan.restarted(restart, 1))
+    assert_equal(again['restart_index'], 5)
+    assert_equal(last, data[5:])
+
+
+def test_restart_dscan():
+    motor.set(3)
+    scan = DeltaScan([det], motor, -1, 1, 5)
+    start, data = _run_and_collect(scan)
+    assert_equal(start['initial_positions'], {'motor': 3})
+    motor.set(0)
+    restart, rest = _run_and_collect(scan.restarted(start, 2))
+    assert_equal(rest, data[2:])
+    assert_equal(restart['initial_positions'], {'motor': 3})
+
+
+def test_restart_not_supported_by_adaptive_scans():
+    scan = AdaptiveAbsScan([det], 'det', motor, -1, 1, 0.1, 1, 0.1, True)
+    assert_raises(NotImplementedError, scan.restarted, {'uid': 'abc'}, 3)
+
+
 def test_ascan():
     traj = [1, 2, 3]
     scan = AbsListScan([det], motor, traj)
@@ -240,6 +396,42 @@ def test_center():
     assert_less(abs(d['center']), 0.1)
 
 
+def test_center_overlap():
+    assert_true(not RE._run_is_open)
+    det = SynGauss('det', motor, 'motor', 0, 1000, 1, 'poisson', True)
+    d = {}
+    cen = Center([det], 'det', motor, 0.1, 1.1, 0.01, d, overlap=True)
+    RE(cen)
+    assert_less(abs(d['center']), 0.1)
+
+
+def test_center_fit_data_is_bounded():
+    cen = Center([det], 'det', motor, 0, 1)
+    n = Center.NUM_SAMPLES + 10 * Center.FIT_WINDOW
+    x, y = cen._fit_data(list(range(n)), list(range(n)))
+    assert_equal(len(x), Center.NUM_SAMPLES + Center.FIT_WINDOW)
+    # the initial samples, then the latest points
+    assert_equal(list(x[:Center.NUM_SAMPLES]), list(range(Center.NUM_SAMPLES)))
+    assert_equal(x[-1], n - 1)
+
+
+def test_center_next_position_without_covariance():
+    # If the fit has no covariance, the next point is still within limits.
+    class Param:
+        def __init__(self, value):
+            self.value = value
+
+    class Result:
+        params = {'center': Param(5.9), 'sigma': Param(1)}
+        var_names = ['center', 'sigma']
+        covar = None
+
+    cen = Center([det], 'det', motor, 0, 1)
+    for _ in range(20):
+        x = cen._next_position(Result(), cen.min_cen, cen.max_cen)
+        assert_true(cen.min_cen <= x <= cen.max_cen)
+
+
 def test_set():
     scan = AbsScan([det], motor, 1, 5, 3)
     assert_equal(scan.start, 1)
@@ -263,3 +455,185 @@ def test_wait_for():
     RE(scan)
     stop = ttime.time()
     assert stop - start >= 2
+
+
+def _collect_events(scan):
+    events = []
+
+    def collect(name, doc):
+        events.append(doc)
+
+    RE(scan, subs={'event': collect})
+    return events
+
+
+def test_fly_1d():
+    flyer = MockFlyer(det, motor)
+    events = _collect_events(Fly1DScan([flyer], -1, 1, 5, 0.01))
+    assert_equal(len(events), 5)
+    assert_equal([ev['data']['motor'] for ev in events],
+                 list(np.linspace(-1, 1, 5)))
+    assert_equal([ev['seq_num'] for ev in events], [1, 2, 3, 4, 5])
+
+
+def test_fly_raster_snaked():
+    flyer = MockFlyer(det, motor)
+    scan = FlyRasterScan([flyer], motor2, 0, 1, 2, -1, 1, 3, snake=True)
+    events = _collect_events(scan)
+    assert_equal([ev['data']['motor'] for ev in events],
+                 [-1, 0, 1, 1, 0, -1])
+
+
+def test_fly_scan_checkpoint_policy():
+    flyer = MockFlyer(det, motor)
+    scan = FlyRasterScan([flyer], motor2, 0, 1, 4, -1, 1, 3)
+    commands = [msg.command for msg in scan]
+    assert_equal(commands.count('checkpoint'), 4)
+    scan.set(checkpoint_policy=EveryNPoints(2))
+    commands = [msg.command for msg in scan]
+    assert_equal(commands.count('checkpoint'), 2)
+
+
+def test_multi_flyer_merged_in_time_order():
+    flyers = [MockFlyer(det1, motor1), MockFlyer(det2, motor2)]
+    events = _collect_events(FlyScan(flyers, [(-1, 1, 3), (1, 2, 2)]))
+    assert_equal(len(events), 10)
+    times = [ev['time'] for ev in events]
+    assert_equal(times, sorted(times))
+    descriptors = set(ev['descriptor'] for ev in events)
+    assert_equal(len(descriptors), 2)
+
+
+class _FailOnceFlyer(MockFlyer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attempts = 0
+        self.success = True
+
+    def kickoff(self, *args):
+        self.attempts += 1
+        self.success = self.attempts > 1
+        return super().kickoff(*args)
+
+
+def test_fly_segment_failure_pauses_and_repeats():
+    flyer = _FailOnceFlyer(det, motor)
+    events = []
+
+    def collect(name, doc):
+        events.append(doc)
+
+    RE(FlyScan([flyer], [(-1, 1, 3)]), subs={'event': collect})
+    assert_equal(RE.state, 'paused')
+    RE.resume()
+    assert_equal(RE.state, 'idle')
+    assert_equal(flyer.attempts, 2)
+    # The data from the failed attempt is kept; the segment is repeated,
+    # from its start, in a new Event stream.
+    assert_equal(len(events), 6)
+    assert_equal([ev['data']['motor'] for ev in events], 2 * [-1, 0, 1])
+    assert_equal([ev['seq_num'] for ev in events], 2 * [1, 2, 3])
+    assert_equal(len(set(ev['descriptor'] for ev in events)), 2)
+
+
+def test_pipelined_scan_moves_during_readout():
+    scan = AbsScan([det], motor, 1, 3, 3)
+    scan.set(pipelined=True)
+    commands = [(msg.command, msg.args) for msg in scan]
+    # The move to the second point starts before waiting on the readout
+    # of the first.
+    next_move = commands.index(('set', (2.0,)))
+    readout_wait = commands.index(('wait', ('B',)))
+    assert_less(next_move, readout_wait)
+    assert_equal([c for c, _ in commands].count('create'), 3)
+
+
+def test_pipelined_scan_data():
+    readout_det = ReadoutSynGauss('det', motor, 'motor', center=0, Imax=1,
+                                  readout_time=0.05)
+    scan = AbsScan([readout_det], motor, -1, 1, 5)
+    scan.set(pipelined=True)
+    events = _collect_events(scan)
+    assert_equal(len(events), 5)
+    for ev in events:
+        # Each reading was exposed at the position recorded with it.
+        expected = np.exp(-ev['data']['motor']**2 / 2)
+        assert_less(abs(ev['data']['det'] - expected), 1e-9)
+
+
+class _SlowMover(Mover):
+    "A motor that takes move_time to arrive and records overlapping sets."
+    def __init__(self, *args, move_time, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.move_time = move_time
+        self.retargeted = 0
+        self._moving = False
+
+    def set(self, val, *, trigger=True, block_group=None):
+        if self._moving:
+            self.retargeted += 1
+        self._moving = True
+        status = _Status()
+
+        def arrive():
+            self._moving = False
+            super(_SlowMover, self).set(val)
+            status._finish()
+
+        loop.call_later(self.move_time, arrive)
+        return status
+
+
+def test_pipelined_scan_never_retargets_a_move():
+    slow_motor = _SlowMover('slow_motor', ['slow_motor'], move_time=0.05)
+    readout_det = ReadoutSynGauss('det', slow_motor, 'slow_motor', center=0,
+                                  Imax=1, readout_time=0.01)
+    scan = AbsScan([readout_det], slow_motor, -1, 1, 5)
+    scan.set(pipelined=True)
+    events = _collect_events(scan)
+    assert_equal(slow_motor.retargeted, 0)
+    assert_equal([ev['data']['slow_motor'] for ev in events],
+                 [-1, -0.5, 0, 0.5, 1])
+
+
+def test_buffered_count():
+    buffered_det = BufferedDetector('bdet')
+    scan = BufferedCount([buffered_det], 25, batch_size=10,
+                         checkpoint_every=2, collect_period=0.005)
+    assert_equal(scan.segments, [(10,), (10,), (5,)])
+    commands = [msg.command for msg in scan]
+    assert_equal(commands.count('checkpoint'), 2)
+    assert_equal(commands.count('kickoff'), 3)
+    # checkpoint_every is shorthand for a checkpoint_policy.
+    assert_equal(repr(scan.checkpoint_policy), 'EveryNPoints(2)')
+    scan.set(checkpoint_policy=EveryPoint())
+    assert_is(scan.checkpoint_every, None)
+    assert_equal([msg.command for msg in scan].count('checkpoint'), 3)
+    scan.set(checkpoint_every=2)
+    events = _collect_events(scan)
+    assert_equal(len(events), 25)
+    assert_equal([ev['seq_num'] for ev in events], list(range(1, 26)))
+
+
+def test_buffered_count_validates_arguments():
+    buffered_det = BufferedDetector('bdet')
+    assert_raises(ValueError, BufferedCount, [buffered_det], 25,
+                  batch_size=0)
+    assert_raises(ValueError, BufferedCount, [buffered_det], 25,
+                  checkpoint_every=0)
+    scan = BufferedCount([buffered_det], 25)
+    assert_raises(ValueError, scan.set, batch_size=0)
+
+
+def test_scan_with_monitor():
+    motor1.set(0)
+    scan = AbsScan([det], motor, 1, 3, 3)
+    scan.set(monitors=[motor1])
+    commands = [msg.command for msg in scan]
+    assert_equal(commands[1], 'monitor')
+    assert_equal(commands[-2], 'unmonitor')
+    events = _collect_events(scan)
+    streams = {}
+    for ev in events:
+        streams.setdefault(ev['descriptor'], []).append(ev)
+    assert_equal(sorted(len(evs) for evs in streams.values()), [1, 3])
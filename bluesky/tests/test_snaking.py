@@ -1,5 +1,5 @@
 from nose.tools import assert_equal
-from bluesky.utils import snake_cyclers
+from bluesky.utils import snake_cyclers, Trajectory
 from cycler import cycler
 
 
@@ -75,3 +75,33 @@ def test_snake_some_snaking():
         {'x': 2, 'y': 2, 'z': 3},
         {'x': 3, 'y': 2, 'z': 3}]
     assert_equal(actual, expected)
+
+
+def test_trajectory_matches_snake_cyclers():
+    for snake in [[False, False, False], [False, True, True],
+                  [False, True, False]]:
+        traj = Trajectory([{'z': [1, 2, 3]}, {'y': [1, 2]}, {'x': [1, 2, 3]}],
+                          snake)
+        expected = list(snake_cyclers([z, y, x], snake))
+        assert_equal(len(traj), len(expected))
+        assert_equal(list(traj), expected)
+        assert_equal(traj.keys, {'x', 'y', 'z'})
+
+
+def test_trajectory_indexing():
+    traj = Trajectory([{'z': [1, 2, 3]}, {'y': [1, 2]}, {'x': [1, 2, 3]}],
+                      [False, True, True])
+    expected = list(snake_cyclers([z, y, x], [False, True, True]))
+    assert_equal(traj[7], expected[7])
+    assert_equal(traj[-1], expected[-1])
+    # Resume from an index.
+    assert_equal(list(traj[10:]), expected[10:])
+    assert_equal(len(traj[10:]), len(expected[10:]))
+    # Slices of slices
+    assert_equal(list(traj[2:][3:15:2]), expected[2:][3:15:2])
+
+
+def test_trajectory_inner_product():
+    traj = Trajectory([{'x': [1, 2, 3], 'y': [4, 5, 6]}])
+    expected = [{'x': 1, 'y': 4}, {'x': 2, 'y': 5}, {'x': 3, 'y': 6}]
+    assert_equal(list(traj), expected)
@@ -6,7 +6,8 @@ import epics
 import time as ttime
 
 from bluesky import Msg
-from bluesky.suspenders import (PVSuspendBoolHigh,
+from bluesky.suspenders import (SuspenderManager,
+                                PVSuspendBoolHigh,
                                 PVSuspendBoolLow,
                                 PVSuspendFloor,
                                 PVSuspendCeil,
@@ -40,7 +41,7 @@ def _test_suspender(suspender_class, sc_args, start_val, fail_val,
         # OSX event loop is different; resolve this later
         raise KnownFailureTest()
     my_suspender = suspender_class(RE, 'BSTEST:VAL', *sc_args, sleep=wait_time)
-    print(my_suspender._lock)
+    print(my_suspender._manager)
     pv = epics.PV('BSTEST:VAL')
     putter = partial(pv.put, wait=True)
     # make sure we start at good value!
@@ -71,3 +72,167 @@ def test_suspending():
     yield _test_suspender, PVSuspendCeil, (.5,), 0, 1, 0, .5
     yield _test_suspender, PVSuspendInBand, (.5, 1.5), 1, 0, 1, .5
     yield _test_suspender, PVSuspendOutBand, (.5, 1.5), 0, 1, 0, .5
+
+
+class _FakeSuspender:
+    "Trips when the value is True; sleeps before resuming."
+    def __init__(self, sleep=0, debounce=0, min_dwell=0):
+        self._sleep = sleep
+        self._debounce = debounce
+        self._min_dwell = min_dwell
+
+    def _should_suspend(self, value):
+        return value
+
+    def _should_resume(self, value):
+        return not value
+
+
+class _SuspendCounter:
+    def __init__(self):
+        self.requests = []
+
+    def request_suspend(self, fut, callback=None):
+        self.requests.append(fut)
+
+
+def _spin(duration=0.05):
+    loop.run_until_complete(asyncio.sleep(duration))
+
+
+def test_manager_single_suspend_and_resume():
+    counter = _SuspendCounter()
+    manager = SuspenderManager(counter)
+    suspenders = [_FakeSuspender(), _FakeSuspender(sleep=.1),
+                  _FakeSuspender()]
+    for sus in suspenders:
+        manager.update(sus, True)
+    _spin()
+    assert_equal(len(counter.requests), 1)
+    assert_equal(len(manager.tripped), 3)
+    manager.update(suspenders[0], False)
+    manager.update(suspenders[1], False)
+    _spin()
+    assert not counter.requests[0].done()
+    # A suspender that trips again keeps the RunEngine suspended.
+    manager.update(suspenders[0], True)
+    manager.update(suspenders[2], False)
+    _spin()
+    assert not counter.requests[0].done()
+    assert_equal(len(counter.requests), 1)
+    manager.update(suspenders[0], False)
+    # The longest sleep of the suspenders in this suspension applies.
+    _spin(.05)
+    assert not counter.requests[0].done()
+    _spin(.1)
+    assert counter.requests[0].done()
+    assert not manager.suspended
+    # A new trip is a new suspension.
+    manager.update(suspenders[2], True)
+    _spin()
+    assert_equal(len(counter.requests), 2)
+
+
+def test_manager_suspends_scan():
+    manager = SuspenderManager(RE)
+    sus1, sus2 = _FakeSuspender(), _FakeSuspender()
+    scan = [Msg('checkpoint'), Msg('sleep', None, .2)]
+    loop.call_later(.1, manager.update, sus1, True)
+    loop.call_later(.15, manager.update, sus2, True)
+    loop.call_later(.5, manager.update, sus1, False)
+    loop.call_later(.7, manager.update, sus2, False)
+    start = ttime.time()
+    RE(scan)
+    stop = ttime.time()
+    assert_greater(stop - start, .7 + .2)
+
+
+def test_manager_debounce():
+    counter = _SuspendCounter()
+    manager = SuspenderManager(counter)
+    sus = _FakeSuspender(debounce=.1)
+    # chatter shorter than the debounce time never trips
+    for i in range(5):
+        manager.update(sus, True)
+        _spin(.02)
+        manager.update(sus, False)
+        _spin(.02)
+    assert_equal(len(counter.requests), 0)
+    manager.update(sus, True)
+    _spin(.15)
+    assert_equal(len(counter.requests), 1)
+    assert_equal(sus in manager.tripped, True)
+
+
+def test_manager_min_dwell_and_counters():
+    counter = _SuspendCounter()
+    manager = SuspenderManager(counter)
+    sus = _FakeSuspender(min_dwell=.2)
+    manager.update(sus, True)
+    _spin()
+    manager.update(sus, False)
+    _spin()
+    # still within the minimum dwell time
+    assert not counter.requests[0].done()
+    _spin(.2)
+    assert counter.requests[0].done()
+    assert_equal(manager.suspensions, 1)
+    assert_equal(manager.trips[sus], 1)
+    assert_greater(manager.time_lost, .2)
+    assert_greater(manager.time_tripped(sus), .2)
+
+
+def test_manager_suspension_ends_with_run():
+    manager = SuspenderManager(RE)
+    sus = _FakeSuspender()
+    scan = [Msg('checkpoint'), Msg('sleep', None, .2)]
+    # The run is aborted while suspended.
+    loop.call_later(.05, manager.update, sus, True)
+    loop.call_later(.15, RE.abort)
+    RE(scan)
+    assert_equal(RE.state, 'idle')
+    assert not manager.suspended
+    assert_equal(manager.tripped, [sus])
+    # The suspender is still tripped, so its next update suspends the next
+    # run.
+    loop.call_later(.05, manager.update, sus, True)
+    loop.call_later(.3, manager.update, sus, False)
+    start = ttime.time()
+    RE(scan)
+    stop = ttime.time()
+    assert_equal(manager.suspensions, 2)
+    assert_greater(stop - start, .3 + .2)
+
+
+class _FakeSignal:
+    def __init__(self):
+        self.callbacks = []
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def clear_sub(self, callback):
+        self.callbacks.remove(callback)
+
+
+def test_manager_remove_unsubscribes():
+    manager = SuspenderManager(_SuspendCounter())
+    signal = _FakeSignal()
+    sus = PVSuspendBoolHigh(RE, signal, manager=manager)
+    assert_equal(signal.callbacks, [sus])
+    manager.remove(sus)
+    assert_equal(signal.callbacks, [])
+
+
+def test_band_hysteresis():
+    sus = PVSuspendInBand(RE, 'BSTEST:VAL', 0, 10, hysteresis=1)
+    sus._pv.disconnect()
+    assert sus._should_suspend(-.5)
+    assert not sus._should_suspend(.5)
+    assert not sus._should_resume(.5)
+    assert sus._should_resume(1.5)
+    sus = PVSuspendOutBand(RE, 'BSTEST:VAL', 0, 10, hysteresis=1)
+    sus._pv.disconnect()
+    assert sus._should_suspend(.5)
+    assert not sus._should_resume(-.5)
+    assert sus._should_resume(-1.5)
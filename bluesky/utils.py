@@ -40,6 +40,52 @@ class SignalHandler:
         return True
 
 
+class LoopSignalHandler:
+    """
+    Call a function on an event loop each time a signal arrives.
+
+    Where possible this uses ``loop.add_signal_handler``, which wakes the loop
+    as soon as the signal is received. Otherwise (e.g., on Windows) it falls
+    back to an ordinary signal handler that schedules the function with
+    ``loop.call_soon_threadsafe``, which also wakes the loop.
+
+    Parameters
+    ----------
+    sig : int
+        signal number, e.g. ``signal.SIGINT``
+    callback : callable
+        called with no arguments, on the loop
+    loop : asyncio.AbstractEventLoop
+    """
+    def __init__(self, sig, callback, loop):
+        self.sig = sig
+        self.callback = callback
+        self.loop = loop
+
+    def __enter__(self):
+        self.original_handler = signal.getsignal(self.sig)
+        try:
+            self.loop.add_signal_handler(self.sig, self.callback)
+        except (NotImplementedError, RuntimeError, ValueError):
+            self._on_loop = False
+
+            def handler(signum, frame):
+                self.loop.call_soon_threadsafe(self.callback)
+
+            signal.signal(self.sig, handler)
+        else:
+            self._on_loop = True
+        return self
+
+    def __exit__(self, type, value, tb):
+        if self._on_loop:
+            self.loop.remove_signal_handler(self.sig)
+        # remove_signal_handler installs the default handler, which may not
+        # be the one we found (e.g., IPython's).
+        if self.original_handler is not None:
+            signal.signal(self.sig, self.original_handler)
+
+
 class CallbackRegistry:
     """
     See matplotlib.cbook.CallbackRegistry. This is a simplified since
@@ -363,3 +409,118 @@ def snake_cyclers(cyclers, snake_booleans):
             expanded = v2[:total_length]
             new_cyclers.append(cycler(k, expanded))
     return reduce(operator.add, new_cyclers)
+
+
+class Trajectory:
+    """
+    An index-addressable sequence of positions on an N-dimensional grid
+
+    Positions are computed on demand from one array per axis, so the full
+    list of points is never built.
+
+    Parameters
+    ----------
+    dimensions : list
+        a list of dictionaries, from slowest to fastest, each mapping keys
+        (e.g., motors) to 1D arrays of equal length. Keys in the same
+        dictionary move together; dimensions are combined as an outer
+        product.
+    snake_booleans : list, optional
+        a list of the same length as dimensions indicating whether each
+        dimension should 'snake' (True) or not (False). Note that the first
+        boolean does not make a difference because the first (slowest)
+        dimension does not repeat. By default, nothing snakes.
+
+    Examples
+    --------
+    >>> traj = Trajectory([{'y': [1, 2]}, {'x': [1, 2, 3]}], [False, True])
+    >>> len(traj)
+    6
+    >>> traj[3]
+    {'y': 2, 'x': 3}
+    >>> list(traj[4:])
+    [{'y': 2, 'x': 2}, {'y': 2, 'x': 1}]
+    """
+    def __init__(self, dimensions, snake_booleans=None):
+        if snake_booleans is None:
+            snake_booleans = [False] * len(dimensions)
+        if len(dimensions) != len(snake_booleans):
+            raise ValueError("number of dimensions does not match number of "
+                             "booleans")
+        self._dimensions = []
+        self._shape = []
+        for dim in dimensions:
+            dim = OrderedDict((k, np.asarray(v)) for k, v in dim.items())
+            lengths = set(len(v) for v in dim.values())
+            if len(lengths) != 1:
+                raise ValueError("all arrays in a dimension must have the "
+                                 "same length")
+            self._dimensions.append(dim)
+            self._shape.append(lengths.pop())
+        self._snake = [bool(s) for s in snake_booleans]
+        # number of points spanned by one step along each dimension
+        self._strides = [int(np.prod(self._shape[i+1:], dtype=int))
+                         for i in range(len(self._shape))]
+        self._indices = range(int(np.prod(self._shape, dtype=int)))
+
+    @property
+    def keys(self):
+        "set of keys, matching the interface of cycler.Cycler"
+        return set(k for dim in self._dimensions for k in dim)
+
+    @property
+    def shape(self):
+        return tuple(self._shape)
+
+    @property
+    def indices(self):
+        "positions of these points in the full grid, which may be sliced"
+        return self._indices
+
+    def to_dict(self, name=str):
+        """
+        Describe the trajectory as plain data, e.g., to compare it with one
+        made in another session.
+
+        Parameters
+        ----------
+        name : callable, optional
+            gives a string for each key (e.g., motor); ``str`` by default
+
+        Returns
+        -------
+        description : dict
+            with the positions along each dimension, as lists, the snake
+            booleans, and the range of indices (if the trajectory is sliced)
+        """
+        dimensions = [{name(k): v.tolist() for k, v in dim.items()}
+                      for dim in self._dimensions]
+        indices = self._indices
+        return dict(dimensions=dimensions, snake_booleans=list(self._snake),
+                    indices=[indices.start, indices.stop, indices.step])
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            sliced = Trajectory.__new__(Trajectory)
+            sliced.__dict__.update(self.__dict__)
+            sliced._indices = self._indices[i]
+            return sliced
+        return self._position(self._indices[i])
+
+    def __iter__(self):
+        for index in self._indices:
+            yield self._position(index)
+
+    def _position(self, index):
+        result = {}
+        for dim, num, stride, snake in zip(self._dimensions, self._shape,
+                                           self._strides, self._snake):
+            passes, j = divmod(index // stride, num)
+            if snake and passes % 2:
+                j = num - 1 - j
+            for k, v in dim.items():
+                result[k] = v[j]
+        return result